@@ -0,0 +1,135 @@
+
+import os
+import gzip
+import json
+import time
+import threading
+
+import metrics
+
+# append-only archive of fetched pages
+#
+# 	<name>: concatenated gzip members, one per page, each of them is a small header and the page
+# 			URL: <page url>
+# 			Fighter-URL: <profile url of the fighter>
+# 			Fighter-Id: <id>
+# 			Page: history | stats
+# 			Fetched: <unix time>
+#
+# 			<page>
+# 	<name>.idx: one json line per page with the same fields and offset, length of its gzip member
+#
+# NOTE: a page is written before its index line, so the index never points to a partially written page
+
+class PageArchive:
+	""" appends fetched pages into an archive and reads them back
+	"""
+
+	def __init__(self, file_name = 'pages.archive'):
+		""" constructor
+		:param file_name: archive file name, relative to the script directory unless absolute
+		:return:
+		"""
+
+		self.file_ = os.path.join(os.path.dirname(os.path.realpath(__file__)), file_name)
+
+		self.index_file_ = self.file_ + '.idx'
+
+		self.lock = threading.Lock()
+
+		self.outfile = None
+
+		self.index_outfile = None
+
+	def append(self, url, text, fighter_url, fighter_id, page):
+		""" append a fetched page, safe to call from several threads
+		:param url: url of the page
+		:param text: content of the page
+		:param fighter_url: profile url of the fighter
+		:param fighter_id: id of the fighter
+		:param page: name of the page, 'history' or 'stats'
+		:return:
+		"""
+
+		entry = {'url': url, 'fighter_url': fighter_url, 'fighter_id': fighter_id, 'page': page, 'fetched': time.time()}
+
+		header = f'URL: {url}\nFighter-URL: {fighter_url}\nFighter-Id: {fighter_id}\nPage: {page}\nFetched: {entry["fetched"]}\n\n'
+
+		data = gzip.compress((header + text).encode('utf-8'))
+
+		with self.lock:
+			if self.outfile is None:
+				self.outfile = open(self.file_, 'ab')
+				self.index_outfile = open(self.index_file_, 'a')
+
+			entry['offset'] = self.outfile.seek(0, os.SEEK_END)
+			entry['length'] = len(data)
+
+			self.outfile.write(data)
+			self.outfile.flush()
+
+			self.index_outfile.write(json.dumps(entry) + '\n')
+			self.index_outfile.flush()
+
+		metrics.inc('archive_pages_total', page=page)
+		metrics.inc('archive_bytes_total', len(data))
+
+	def close(self):
+		with self.lock:
+			if self.outfile is not None:
+				self.outfile.close()
+				self.index_outfile.close()
+				self.outfile = None
+				self.index_outfile = None
+
+	def index(self) -> list:
+		""" returns all entries of the index in order of fetching
+		:return: list of dictionaries of url, fighter_url, fighter_id, page, fetched, offset, length and file
+		"""
+
+		entries = []
+
+		if not os.path.isfile(self.index_file_):
+			return entries
+
+		with open(self.index_file_) as infile:
+			for line in infile:
+				try:
+					entry = json.loads(line)
+				except ValueError:
+					# last line of an interrupted run
+					continue
+
+				entry['file'] = self.file_
+				entries.append(entry)
+
+		return entries
+
+	def latest(self) -> dict:
+		""" returns the latest entry of every page
+		:return: dictionary of (fighter_url, page) and index entry
+		"""
+
+		entries = {}
+
+		for entry in self.index():
+			key = (entry['fighter_url'], entry['page'])
+			if key not in entries or entries[key]['fetched'] <= entry['fetched']:
+				entries[key] = entry
+
+		return entries
+
+	@staticmethod
+	def read(file_name, offset, length) -> str:
+		""" returns content of a page
+		:param file_name: absolute path to archive file
+		:param offset: offset of the gzip member of the page
+		:param length: length of the gzip member of the page
+		:return: content of the page without header
+		"""
+
+		with open(file_name, 'rb') as infile:
+			infile.seek(offset)
+			data = gzip.decompress(infile.read(length)).decode('utf-8')
+
+		return data.split('\n\n', 1)[1]
@@ -0,0 +1,192 @@
+
+import os
+import sys
+import time
+import random
+import shutil
+import sqlite3
+import tempfile
+import multiprocessing
+
+import database
+
+# benchmark of sqlite pragma profiles(see database.DB_PROFILES) on a synthetic dataset
+#
+# 	python bench.py [fighters] [fights]
+#
+# ingest: rows/second of inserting all fighters, histories and statistics in one transaction
+# export: seconds spent on getting rows for schema and writing match_history.db
+# crash safe: committed rows and integrity survive a process which dies in the middle of a transaction
+
+def make_dataset(fighters = 2000, fights = 15000, seed = 1) -> list:
+	""" returns synthetic scraped data in the form UFCHistoryDB.insert_fetched takes
+	:param fighters: number of fighters
+	:param fights: number of fights, each of them goes into histories and statistics of both fighters
+	:param seed: random seed
+	:return: list of tuples of id, general info, history, standing, clinch and ground statistics
+	"""
+
+	rand = random.Random(seed)
+
+	def value():
+		return str(rand.randint(0, 30))
+
+	info_list = []
+
+	for id_ in range(1, fighters + 1):
+		ginfo = {'name': f'Fighter {id_}', 'age': rand.randint(20, 40), 'url': f'http://www.espn.com/mma/fighter/_/id/{id_}/fighter-{id_}',
+				'height': '6\' 0"', 'weight': '170 lbs', 'weight_class': rand.choice(['Lightweight', 'Welterweight', 'Middleweight']),
+				'reach': '72"', 'group_name': 'Team'}
+		info_list.append((id_, ginfo, [], [], [], []))
+
+	for index in range(fights):
+		f1, f2 = rand.sample(info_list, 2)
+
+		date = f'{rand.randint(1995, 2020)}-{rand.randint(1, 12):02d}-{rand.randint(1, 28):02d}'
+		event = rand.choice(['UFC 1', 'UFC 2', 'UFC Fight Night'])
+		decision = rand.choice(['KO', 'Submission', 'Decision'])
+		time_ = f'{rand.randint(0, 4)}:{rand.randint(10, 59)}'
+
+		for fighter, opponent, result in ((f1, f2, 'Win'), (f2, f1, 'Loss')):
+			name, url = opponent[1]['name'], opponent[1]['url']
+
+			fighter[2].append({'DATE': date, 'EVENT': event, 'OPPONENT': name, 'opp_url': url, 'RESULT': result,
+								'DECISION': decision, 'RND': '3', 'TIME': time_})
+			fighter[3].append({'DATE': date, 'OPP': name, 'opp_url': url, 'SDBL/A': f'{value()}/{value()}', 'SDHL/A': f'{value()}/{value()}',
+								'SDLL/A': f'{value()}/{value()}', 'TSL': value(), 'TSA': value(), 'SSL': value(), 'SSA': value(),
+								'SA': value(), 'KD': value(), 'PERCENTBODY': '10', 'PERCENTHEAD': '20', 'PERCENTLEG': '30'})
+			fighter[4].append({'DATE': date, 'OPP': name, 'opp_url': url, **{key: value() for key in
+								('SCBL', 'SCBA', 'SCHL', 'SCHA', 'SCLL', 'SCLA', 'RV', 'SR', 'TDL', 'TDA', 'TDS', 'TDPERCENT')}})
+			fighter[5].append({'DATE': date, 'OPP': name, 'opp_url': url, **{key: value() for key in
+								('SGBL', 'SGBA', 'SGHL', 'SGHA', 'SGLL', 'SGLA', 'AD', 'ADTB', 'ADHG', 'ADTM', 'ADTS', 'SM')}})
+
+	return info_list
+
+def insert_dataset(db, info_list) -> int:
+	""" insert dataset into db within a transaction
+	:param db: UFCHistoryDB instance
+	:param info_list: dataset, see make_dataset
+	:return: number of inserted rows
+	"""
+
+	db.execute('BEGIN TRANSACTION')
+
+	db.insert_fetched(info_list)
+
+	db.execute('COMMIT')
+
+	return sum(1 + len(item[2]) + len(item[3]) + len(item[4]) + len(item[5]) for item in info_list)
+
+def _crash_while_inserting(db_file, profile, info_list):
+	""" commit first half of dataset, then die in the middle of inserting the other half
+		this runs in a child process, so it must stay on module level
+	"""
+
+	db = database.UFCHistoryDB(db_file, True, profile = profile)
+
+	insert_dataset(db, info_list[:len(info_list) // 2])
+
+	# small page cache forces uncommitted pages to be written out before the crash
+	db.execute('PRAGMA cache_size = 16')
+
+	db.execute('BEGIN TRANSACTION')
+
+	for item in info_list[len(info_list) // 2:]:
+		db.insert_into_table_fighters(item[0], item[1])
+		db.insert_into_table_history(item[0], item[2])
+		db.insert_into_table_standing_stats(item[0], item[3])
+
+	os._exit(1)
+
+def check_crash_safety(db_file, profile, info_list) -> bool:
+	""" returns True if committed data is intact after a crash in the middle of a transaction
+	:param db_file: absolute path to a scratch database file
+	:param profile: name of profile
+	:param info_list: dataset, see make_dataset
+	:return: True if the database is intact and contains only committed fighters
+	"""
+
+	process = multiprocessing.Process(target = _crash_while_inserting, args = (db_file, profile, info_list))
+	process.start()
+	process.join()
+
+	try:
+		conn = sqlite3.connect(db_file)
+		integrity = conn.execute('PRAGMA integrity_check').fetchone()[0]
+		fighters = conn.execute('SELECT COUNT(*) FROM Fighters').fetchone()[0]
+		conn.close()
+	except Exception as e:
+		return False
+
+	return integrity == 'ok' and fighters == len(info_list) // 2
+
+def bench_profiles(profiles = None, fighters = 2000, fights = 15000):
+	""" benchmark ingest and export of profiles on a synthetic dataset
+	:param profiles: list of profile names, None: all profiles
+	:param fighters: number of fighters in dataset
+	:param fights: number of fights in dataset
+	:return: dictionary of profile name and dictionary of 'ingest_rows_per_second', 'export_seconds' and 'crash_safe'
+	"""
+
+	if profiles is None:
+		profiles = list(database.DB_PROFILES)
+
+	info_list = make_dataset(fighters, fights)
+
+	results = {}
+
+	work_dir = tempfile.mkdtemp(prefix = 'ufc_bench_')
+
+	cwd = os.getcwd()
+
+	try:
+		for profile in profiles:
+			print(f'Benchmarking profile {profile}...')
+
+			# outputs are written into current directory, a directory per profile so that every profile
+			# builds match_history.db and export_state.json from scratch
+			profile_dir = os.path.join(work_dir, profile)
+			os.mkdir(profile_dir)
+			os.chdir(profile_dir)
+
+			db_file = os.path.join(profile_dir, f'bench_{profile}.db')
+
+			db = database.UFCHistoryDB(db_file, True, profile = profile)
+
+			started = time.perf_counter()
+			rows = insert_dataset(db, info_list)
+			ingest = rows / (time.perf_counter() - started)
+
+			db.close_connection()
+
+			db = database.UFCHistoryDB(db_file, profile = profile)
+			db.export_outputs = ('db',)
+
+			# NOTE: the export cache sits next to database.py, a synthetic dataset mustn't replace the real one
+			db.use_export_cache = False
+
+			started = time.perf_counter()
+			db.get_rows_for_schema()
+			export_seconds = time.perf_counter() - started
+
+			crash_safe = check_crash_safety(os.path.join(profile_dir, f'crash_{profile}.db'), profile, info_list)
+
+			results[profile] = {'ingest_rows_per_second': ingest, 'export_seconds': export_seconds, 'crash_safe': crash_safe}
+	finally:
+		os.chdir(cwd)
+		shutil.rmtree(work_dir, ignore_errors = True)
+
+	print(f'Benchmark of {fighters} fighters and {fights} fights:')
+	print(f'  {"profile":<10} {"ingest rows/s":>14} {"export s":>10} {"crash safe":>11}')
+	for name, result in results.items():
+		print(f'  {name:<10} {result["ingest_rows_per_second"]:14.0f} {result["export_seconds"]:10.2f} {str(result["crash_safe"]):>11}')
+
+	return results
+
+if __name__ == '__main__':
+
+	# usage: python bench.py [fighters] [fights]
+	fighters = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+	fights = int(sys.argv[2]) if len(sys.argv) > 2 else 15000
+
+	bench_profiles(fighters = fighters, fights = fights)
@@ -2,29 +2,172 @@
 import sqlite3
 import os
 import sys
-import threading
 import progressbar
 import pickle
-from shutil import copyfile
-from shutil import rmtree
-from excel import ExcelWriter
+import re
+import unicodedata
+import time
+import hashlib
+import json
+import metrics
+import profiler
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
 from datetime import datetime as DT
 from collections import Counter
+from collections import OrderedDict
+
+# named sets of pragmas applied to every connection, in order
+# NOTE: page_size only takes effect on a new database, before any table is created
+# 	default: sqlite defaults, rollback journal and full sync
+# 	bulk: (re)building a database from scratch, fastest but a crash during ingest leaves a broken database
+# 	read: concurrent reading and exporting, large page cache and memory mapped io
+# 	safe: incremental updates, write-ahead log keeps committed data if the process crashes
+DB_PROFILES = {
+	'default': (),
+	'bulk': (('page_size', 16384), ('journal_mode', 'OFF'), ('synchronous', 'OFF'), ('cache_size', -262144),
+			('temp_store', 'MEMORY'), ('mmap_size', 268435456)),
+	'read': (('cache_size', -131072), ('temp_store', 'MEMORY'), ('mmap_size', 1073741824)),
+	'safe': (('page_size', 16384), ('journal_mode', 'WAL'), ('synchronous', 'NORMAL'), ('cache_size', -65536),
+			('temp_store', 'MEMORY'), ('mmap_size', 268435456))
+}
+
+# statistics which are summed up per fighter in match history, suffixes of 'F1'/'F2' keys of rows
+SUM_COLUMNS = ('SDBL', 'SDBA', 'SDHL', 'SDHA', 'SDLL', 'SDLA', 'TSL', 'TSA', 'SSL', 'SSA', 'SA', 'KD',
+			'SCBL', 'SCBA', 'SCHL', 'SCHA', 'SCLL', 'SCLA', 'RV', 'SR', 'TDL', 'TDA', 'TDS',
+			'SGBL', 'SGBA', 'SGHL', 'SGHA', 'SGLL', 'SGLA', 'AD', 'ADTB', 'ADHG', 'ADTM', 'ADTS', 'SM')
+
+# datasets smaller than this are summed up in a single process, see get_match_history_sums
+MIN_PARALLEL_SUM_ROWS = 1000
+
+# cached export dataset of the last export, reused as long as the database and this file are unchanged
+EXPORT_CACHE_FILE = 'export_cache.pickle'
+
+# tables which the export dataset is built from, their versions are kept in table 'TableVersions'
+# NOTE: 'Fighters' and 'History' are views, so their underlying tables and lookup tables are versioned
+EXPORT_SOURCE_TABLES = ('FighterData', 'HistoryData', 'StandingStatistics', 'ClinchStatistics', 'GroundStatistics',
+						'Events', 'Results', 'Decisions', 'WeightClasses', 'FighterGroups')
+
+# dictionary-encoded columns of tables 'Fighters' and 'History' and their lookup tables
+# NOTE: 'Fighters' and 'History' are views over 'FighterData' and 'HistoryData' which keep integer ids of these strings
+LOOKUP_TABLES = {
+	('Fighters', 'weight_class'): 'WeightClasses',
+	('Fighters', 'group_name'): 'FighterGroups',
+	('History', 'event'): 'Events',
+	('History', 'result'): 'Results',
+	('History', 'decision'): 'Decisions'
+}
+
+# outcome classes of History.decision used by aggregate tables, e.g. 'KO/TKO', 'Submission', 'Decision - Unanimous', 'U Dec'
+OUTCOME_CONDITIONS = {
+	'ko': "h.decision LIKE '%KO%'",
+	'submission': "h.decision LIKE 'Sub%'",
+	'decision': "h.decision LIKE '%Dec%'"
+}
+
+# length of a match in minutes
+# NOTE: all rounds but the last one are assumed to be 5 minutes long
+MATCH_MINUTES = """(MAX(h.rnd, 1) - 1) * 5 + CASE WHEN instr(h.match_time, ':') > 0
+			THEN CAST(substr(h.match_time, 1, instr(h.match_time, ':') - 1) AS real) + CAST(substr(h.match_time, instr(h.match_time, ':') + 1) AS real) / 60
+			ELSE 0 END"""
+
+class QueryCache:
+	""" bounded LRU cache of query results
+		whole cache is dropped when the version of the source data changes
+	"""
+
+	def __init__(self, max_size = 1024):
+		""" constructor
+		:param max_size: maximum number of cached results
+		"""
+
+		self.max_size = max_size
+		self.version = None
+		self.entries = OrderedDict()
+		self.hits = 0
+		self.misses = 0
+
+	def validate(self, version):
+		""" drop all entries if 'version' differs from the version cached results are based on
+		:param version: current version of the source data
+		:return:
+		"""
+
+		if version != self.version:
+			self.entries.clear()
+			self.version = version
+
+	def get(self, key):
+		""" returns cached result of 'key', None if it's not cached
+		:param key: hashable query key
+		:return: cached result or None
+		"""
+
+		if key not in self.entries:
+			self.misses += 1
+			return None
+
+		self.hits += 1
+		self.entries.move_to_end(key)
+		return self.entries[key]
+
+	def put(self, key, value):
+		""" cache 'value' for 'key', evict the least recently used entry if it's full
+		:param key: hashable query key
+		:param value: query result
+		:return:
+		"""
+
+		self.entries[key] = value
+		self.entries.move_to_end(key)
+
+		if len(self.entries) > self.max_size:
+			self.entries.popitem(last = False)
 
 class UFCHistoryDB:
 	""" manages sqlite database
 	"""
 
-	def __init__(self, db_file, delete_if_exists = False, sub_folder = None):
+	# maximum number of rows returned by a single page of query API
+	max_page_size = 500
+
+	def __init__(self, db_file, delete_if_exists = False, sub_folder = None, read_only = False, cache_size = 1024, profile = None, upgrade = False):
 		""" constructor 
 		:param db_file: database file name
 		:param delete_if_exists: True: delete 'db_file' if it already exists, False: do nothing
 		:param sub_folder: create a subdirectory 'sub_folder' and create database file in it
+		:param read_only: True: open existing database in read-only mode, used by query API
+		:param cache_size: maximum number of cached query results
+		:param profile: name of pragma profile, see DB_PROFILES
+				None: 'read' for read-only and 'safe' otherwise
+		:param upgrade: True: convert a database created by an older version(see encode_tables), used by ingest
+				False: leave the database as it is, exports and queries never write into it
 		:return:
 		"""
 
 		self.path_ = ''
 
+		self.read_only_ = read_only
+
+		if profile is None:
+			# NOTE: 'bulk' isn't measurably faster than 'safe' on ingest(see bench.py),
+			# 		since a whole run is inserted in a single transaction
+			profile = 'read' if read_only else 'safe'
+
+		self.profile_ = profile
+
+		# LRU cache of query API results
+		self.query_cache = QueryCache(cache_size)
+
+		# in-memory matchup index, see get_matchup_index
+		self.matchup_index = None
+
+		# True if the database has full-text index 'FighterNames', None: not checked yet, see has_name_index
+		self.name_index_ = None
+
+		# in-memory intern maps of lookup tables, lookup table -> {name: id}, see get_lookup_id
+		self.lookup_ids = {}
+
 		if sub_folder != None:
 			if not os.path.exists(sub_folder):
 				os.makedirs(sub_folder)
@@ -48,28 +191,32 @@ class UFCHistoryDB:
 
 		if delete_if_exists:
 			self.create_tables()
+		elif upgrade and not read_only:
+			# databases created before strings were dictionary-encoded are converted once
+			self.encode_tables()
+			self.create_table_versions()
+			self.conn.commit()
 
-		self.c.execute("PRAGMA journal_mode = OFF")
-		
-		self.conn.commit()
-
-		# used to preserve all queried data which should be written to excel
-		self.rows_for_schema = []
+		# number of worker processes which build the export dataset, None: cpu count
+		self.export_workers = None
 
-		# progress bar for above list processing
-		self.get_rows_bar = None
+		# names of outputs to build after getting rows for schema, see export.ALL_OUTPUTS
+		# None: export.DEFAULT_OUTPUTS
+		self.export_outputs = None
 
-		# used to check if all threads are finished
-		self.total_row_count = 0
+		# True: export only matches added since the last export into part files, see export.export_outputs
+		self.export_delta = False
 
-		# count of threads
-		self.thread_count = 20
+		# True: reuse the export dataset of the last export if the database didn't change, see get_export_cache_key
+		self.use_export_cache = True
 
-		# thread_counter, it is increased by 1 when a 
-		self.thread_counter = 0
+		# cache key of the export dataset being built, None: don't cache it
+		self.export_cache_key = None
 
-		# path to temp dir for multithreading
-		self.tmp_dir = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'temp')
+		# maps to resolve opponents to fighter ids at ingest, built by build_fighter_maps
+		self.url_to_id = {}
+		self.name_to_id = {}
+		self.id_to_name = {}
 
 	def create_connection(self, db_file):
 		"""create a database connection to the SQLite database
@@ -79,12 +226,38 @@ class UFCHistoryDB:
 		"""
 
 		try:
-			conn = sqlite3.connect(db_file)
-			return conn
+			if getattr(self, 'read_only_', False):
+				# NOTE: urllib.request is slow to import, only read-only connections need it
+				from urllib.request import pathname2url
+
+				conn = sqlite3.connect(f'file:{pathname2url(db_file)}?mode=ro', uri = True)
+			else:
+				conn = sqlite3.connect(db_file)
 		except Exception as e:
 			print(str(e))
-	 
-		return None
+			return None
+
+		UFCHistoryDB.apply_profile(conn, getattr(self, 'profile_', None))
+
+		return conn
+
+	@staticmethod
+	def apply_profile(conn, profile):
+		""" apply pragmas of a profile to a connection
+		:param conn: sqlite3 connection
+		:param profile: name of profile, see DB_PROFILES, None: leave sqlite defaults
+		:return:
+		"""
+
+		if profile is None:
+			return
+
+		for name, value in DB_PROFILES[profile]:
+			try:
+				conn.execute(f'PRAGMA {name} = {value}')
+			except Exception as e:
+				# e.g. journal mode can't be changed on a read-only connection
+				print(f'Error(DB.apply_profile): {name} = {value}: {str(e)}')
 
 	def close_connection(self):
 		"""close a database connection to the SQLite database
@@ -108,34 +281,15 @@ class UFCHistoryDB:
 		:return: 
 		"""
 
-		self.c.execute("""CREATE TABLE IF NOT EXISTS Fighters (
-					id integer PRIMARY KEY,
-					name text NOT NULL,
-					age integer,
-					url text NOT NULL,
-					height text,
-					weight text,
-					weight_class text,
-					reach text,
-					group_name text
-					)""")
-
-		self.c.execute("""CREATE INDEX index_name ON Fighters(name)
-			""")
-
-		self.c.execute("""CREATE UNIQUE INDEX index_url ON Fighters(url)
-			""")
+		self.create_encoded_tables()
 
-		self.c.execute("""CREATE TABLE IF NOT EXISTS History (
+		# opponents which couldn't be resolved to a fighter id at ingest
+		self.c.execute("""CREATE TABLE IF NOT EXISTS UnresolvedOpponents (
 					id integer NOT NULL,
 					match_date text NOT NULL,
-					event text NOT NULL,
 					opponent text NOT NULL,
 					opp_url text,
-					result text NOT NULL,
-					decision text NOT NULL,
-					rnd integer NOT NULL,
-					match_time text NOT NULL
+					reason text
 					)""")
 
 		self.c.execute("""CREATE TABLE IF NOT EXISTS StandingStatistics (
@@ -195,9 +349,264 @@ class UFCHistoryDB:
 					sm text
 					)""")
 
+		# indexes for lookups by fighter and date, used by get_rows and query API
+		self.c.execute("""CREATE INDEX index_unresolved_id ON UnresolvedOpponents(id)
+			""")
+
+		self.c.execute("""CREATE INDEX index_standing_id ON StandingStatistics(id, match_date)
+			""")
+
+		self.c.execute("""CREATE INDEX index_clinch_id ON ClinchStatistics(id, match_date)
+			""")
+
+		self.c.execute("""CREATE INDEX index_ground_id ON GroundStatistics(id, match_date)
+			""")
+
+		self.create_name_index()
+
+		self.create_table_versions()
+
 		self.conn.commit()
 		self.reconnect_database()
 
+	def create_table_versions(self):
+		""" create table 'TableVersions' which keeps a version of every source table of the export dataset
+			writers give the tables they change a new version once per transaction, see bump_table_versions
+		:param:
+		:return:
+		"""
+
+		self.c.execute("""CREATE TABLE IF NOT EXISTS TableVersions (
+					name text PRIMARY KEY,
+					version integer NOT NULL
+					)""")
+
+		self.c.executemany("INSERT OR IGNORE INTO TableVersions (name, version) VALUES (?, random())",
+							[(table,) for table in EXPORT_SOURCE_TABLES])
+
+	def bump_table_versions(self, tables = EXPORT_SOURCE_TABLES):
+		""" give tables a new version, call this within the transaction which changes them
+			versions are random, so a rebuilt database never repeats versions of the one before it
+		:param tables: names of changed tables, see EXPORT_SOURCE_TABLES
+		:return:
+		"""
+
+		self.c.executemany("INSERT OR REPLACE INTO TableVersions (name, version) VALUES (?, random())",
+							[(table,) for table in tables])
+
+	def create_encoded_tables(self):
+		""" create tables 'FighterData' and 'HistoryData' with their lookup tables(see LOOKUP_TABLES)
+			and views 'Fighters' and 'History' which decode them, so that existing queries keep working
+			inserts, updates and deletes on the views are done by triggers, ingest writes the tables directly
+		:param:
+		:return:
+		"""
+
+		for table in sorted(set(LOOKUP_TABLES.values())):
+			self.c.execute(f"""CREATE TABLE IF NOT EXISTS {table} (
+						id integer PRIMARY KEY,
+						name text NOT NULL UNIQUE
+						)""")
+
+		self.c.execute("""CREATE TABLE IF NOT EXISTS FighterData (
+					id integer PRIMARY KEY,
+					name text NOT NULL,
+					age integer,
+					url text NOT NULL,
+					height text,
+					weight text,
+					weight_class_id integer REFERENCES WeightClasses(id),
+					reach text,
+					group_id integer REFERENCES FighterGroups(id)
+					)""")
+
+		# opponent is NULL if it's the name of fighter opp_id
+		self.c.execute("""CREATE TABLE IF NOT EXISTS HistoryData (
+					id integer NOT NULL,
+					match_date text NOT NULL,
+					event_id integer NOT NULL REFERENCES Events(id),
+					opponent text,
+					opp_url text,
+					opp_id integer REFERENCES FighterData(id),
+					result_id integer NOT NULL REFERENCES Results(id),
+					decision_id integer NOT NULL REFERENCES Decisions(id),
+					rnd integer NOT NULL,
+					match_time text NOT NULL
+					)""")
+
+		self.c.execute("CREATE INDEX IF NOT EXISTS index_name ON FighterData(name)")
+		self.c.execute("CREATE UNIQUE INDEX IF NOT EXISTS index_url ON FighterData(url)")
+		self.c.execute("CREATE INDEX IF NOT EXISTS index_history_id ON HistoryData(id, match_date)")
+		self.c.execute("CREATE INDEX IF NOT EXISTS index_history_opp_id ON HistoryData(opp_id)")
+
+		# NOTE: rowid of the tables is exposed as a column, so that queries on rowid keep working
+		self.c.execute("""CREATE VIEW IF NOT EXISTS Fighters AS
+					SELECT f.id AS id, f.name AS name, f.age AS age, f.url AS url, f.height AS height, f.weight AS weight,
+						w.name AS weight_class, f.reach AS reach, g.name AS group_name, f.rowid AS rowid
+					FROM FighterData f
+					LEFT JOIN WeightClasses w ON w.id=f.weight_class_id
+					LEFT JOIN FighterGroups g ON g.id=f.group_id""")
+
+		self.c.execute("""CREATE VIEW IF NOT EXISTS History AS
+					SELECT h.id AS id, h.match_date AS match_date, e.name AS event, COALESCE(h.opponent, o.name) AS opponent,
+						h.opp_url AS opp_url, h.opp_id AS opp_id, r.name AS result, d.name AS decision, h.rnd AS rnd,
+						h.match_time AS match_time, h.rowid AS rowid
+					FROM HistoryData h
+					LEFT JOIN Events e ON e.id=h.event_id
+					LEFT JOIN FighterData o ON o.id=h.opp_id
+					LEFT JOIN Results r ON r.id=h.result_id
+					LEFT JOIN Decisions d ON d.id=h.decision_id""")
+
+		# NOTE: lookups are added with NOT EXISTS rather than OR IGNORE, an INSERT OR REPLACE on a view
+		# 		would turn it into OR REPLACE and give an existing name a new id
+		def add_lookups(view):
+			return '\n'.join(f"""INSERT INTO {table} (name) SELECT NEW.{column} WHERE NEW.{column} IS NOT NULL
+								AND NOT EXISTS (SELECT 1 FROM {table} WHERE name=NEW.{column});"""
+								for (view_, column), table in sorted(LOOKUP_TABLES.items()) if view_ == view)
+
+		self.c.execute(f"""CREATE TRIGGER IF NOT EXISTS fighters_insert INSTEAD OF INSERT ON Fighters BEGIN
+					{add_lookups('Fighters')}
+					INSERT INTO FighterData (id, name, age, url, height, weight, weight_class_id, reach, group_id)
+						VALUES (NEW.id, NEW.name, NEW.age, NEW.url, NEW.height, NEW.weight,
+							(SELECT id FROM WeightClasses WHERE name=NEW.weight_class), NEW.reach,
+							(SELECT id FROM FighterGroups WHERE name=NEW.group_name));
+				END""")
+
+		self.c.execute(f"""CREATE TRIGGER IF NOT EXISTS fighters_update INSTEAD OF UPDATE ON Fighters BEGIN
+					{add_lookups('Fighters')}
+					UPDATE FighterData SET id=NEW.id, name=NEW.name, age=NEW.age, url=NEW.url, height=NEW.height, weight=NEW.weight,
+						weight_class_id=(SELECT id FROM WeightClasses WHERE name=NEW.weight_class), reach=NEW.reach,
+						group_id=(SELECT id FROM FighterGroups WHERE name=NEW.group_name)
+						WHERE id=OLD.id;
+				END""")
+
+		self.c.execute("""CREATE TRIGGER IF NOT EXISTS fighters_delete INSTEAD OF DELETE ON Fighters BEGIN
+					DELETE FROM FighterData WHERE id=OLD.id;
+				END""")
+
+		self.c.execute(f"""CREATE TRIGGER IF NOT EXISTS history_insert INSTEAD OF INSERT ON History BEGIN
+					{add_lookups('History')}
+					INSERT INTO HistoryData (id, match_date, event_id, opponent, opp_url, opp_id, result_id, decision_id, rnd, match_time)
+						VALUES (NEW.id, NEW.match_date, (SELECT id FROM Events WHERE name=NEW.event),
+							CASE WHEN NEW.opponent=(SELECT name FROM FighterData WHERE id=NEW.opp_id) THEN NULL ELSE NEW.opponent END,
+							NEW.opp_url, NEW.opp_id, (SELECT id FROM Results WHERE name=NEW.result),
+							(SELECT id FROM Decisions WHERE name=NEW.decision), NEW.rnd, NEW.match_time);
+				END""")
+
+		self.c.execute(f"""CREATE TRIGGER IF NOT EXISTS history_update INSTEAD OF UPDATE ON History BEGIN
+					{add_lookups('History')}
+					UPDATE HistoryData SET id=NEW.id, match_date=NEW.match_date, event_id=(SELECT id FROM Events WHERE name=NEW.event),
+						opponent=CASE WHEN NEW.opponent=(SELECT name FROM FighterData WHERE id=NEW.opp_id) THEN NULL ELSE NEW.opponent END,
+						opp_url=NEW.opp_url, opp_id=NEW.opp_id, result_id=(SELECT id FROM Results WHERE name=NEW.result),
+						decision_id=(SELECT id FROM Decisions WHERE name=NEW.decision), rnd=NEW.rnd, match_time=NEW.match_time
+						WHERE rowid=OLD.rowid;
+				END""")
+
+		self.c.execute("""CREATE TRIGGER IF NOT EXISTS history_delete INSTEAD OF DELETE ON History BEGIN
+					DELETE FROM HistoryData WHERE rowid=OLD.rowid;
+				END""")
+
+		# opponent names taken from a fighter are written out before the fighter is renamed or deleted
+		self.c.execute("""CREATE TRIGGER IF NOT EXISTS fighter_data_rename AFTER UPDATE OF name ON FighterData
+					WHEN OLD.name IS NOT NEW.name BEGIN
+					UPDATE HistoryData SET opponent=OLD.name WHERE opp_id=OLD.id AND opponent IS NULL;
+				END""")
+
+		self.c.execute("""CREATE TRIGGER IF NOT EXISTS fighter_data_delete BEFORE DELETE ON FighterData BEGIN
+					UPDATE HistoryData SET opponent=OLD.name WHERE opp_id=OLD.id AND opponent IS NULL;
+				END""")
+
+	def encode_tables(self):
+		""" convert tables 'Fighters' and 'History' of a database created before strings were dictionary-encoded
+			into FighterData, HistoryData and lookup tables, see create_encoded_tables
+		:param:
+		:return: True if the database is converted now, False if there's nothing to convert
+		"""
+
+		row = self.c.execute("SELECT type FROM sqlite_master WHERE name='History'").fetchone()
+
+		if row is None or row[0] != 'table':
+			return False
+
+		print('Dictionary-encoding strings of the database...')
+
+		columns = [column[1] for column in self.c.execute("PRAGMA table_info(History)").fetchall()]
+		opp_id = 'h.opp_id' if 'opp_id' in columns else 'NULL'
+
+		self.execute('BEGIN TRANSACTION')
+
+		try:
+			# NOTE: index names are reused by the new tables
+			for index in ('index_name', 'index_url', 'index_history_id', 'index_history_opp_id', 'index_history_date'):
+				self.c.execute(f"DROP INDEX IF EXISTS {index}")
+
+			self.c.execute("ALTER TABLE Fighters RENAME TO LegacyFighters")
+			self.c.execute("ALTER TABLE History RENAME TO LegacyHistory")
+
+			self.create_encoded_tables()
+
+			for (view, column), table in sorted(LOOKUP_TABLES.items()):
+				self.c.execute(f"""INSERT INTO {table} (name) SELECT DISTINCT {column} FROM Legacy{view}
+									WHERE {column} IS NOT NULL ORDER BY {column}""")
+
+			self.c.execute("""INSERT INTO FighterData (id, name, age, url, height, weight, weight_class_id, reach, group_id)
+								SELECT f.id, f.name, f.age, f.url, f.height, f.weight, w.id, f.reach, g.id
+								FROM LegacyFighters f
+								LEFT JOIN WeightClasses w ON w.name=f.weight_class
+								LEFT JOIN FighterGroups g ON g.name=f.group_name""")
+
+			# NOTE: rowids are kept, they're the order of matches of the same fighter on the same date
+			self.c.execute(f"""INSERT INTO HistoryData (rowid, id, match_date, event_id, opponent, opp_url, opp_id, result_id, decision_id, rnd, match_time)
+								SELECT h.rowid, h.id, h.match_date, e.id, CASE WHEN h.opponent=o.name THEN NULL ELSE h.opponent END,
+									h.opp_url, {opp_id}, r.id, d.id, h.rnd, h.match_time
+								FROM LegacyHistory h
+								LEFT JOIN FighterData o ON o.id={opp_id}
+								LEFT JOIN Events e ON e.name=h.event
+								LEFT JOIN Results r ON r.name=h.result
+								LEFT JOIN Decisions d ON d.name=h.decision""")
+
+			self.c.execute("DROP TABLE LegacyHistory")
+			self.c.execute("DROP TABLE LegacyFighters")
+
+			self.create_table_versions()
+			self.bump_table_versions()
+
+			self.execute('COMMIT')
+		except Exception as e:
+			self.execute('ROLLBACK')
+			print(f'Error(DB.encode_tables): {str(e)}')
+			return False
+
+		# give the space of the dropped tables back
+		self.execute('VACUUM')
+
+		print('Dictionary-encoding strings of the database is completed!')
+
+		return True
+
+	def get_lookup_id(self, table, name):
+		""" returns id of 'name' in a lookup table, it's added if it's new
+			ids are kept in an in-memory intern map, so a known name costs no query
+		:param table: lookup table, one of LOOKUP_TABLES
+		:param name: string to encode
+		:return: integer id, None for None
+		"""
+
+		if name is None:
+			return None
+
+		if table not in self.lookup_ids:
+			self.lookup_ids[table] = {name_: id_ for id_, name_ in self.c.execute(f"SELECT id, name FROM {table}").fetchall()}
+
+		ids = self.lookup_ids[table]
+
+		if name not in ids:
+			# NOTE: the name may have been added by another statement since the map was loaded
+			self.c.execute(f"INSERT OR IGNORE INTO {table} (name) VALUES (?)", (name,))
+			ids[name] = self.c.execute(f"SELECT id FROM {table} WHERE name=?", (name,)).fetchone()[0]
+
+		return ids[name]
+
 	def delete_database(self):
 		""" delete database db_name
 		:param
@@ -222,10 +631,10 @@ class UFCHistoryDB:
 		self.conn.close()
 
 		# reconnect to database
-		try:
-			self.conn = sqlite3.connect(self.db_file_)
-		except Exception as e:
-			raise e
+		self.conn = self.create_connection(self.db_file_)
+
+		if self.conn is None:
+			raise sqlite3.OperationalError(f'Cannot reconnect to database {self.db_file_}')
 
 		self.c = self.conn.cursor()
 
@@ -236,123 +645,516 @@ class UFCHistoryDB:
 
 		self.c.execute(query)
 
-	def insert_into_table_fighters(self, id_, data):
-		""" insert given 'data' into table 'Fighters'
+	@staticmethod
+	def normalize_url(url):
+		""" returns comparable form of a fighter url
+		:param url: absolute or relative profile url
+		:return: url without scheme, host and trailing slash in lower case, None for empty url
+		"""
 
-		:param id_: unique fighter identifier
-		:param data: dictionary of fighter general information
-		:return:
+		if url is None or len(url.strip()) == 0:
+			return None
+
+		url = url.strip().lower()
+		url = re.sub(r'^https?://[^/]+', '', url)
+
+		return url.rstrip('/')
+
+	@staticmethod
+	def get_fighter_id(url):
+		""" returns stable fighter id of a profile url, the same fighter gets the same id in every run
+			e.g. http://www.espn.com/mma/fighter/_/id/2335639/jon-jones >> 2335639
+		:param url: absolute or relative profile url
+		:return: espn fighter id, negative hash of the url if it has no id
 		"""
 
-		if data is None or len(data) == 0:
-			return
+		match = re.search(r'/id/(\d+)', url or '')
 
-		sql = """INSERT INTO Fighters (id, name, age, url, height, weight, weight_class, reach, group_name) 
-						VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"""
-		val = None
+		if match is not None:
+			return int(match.group(1))
+
+		# NOTE: negative ids never clash with espn ids
+		key = UFCHistoryDB.normalize_url(url) or ''
+
+		return -int(hashlib.md5(key.encode('utf-8')).hexdigest()[:15], 16)
+
+	@staticmethod
+	def normalize_name(name):
+		""" returns comparable form of a fighter name
+			accents and punctuation are removed, whitespace is collapsed
+		:param name: fighter name
+		:return: normalized name in lower case, None for empty name
+		"""
+
+		if name is None:
+			return None
+
+		name = unicodedata.normalize('NFKD', name)
+		name = ''.join(ch for ch in name if not unicodedata.combining(ch))
+		name = re.sub(r"[^\w\s]", '', name.lower())
+		name = ' '.join(name.split())
+
+		return name if len(name) > 0 else None
+
+	@staticmethod
+	def get_url_alias(url):
+		""" returns normalized name in the slug of a profile url
+			e.g. http://www.espn.com/mma/fighter/_/id/2335639/jon-jones >> jon jones
+		:param url: absolute or relative profile url
+		:return: normalized name, None if the url has no slug
+		"""
+
+		key = UFCHistoryDB.normalize_url(url)
+
+		if key is None:
+			return None
+
+		slug = key.split('/')[-1]
+
+		if slug.isdigit():
+			return None
+
+		return UFCHistoryDB.normalize_name(slug.replace('-', ' '))
+
+	def create_name_index(self):
+		""" create full-text index 'FighterNames' of normalized fighter names and aliases
+			rowid is the fighter id, the trigram tokenizer matches any part of a name
+		:param:
+		:return: True if the index exists, False if sqlite has no fts5
+		"""
 
 		try:
-			val = (id_, data['name'], data['age'], data['url'], data['height'], data['weight']
-				, data['weight_class'], data['reach'], data['group_name'])
+			self.c.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS FighterNames USING fts5(
+						name,
+						aliases,
+						tokenize = 'trigram'
+						)""")
 		except Exception as e:
-			print("Error(DB.Fighters): ", str(e))
-			return
+			print(f'Error(DB.create_name_index): {str(e)}')
+			return False
 
-		if val != None:
-			try:
-				self.c.execute(sql, val)
-				# self.conn.commit()
-			except Exception as e:
-				print("Error while inserting into table 'Fighters':", str(e))
-				print("Query : ", sql, val)
-		
-	def insert_into_table_history(self, id_, data):
-		""" insert given 'data' into table 'History'
+		self.name_index_ = True
+
+		return True
+
+	def has_name_index(self):
+		""" returns True if the database has full-text index 'FighterNames'
+			databases created before it was introduced get it on the next refresh or merge
+		:param:
+		:return: True or False
+		"""
+
+		if self.name_index_ is None:
+			self.name_index_ = self.c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='FighterNames'").fetchone() is not None
+
+		return self.name_index_
+
+	def index_fighter_name(self, id_, name, aliases):
+		""" replace full-text index entry of a fighter
 		:param id_: unique fighter identifier
-		:param data: list of sub lists
+		:param name: fighter name
+		:param aliases: list of other names of the fighter, e.g. url slug or spellings used by opponents
 		:return:
 		"""
 
-		if data is None:
-			return
-
-		for item in data:
-			sql = """INSERT INTO History (id, match_date, event, opponent, opp_url, result, decision, rnd, match_time) 
-							VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"""
-			val = None
+		name = UFCHistoryDB.normalize_name(name) or ''
 
-			try:
-				if 'opp_url' in item:
-					val = (id_, item['DATE'], item['EVENT'], item['OPPONENT'], item['opp_url'], item['RESULT']
-						, item['DECISION'], item['RND'], item['TIME'])
-				else:
-					val = (id_, item['DATE'], item['EVENT'], item['OPPONENT'], None, item['RESULT']
-						, item['DECISION'], item['RND'], item['TIME'])
-			except Exception as e:
-				print("Error(DB.History): ", str(e))
-				continue
+		aliases = sorted(set(alias for alias in (UFCHistoryDB.normalize_name(alias) for alias in aliases) if alias is not None and alias != name))
 
-			if val != None:
-				try:
-					self.c.execute(sql, val)
-					# self.conn.commit()
-				except Exception as e:
-					print("Error while inserting into table 'History':", str(e))
-					print("Query : ", sql, val)
+		self.c.execute("DELETE FROM FighterNames WHERE rowid=?", (id_,))
+		self.c.execute("INSERT INTO FighterNames (rowid, name, aliases) VALUES (?, ?, ?)", (id_, name, ' | '.join(aliases)))
 
-	def insert_into_table_standing_stats(self, id_, data):
-		""" insert given 'data' into table 'StandingStatistics'
-		:param id_: unique fighter identifier
-		:param data: list of sub lists
+	def refresh_name_index(self, ids = None):
+		""" rebuild full-text index entries of fighters from table 'Fighters' and opponent names in table 'History'
+		:param ids: list of fighter ids whose names or matches changed, their opponents are refreshed as well
+				None: rebuild the whole index
 		:return:
 		"""
 
-		if data is None:
+		if not self.create_name_index():
 			return
 
-		for item in data:
-			sql = """INSERT INTO StandingStatistics (id, match_date, opponent, opp_url, sdbl_a, sdhl_a, sdll_a, tsl, 
-													tsa, ssl, sa, kd, percent_body, percent_head, percent_leg) 
-							VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
-			val = None
+		if ids is None:
+			self.c.execute("DELETE FROM FighterNames")
 
-			try:
-				if 'opp_url' in item:
-					val = (id_, item['DATE'], item['OPP'], item['opp_url'], item['SDBL/A'], item['SDHL/A'], item['SDLL/A']
-						, item['TSL'], item['TSA'], item['SSL'], item['SA'], item['KD'], item['PERCENTBODY'], item['PERCENTHEAD'], item['PERCENTLEG'])
-				else:
-					val = (id_, item['DATE'], item['OPP'], None, item['SDBL/A'], item['SDHL/A'], item['SDLL/A']
-						, item['TSL'], item['TSA'], item['SSL'], item['SA'], item['KD'], item['PERCENTBODY'], item['PERCENTHEAD'], item['PERCENTLEG'])
-			except Exception as e:
-				print("Error(DB.StandingStatistics): ", str(e))
-				continue
+			fighters = self.c.execute("SELECT id, name, url FROM Fighters").fetchall()
+			opponents = self.c.execute("SELECT DISTINCT opp_id, opponent FROM History WHERE opp_id IS NOT NULL").fetchall()
+		else:
+			# NOTE: ids are passed as a json array, so there's no limit on the number of them
+			ids = json.dumps(list(ids))
 
-			if val != None:
-				try:
-					self.c.execute(sql, val)
-					# self.conn.commit()
-				except Exception as e:
-					print("Error while inserting into table 'StandingStatistics':", str(e))
-					print("Query : ", sql, val)
+			sql = """SELECT value FROM json_each(?)
+						UNION SELECT opp_id FROM History WHERE opp_id IS NOT NULL AND id IN (SELECT value FROM json_each(?))"""
 
-	def insert_into_table_clinch_stats(self, id_, data):
-		""" insert given 'data' into table 'ClinchStatistics'
-		:param id_: unique fighter identifier
-		:param data: list of sub lists
+			ids = json.dumps([row[0] for row in self.c.execute(sql, (ids, ids)).fetchall()])
+
+			fighters = self.c.execute("SELECT id, name, url FROM Fighters WHERE id IN (SELECT value FROM json_each(?))", (ids,)).fetchall()
+			opponents = self.c.execute("""SELECT DISTINCT opp_id, opponent FROM History
+											WHERE opp_id IN (SELECT value FROM json_each(?))""", (ids,)).fetchall()
+
+		aliases = {}
+
+		for opp_id, opponent in opponents:
+			aliases.setdefault(opp_id, []).append(opponent)
+
+		for id_, name, url in fighters:
+			self.index_fighter_name(id_, name, aliases.get(id_, []) + [UFCHistoryDB.get_url_alias(url)])
+
+	def build_fighter_maps(self):
+		""" build in-memory url -> id, normalized name -> id and id -> name maps from table 'Fighters'
+			call this once after all fighters are inserted and before inserting histories
+		:param:
 		:return:
 		"""
 
-		if data is None:
-			return
+		self.url_to_id = {}
+		self.name_to_id = {}
+		self.id_to_name = {}
 
-		for item in data:
-			sql = """INSERT INTO ClinchStatistics (id, match_date, opponent, opp_url, scbl, scba, schl, scha, scll, 
-													scla, rv, sr, tdl, tda, tds, td_percent) 
-							VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
-			val = None
+		for id_, name, url in self.c.execute("SELECT id, name, url FROM Fighters").fetchall():
+			self.id_to_name[id_] = name
 
-			try:
-				if 'opp_url' in item:
+			key = UFCHistoryDB.normalize_url(url)
+			if key is not None:
+				self.url_to_id[key] = id_
+
+			key = UFCHistoryDB.normalize_name(name)
+			if key is not None:
+				# None marks a name shared by several fighters
+				self.name_to_id[key] = None if key in self.name_to_id else id_
+
+	def resolve_opponent(self, opponent, opp_url):
+		""" resolve an opponent to a fighter id, by url first and normalized name next
+		:param opponent: opponent name
+		:param opp_url: opponent profile url, can be None
+		:return: tuple of fighter id(None if unresolved) and reason of failure
+		"""
+
+		key = UFCHistoryDB.normalize_url(opp_url)
+
+		if key is not None and key in self.url_to_id:
+			return self.url_to_id[key], None
+
+		key = UFCHistoryDB.normalize_name(opponent)
+
+		if key is None or key not in self.name_to_id:
+			return None, 'unknown'
+
+		if self.name_to_id[key] is None:
+			return None, 'ambiguous name'
+
+		return self.name_to_id[key], None
+
+	def resolve_history_opponents(self):
+		""" resolve opponents of all matches in table 'History' again and rebuild table 'UnresolvedOpponents'
+			used after fighters are added in bulk, e.g. by merging shard databases
+		:param:
+		:return: number of unresolved opponents
+		"""
+
+		self.build_fighter_maps()
+
+		updates = []
+		unresolved = []
+
+		for rowid, id_, match_date, opponent, opp_url in self.c.execute("SELECT rowid, id, match_date, opponent, opp_url FROM History").fetchall():
+			opp_id, reason = self.resolve_opponent(opponent, opp_url)
+
+			# opponent is kept only if it isn't the name of the resolved fighter
+			updates.append((opp_id, None if opp_id is not None and opponent == self.id_to_name.get(opp_id) else opponent, rowid))
+
+			if opp_id is None:
+				unresolved.append((id_, match_date, opponent, opp_url, reason))
+
+		self.c.executemany("UPDATE HistoryData SET opp_id=?, opponent=? WHERE rowid=?", updates)
+
+		self.bump_table_versions(('HistoryData',))
+
+		self.c.execute("DELETE FROM UnresolvedOpponents")
+		self.c.executemany("""INSERT INTO UnresolvedOpponents (id, match_date, opponent, opp_url, reason)
+								VALUES (?, ?, ?, ?, ?)""", unresolved)
+
+		# opponents resolved now add their spellings to the name index
+		self.refresh_name_index()
+
+		return len(unresolved)
+
+	def create_aggregate_tables(self):
+		""" create materialized aggregate tables of table 'History', see refresh_aggregates
+		:param:
+		:return: True if they already existed, False if they're created now
+		"""
+
+		exists = self.c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='CareerStats'").fetchone() is not None
+
+		# career of every fighter, draws include no contests
+		self.c.execute("""CREATE TABLE IF NOT EXISTS CareerStats (
+					id integer PRIMARY KEY,
+					fights integer NOT NULL,
+					wins integer NOT NULL,
+					losses integer NOT NULL,
+					draws integer NOT NULL,
+					ko_wins integer NOT NULL,
+					submission_wins integer NOT NULL,
+					decision_wins integer NOT NULL,
+					first_date text,
+					last_date text,
+					minutes real NOT NULL,
+					strikes_landed integer NOT NULL,
+					strikes_attempted integer NOT NULL,
+					takedowns_landed integer NOT NULL,
+					knockdowns integer NOT NULL
+					)""")
+
+		# matches per weight class and year, every match is counted once
+		self.c.execute("""CREATE TABLE IF NOT EXISTS WeightClassYearStats (
+					weight_class text NOT NULL,
+					year text NOT NULL,
+					fights integer NOT NULL,
+					kos integer NOT NULL,
+					submissions integer NOT NULL,
+					decisions integer NOT NULL,
+					minutes real NOT NULL,
+					PRIMARY KEY (weight_class, year)
+					)""")
+
+		# distribution of decision types per weight class and year
+		self.c.execute("""CREATE TABLE IF NOT EXISTS DecisionStats (
+					weight_class text NOT NULL,
+					year text NOT NULL,
+					decision text NOT NULL,
+					fights integer NOT NULL,
+					PRIMARY KEY (weight_class, year, decision)
+					)""")
+
+		self.c.execute("CREATE INDEX IF NOT EXISTS index_weight_class_year ON WeightClassYearStats(year)")
+		self.c.execute("CREATE INDEX IF NOT EXISTS index_decision_stats ON DecisionStats(decision, year)")
+
+		# refreshed years are selected by date range
+		self.c.execute("CREATE INDEX IF NOT EXISTS index_history_date ON HistoryData(match_date)")
+
+		return exists
+
+	def refresh_aggregates(self, ids = None):
+		""" build or refresh materialized aggregate tables 'CareerStats', 'WeightClassYearStats' and 'DecisionStats'
+			call this within a transaction after fighters are inserted
+		:param ids: list of inserted or replaced fighter ids, careers of them and all years they fought in are refreshed
+				None: rebuild all aggregates
+		:return:
+		"""
+
+		started = time.perf_counter()
+
+		if not self.create_aggregate_tables():
+			ids = None
+
+		careers = f"""INSERT INTO CareerStats (id, fights, wins, losses, draws, ko_wins, submission_wins, decision_wins,
+							first_date, last_date, minutes, strikes_landed, strikes_attempted, takedowns_landed, knockdowns)
+						SELECT h.id, COUNT(*), SUM(h.result='Win'), SUM(h.result='Loss'), SUM(h.result NOT IN ('Win', 'Loss')),
+							SUM(h.result='Win' AND {OUTCOME_CONDITIONS['ko']}), SUM(h.result='Win' AND {OUTCOME_CONDITIONS['submission']}),
+							SUM(h.result='Win' AND {OUTCOME_CONDITIONS['decision']}), MIN(h.match_date), MAX(h.match_date), TOTAL({MATCH_MINUTES}),
+							TOTAL(CAST(s.tsl AS integer)), TOTAL(CAST(s.tsa AS integer)), TOTAL(CAST(c.tdl AS integer)), TOTAL(CAST(s.kd AS integer))
+							FROM History h
+							LEFT JOIN StandingStatistics s ON s.id=h.id AND s.match_date=h.match_date AND s.opp_url=h.opp_url
+							LEFT JOIN ClinchStatistics c ON c.id=h.id AND c.match_date=h.match_date AND c.opp_url=h.opp_url
+							{{}}
+							GROUP BY h.id"""
+
+		# NOTE: a match is in the histories of both fighters, the row of the lower fighter id is counted like in get_rows_for_schema
+		matches = f"""WITH Matches AS (
+						SELECT COALESCE(f.weight_class, '') AS weight_class, substr(h.match_date, 1, 4) AS year, h.decision,
+							{OUTCOME_CONDITIONS['ko']} AS ko, {OUTCOME_CONDITIONS['submission']} AS submission,
+							{OUTCOME_CONDITIONS['decision']} AS decision_, {MATCH_MINUTES} AS minutes,
+							ROW_NUMBER() OVER (PARTITION BY h.match_date, h.match_time, MIN(h.id, COALESCE(h.opp_id, h.id)),
+								MAX(h.id, COALESCE(h.opp_id, h.id)) ORDER BY h.id) AS n
+							FROM History h JOIN Fighters f ON f.id=h.id
+							{{}})"""
+
+		weight_classes = matches + """
+						INSERT INTO WeightClassYearStats (weight_class, year, fights, kos, submissions, decisions, minutes)
+							SELECT weight_class, year, COUNT(*), SUM(ko), SUM(submission), SUM(decision_), TOTAL(minutes)
+							FROM Matches WHERE n=1 GROUP BY weight_class, year"""
+
+		decisions = matches + """
+						INSERT INTO DecisionStats (weight_class, year, decision, fights)
+							SELECT weight_class, year, decision, COUNT(*)
+							FROM Matches WHERE n=1 GROUP BY weight_class, year, decision"""
+
+		if ids is None:
+			for table in ('CareerStats', 'WeightClassYearStats', 'DecisionStats'):
+				self.c.execute(f"DELETE FROM {table}")
+
+			self.c.execute(careers.format(''))
+			self.c.execute(weight_classes.format(''))
+			self.c.execute(decisions.format(''))
+		else:
+			ids = json.dumps(list(ids))
+
+			# years of refreshed fighters before and after the refresh, matches against them are included
+			old = self.c.execute("""SELECT MIN(first_date), MAX(last_date) FROM CareerStats
+										WHERE id IN (SELECT value FROM json_each(?))""", (ids,)).fetchone()
+			new = self.c.execute("""SELECT MIN(match_date), MAX(match_date) FROM History
+										WHERE id IN (SELECT value FROM json_each(?)) OR opp_id IN (SELECT value FROM json_each(?))""", (ids, ids)).fetchone()
+
+			self.c.execute("DELETE FROM CareerStats WHERE id IN (SELECT value FROM json_each(?))", (ids,))
+			self.c.execute(careers.format('WHERE h.id IN (SELECT value FROM json_each(?))'), (ids,))
+
+			dates = [date for date in old + new if date is not None]
+
+			if len(dates) > 0:
+				first, last = min(dates)[:4], max(dates)[:4]
+
+				for table in ('WeightClassYearStats', 'DecisionStats'):
+					self.c.execute(f"DELETE FROM {table} WHERE year >= ? AND year <= ?", (first, last))
+
+				# NOTE: years are compared as text, e.g. '2019' < '2019-03-02' < '2020'
+				where = 'WHERE h.match_date >= ? AND h.match_date < ?'
+				val = (first, str(int(last) + 1))
+
+				self.c.execute(weight_classes.format(where), val)
+				self.c.execute(decisions.format(where), val)
+
+		metrics.observe('stage_seconds', time.perf_counter() - started, stage='aggregates')
+
+	def insert_into_table_fighters(self, id_, data):
+		""" insert given 'data' into table 'FighterData'(see view 'Fighters'), a fighter which is already in the table is updated
+
+		:param id_: unique fighter identifier, see get_fighter_id
+		:param data: dictionary of fighter general information
+		:return:
+		"""
+
+		if data is None or len(data) == 0:
+			return
+
+		sql = """INSERT INTO FighterData (id, name, age, url, height, weight, weight_class_id, reach, group_id) 
+						VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+					ON CONFLICT(id) DO UPDATE SET name=excluded.name, age=excluded.age, url=excluded.url, height=excluded.height,
+						weight=excluded.weight, weight_class_id=excluded.weight_class_id, reach=excluded.reach, group_id=excluded.group_id"""
+		val = None
+
+		try:
+			val = (id_, data['name'], data['age'], data['url'], data['height'], data['weight']
+				, self.get_lookup_id('WeightClasses', data['weight_class']), data['reach'], self.get_lookup_id('FighterGroups', data['group_name']))
+		except Exception as e:
+			print("Error(DB.Fighters): ", str(e))
+			return
+
+		if val != None:
+			try:
+				self.c.execute(sql, val)
+				metrics.inc('db_rows_inserted_total', table='Fighters')
+				# self.conn.commit()
+			except Exception as e:
+				print("Error while inserting into table 'Fighters':", str(e))
+				print("Query : ", sql, val)
+		
+	def insert_into_table_history(self, id_, data):
+		""" insert given 'data' into table 'HistoryData'(see view 'History')
+		:param id_: unique fighter identifier
+		:param data: list of sub lists
+		:return:
+		"""
+
+		if data is None:
+			return
+
+		inserted = 0
+
+		for item in data:
+			sql = """INSERT INTO HistoryData (id, match_date, event_id, opponent, opp_url, opp_id, result_id, decision_id, rnd, match_time) 
+							VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+			val = None
+
+			try:
+				opp_url = item['opp_url'] if 'opp_url' in item else None
+
+				opp_id, reason = self.resolve_opponent(item['OPPONENT'], opp_url)
+
+				if opp_id is None:
+					self.c.execute("""INSERT INTO UnresolvedOpponents (id, match_date, opponent, opp_url, reason)
+										VALUES (?, ?, ?, ?, ?)""", (id_, item['DATE'], item['OPPONENT'], opp_url, reason))
+
+				# opponent is kept only if it isn't the name of the resolved fighter
+				opponent = None if opp_id is not None and item['OPPONENT'] == self.id_to_name.get(opp_id) else item['OPPONENT']
+
+				val = (id_, item['DATE'], self.get_lookup_id('Events', item['EVENT']), opponent, opp_url, opp_id
+					, self.get_lookup_id('Results', item['RESULT']), self.get_lookup_id('Decisions', item['DECISION']), item['RND'], item['TIME'])
+			except Exception as e:
+				print("Error(DB.History): ", str(e))
+				continue
+
+			if val != None:
+				try:
+					self.c.execute(sql, val)
+					inserted += 1
+					# self.conn.commit()
+				except Exception as e:
+					print("Error while inserting into table 'History':", str(e))
+					print("Query : ", sql, val)
+
+		metrics.inc('db_rows_inserted_total', inserted, table='History')
+
+	def insert_into_table_standing_stats(self, id_, data):
+		""" insert given 'data' into table 'StandingStatistics'
+		:param id_: unique fighter identifier
+		:param data: list of sub lists
+		:return:
+		"""
+
+		if data is None:
+			return
+
+		inserted = 0
+
+		for item in data:
+			sql = """INSERT INTO StandingStatistics (id, match_date, opponent, opp_url, sdbl_a, sdhl_a, sdll_a, tsl, 
+													tsa, ssl, sa, kd, percent_body, percent_head, percent_leg) 
+							VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+			val = None
+
+			try:
+				if 'opp_url' in item:
+					val = (id_, item['DATE'], item['OPP'], item['opp_url'], item['SDBL/A'], item['SDHL/A'], item['SDLL/A']
+						, item['TSL'], item['TSA'], item['SSL'], item['SA'], item['KD'], item['PERCENTBODY'], item['PERCENTHEAD'], item['PERCENTLEG'])
+				else:
+					val = (id_, item['DATE'], item['OPP'], None, item['SDBL/A'], item['SDHL/A'], item['SDLL/A']
+						, item['TSL'], item['TSA'], item['SSL'], item['SA'], item['KD'], item['PERCENTBODY'], item['PERCENTHEAD'], item['PERCENTLEG'])
+			except Exception as e:
+				print("Error(DB.StandingStatistics): ", str(e))
+				continue
+
+			if val != None:
+				try:
+					self.c.execute(sql, val)
+					inserted += 1
+					# self.conn.commit()
+				except Exception as e:
+					print("Error while inserting into table 'StandingStatistics':", str(e))
+					print("Query : ", sql, val)
+
+		metrics.inc('db_rows_inserted_total', inserted, table='StandingStatistics')
+
+	def insert_into_table_clinch_stats(self, id_, data):
+		""" insert given 'data' into table 'ClinchStatistics'
+		:param id_: unique fighter identifier
+		:param data: list of sub lists
+		:return:
+		"""
+
+		if data is None:
+			return
+
+		inserted = 0
+
+		for item in data:
+			sql = """INSERT INTO ClinchStatistics (id, match_date, opponent, opp_url, scbl, scba, schl, scha, scll, 
+													scla, rv, sr, tdl, tda, tds, td_percent) 
+							VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+			val = None
+
+			try:
+				if 'opp_url' in item:
 					val = (id_, item['DATE'], item['OPP'], item['opp_url'], item['SCBL'], item['SCBA'], item['SCHL']
 						, item['SCHA'], item['SCLL'], item['SCLA'], item['RV'], item['SR'], item['TDL'], item['TDA'], item['TDS'], item['TDPERCENT'])
 				else:
@@ -365,11 +1167,14 @@ class UFCHistoryDB:
 			if val != None:
 				try:
 					self.c.execute(sql, val)
+					inserted += 1
 					# self.conn.commit()
 				except Exception as e:
 					print("Error while inserting into table 'ClinchStatistics':", str(e))
 					print("Query : ", sql, val)
 
+		metrics.inc('db_rows_inserted_total', inserted, table='ClinchStatistics')
+
 	def insert_into_table_ground_stats(self, id_, data):
 		""" insert given 'data' into table 'GroundStatistics'
 		:param id_: unique fighter identifier
@@ -380,6 +1185,8 @@ class UFCHistoryDB:
 		if data is None:
 			return
 
+		inserted = 0
+
 		for item in data:
 			sql = """INSERT INTO GroundStatistics (id, match_date, opponent, opp_url, sgbl, sgba, sghl, sgha, sgll, 
 													sgla, ad, adtb, adhg, adtm, adts, sm) 
@@ -400,19 +1207,319 @@ class UFCHistoryDB:
 			if val != None:
 				try:
 					self.c.execute(sql, val)
+					inserted += 1
 					# self.conn.commit()
 				except Exception as e:
 					print("Error while inserting into table 'GroundStatistics':", str(e))
 					print("Query : ", sql, val)
 
-	def write_to_excel(self, rows, file_name = 'ufc_history'):
+		metrics.inc('db_rows_inserted_total', inserted, table='GroundStatistics')
+
+	def delete_fighter_rows(self, id_):
+		""" delete matches and statistics of a fighter, so that they can be inserted again
+		:param id_: unique fighter identifier
+		:return:
+		"""
+
+		for table in ('HistoryData', 'UnresolvedOpponents', 'StandingStatistics', 'ClinchStatistics', 'GroundStatistics'):
+			self.c.execute(f"DELETE FROM {table} WHERE id=?", (id_,))
+
+	def insert_fetched(self, info_list, bar = None):
+		""" insert fetched data into database, call this within a transaction
+			fighters which are already in the database are replaced, so a database can be refreshed incrementally
+		:param info_list: list of fetched tuples(see scraper.fetch_fighter)
+		:param bar: optional progress bar updated per fighter
+		:return:
+		"""
+
+		# a fighter fetched twice is inserted once, the latest one wins
+		info_list = list({item[0]: item for item in info_list}.values())
+
+		# insert all fighters first so that opponents can be resolved to fighter ids
+		for item in info_list:
+			self.delete_fighter_rows(item[0])
+			self.insert_into_table_fighters(item[0], item[1])
+
+		self.build_fighter_maps()
+
+		# bulk insert into database
+		for counter, item in enumerate(info_list, 1): # loop through information list fetched
+			self.insert_into_table_history(item[0], item[2])
+			self.insert_into_table_standing_stats(item[0], item[3])
+			self.insert_into_table_clinch_stats(item[0], item[4])
+			self.insert_into_table_ground_stats(item[0], item[5])
+
+			# update progress bar
+			if bar is not None:
+				bar.update(counter)
+
+		self.bump_table_versions()
+
+		# spellings of opponents in the inserted histories become aliases
+		if self.has_name_index():
+			self.refresh_name_index([item[0] for item in info_list])
+
+	def data_version(self):
+		""" returns data version of the database, it changes whenever another connection commits
+		:param:
+		:return: integer version
+		"""
+
+		return self.c.execute("PRAGMA data_version").fetchone()[0]
+
+	def query(self, name, sql, val, one = False):
+		""" run a read query through the LRU cache
+			cache is invalidated when the data version of the database changes
+		:param name: name of the query, part of the cache key
+		:param sql: parameterized sql statement, sqlite3 keeps it prepared in the statement cache
+		:param val: tuple of parameters
+		:param one: True: return a single row or None, False: return list of rows
+		:return: dictionary or list of dictionaries keyed by column names
+		"""
+
+		self.query_cache.validate(self.data_version())
+
+		key = (name, val)
+
+		result = self.query_cache.get(key)
+
+		if result is not None:
+			return result
+
+		cursor = self.conn.execute(sql, val)
+		columns = [column[0] for column in cursor.description]
+
+		if one:
+			row = cursor.fetchone()
+			result = dict(zip(columns, row)) if row is not None else None
+		else:
+			result = [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+		cursor.close()
+
+		if result is not None:
+			self.query_cache.put(key, result)
+
+		return result
+
+	@staticmethod
+	def page_range(page, page_size):
+		""" returns limit and offset of given page
+		:param page: index of page, starting from 0
+		:param page_size: number of rows per page, clamped to max_page_size
+		:return: tuple of limit and offset
+		"""
+
+		page_size = max(1, min(int(page_size), UFCHistoryDB.max_page_size))
+
+		return page_size, max(0, int(page)) * page_size
+
+	def get_fighter(self, id_):
+		""" returns general information of a fighter
+		:param id_: unique fighter identifier
+		:return: dictionary of fighter or None
+		"""
+
+		sql = """SELECT id, name, age, url, height, weight, weight_class, reach, group_name
+						FROM Fighters WHERE id=?"""
+
+		return self.query('fighter', sql, (id_,), one = True)
+
+	def get_fighter_history(self, id_, page = 0, page_size = 50):
+		""" returns fight history of a fighter, latest match first
+		:param id_: unique fighter identifier
+		:param page: index of page, starting from 0
+		:param page_size: number of matches per page
+		:return: list of dictionaries
+		"""
+
+		sql = """SELECT match_date, event, opponent, opp_url, result, decision, rnd, match_time
+						FROM History WHERE id=?
+						ORDER BY match_date DESC LIMIT ? OFFSET ?"""
+
+		return self.query('fighter_history', sql, (id_,) + UFCHistoryDB.page_range(page, page_size))
+
+	def get_fight_stats(self, id_, match_date, opp_url):
+		""" returns standing, clinch and ground statistics of a fighter in a single fight
+		:param id_: unique fighter identifier
+		:param match_date: date of the match, 'YYYY-MM-DD'
+		:param opp_url: profile url of the opponent
+		:return: dictionary of statistics or None
+		"""
+
+		sql = """SELECT s.match_date, s.opponent, s.opp_url, sdbl_a, sdhl_a, sdll_a, tsl, tsa, ssl, ssa, sa, kd,
+						percent_body, percent_head, percent_leg,
+						scbl, scba, schl, scha, scll, scla, rv, sr, tdl, tda, tds, td_percent,
+						sgbl, sgba, sghl, sgha, sgll, sgla, ad, adtb, adhg, adtm, adts, sm
+						FROM StandingStatistics s
+						JOIN ClinchStatistics c ON c.id=s.id AND c.match_date=s.match_date AND c.opp_url=s.opp_url
+						JOIN GroundStatistics g ON g.id=s.id AND g.match_date=s.match_date AND g.opp_url=s.opp_url
+						WHERE s.id=? AND s.match_date=? AND s.opp_url=?"""
+
+		return self.query('fight_stats', sql, (id_, match_date, opp_url), one = True)
+
+	def get_head_to_head(self, id1, id2, page = 0, page_size = 50):
+		""" returns all matches between two fighters from the point of view of fighter 1, oldest first
+		:param id1: unique identifier of fighter 1
+		:param id2: unique identifier of fighter 2
+		:param page: index of page, starting from 0
+		:param page_size: number of matches per page
+		:return: list of dictionaries
+		"""
+
+		# NOTE: opponents of databases converted from an older version aren't resolved until the next ingest or merge,
+		# 		they're matched by profile url
+		sql = """SELECT match_date, event, opponent, opp_url, result, decision, rnd, match_time
+						FROM History WHERE id=? AND (opp_id=? OR (opp_id IS NULL AND opp_url=(SELECT url FROM Fighters WHERE id=?)))
+						ORDER BY match_date ASC LIMIT ? OFFSET ?"""
+
+		return self.query('head_to_head', sql, (id1, id2, id2) + UFCHistoryDB.page_range(page, page_size))
+
+	def find_fighters(self, name, page = 0, page_size = 50):
+		""" returns fighters whose name exactly matches 'name'
+		:param name: fighter name
+		:param page: index of page, starting from 0
+		:param page_size: number of fighters per page
+		:return: list of dictionaries
+		"""
+
+		sql = """SELECT id, name, age, url, height, weight, weight_class, reach, group_name
+						FROM Fighters WHERE name=? ORDER BY id LIMIT ? OFFSET ?"""
+
+		return self.query('find_fighters', sql, (name,) + UFCHistoryDB.page_range(page, page_size))
+
+	def search_fighters(self, text, page = 0, page_size = 50):
+		""" returns fighters whose name or alias contains all words of 'text', best match first
+			accents, case and punctuation are ignored, e.g. 'jose aldo' finds 'José Aldo'
+		:param text: full or partial name
+		:param page: index of page, starting from 0
+		:param page_size: number of fighters per page
+		:return: list of dictionaries
+		"""
+
+		key = UFCHistoryDB.normalize_name(text)
+
+		if key is None:
+			return []
+
+		words = key.split()
+
+		if not self.has_name_index():
+			# NOTE: databases without the name index are scanned
+			sql = f"""SELECT id, name, age, url, height, weight, weight_class, reach, group_name
+							FROM Fighters WHERE {' AND '.join(['name LIKE ?'] * len(words))}
+							ORDER BY id LIMIT ? OFFSET ?"""
+
+			return self.query('search_fighters', sql, tuple(f'%{word}%' for word in words) + UFCHistoryDB.page_range(page, page_size))
+
+		# NOTE: trigrams can't match words shorter than 3 characters, they're matched by LIKE
+		long_words = [word for word in words if len(word) >= 3]
+		short_words = [word for word in words if len(word) < 3]
+
+		conditions = []
+		val = ()
+
+		if len(long_words) > 0:
+			conditions.append('FighterNames MATCH ?')
+			val += (' AND '.join(f'"{word}"' for word in long_words),)
+
+		for word in short_words:
+			conditions.append("(n.name || ' ' || n.aliases) LIKE ?")
+			val += (f'%{word}%',)
+
+		# exact names first, then names starting with the text, then by relevance
+		sql = f"""SELECT f.id, f.name, f.age, f.url, f.height, f.weight, f.weight_class, f.reach, f.group_name
+						FROM FighterNames n JOIN Fighters f ON f.id=n.rowid
+						WHERE {' AND '.join(conditions)}
+						ORDER BY n.name=? DESC, n.name LIKE ? DESC, n.rank, f.id LIMIT ? OFFSET ?"""
+
+		return self.query('search_fighters', sql, val + (key, f'{key}%') + UFCHistoryDB.page_range(page, page_size))
+
+	def get_career_stats(self, id_):
+		""" returns career record and totals of a fighter, see refresh_aggregates
+		:param id_: unique fighter identifier
+		:return: dictionary or None
+		"""
+
+		sql = """SELECT id, fights, wins, losses, draws, ko_wins, submission_wins, decision_wins, first_date, last_date,
+						minutes, strikes_landed, strikes_attempted, takedowns_landed, knockdowns,
+						CASE WHEN minutes > 0 THEN strikes_landed / minutes END AS strikes_per_minute
+						FROM CareerStats WHERE id=?"""
+
+		return self.query('career_stats', sql, (id_,), one = True)
+
+	def get_weight_class_stats(self, weight_class):
+		""" returns number of matches, finishes and fight minutes of a weight class per year, see refresh_aggregates
+		:param weight_class: weight class of fighters, e.g. 'Lightweight'
+		:return: list of dictionaries, oldest year first
+		"""
+
+		sql = """SELECT weight_class, year, fights, kos, submissions, decisions, minutes,
+						CAST(kos + submissions AS real) / fights AS finish_rate
+						FROM WeightClassYearStats WHERE weight_class=? ORDER BY year"""
+
+		return self.query('weight_class_stats', sql, (weight_class,))
+
+	def get_decision_stats(self, weight_class, year):
+		""" returns number of matches per decision type of a weight class in a year, see refresh_aggregates
+		:param weight_class: weight class of fighters, e.g. 'Lightweight'
+		:param year: year, e.g. '2019'
+		:return: list of dictionaries, most frequent decision first
+		"""
+
+		sql = """SELECT decision, fights FROM DecisionStats
+						WHERE weight_class=? AND year=? ORDER BY fights DESC, decision"""
+
+		return self.query('decision_stats', sql, (weight_class, str(year)))
+
+	def get_matchup_index(self):
+		""" returns the in-memory matchup index of this database, see matchup.py
+		:param:
+		:return: MatchupIndex instance, built on first query
+		"""
+
+		if self.matchup_index is None:
+			# NOTE: matchup imports this module, so it's imported only when needed
+			from matchup import MatchupIndex
+
+			self.matchup_index = MatchupIndex(self)
+
+		return self.matchup_index
+
+	def get_matchup(self, id1, id2, match_date):
+		""" returns cumulative statistics of both fighters going into their fight on a date
+		:param id1: unique identifier of fighter 1
+		:param id2: unique identifier of fighter 2
+		:param match_date: date of the match, 'YYYY-MM-DD'
+		:return: dictionary of date and statistics of both fighters or None
+		"""
+
+		return self.get_matchup_index().get_matchup(id1, id2, match_date)
+
+	def get_common_opponents(self, id1, id2):
+		""" returns ids of opponents both fighters fought
+		:param id1: unique identifier of fighter 1
+		:param id2: unique identifier of fighter 2
+		:return: sorted list of fighter ids
+		"""
+
+		return self.get_matchup_index().get_common_opponents(id1, id2)
+
+
+	@staticmethod
+	def write_to_excel(rows, file_name = 'ufc_history'):
 		""" writes rows to excel
 		param rows: a list of dictionaries
 		return: number of rows written successfully
 		"""
 
+		# NOTE: xlsxwriter is imported only when excel is actually written
+		from excel import ExcelWriter
+
 		# create an excel writer instance
-		xw = ExcelWriter(file_name)
+		# NOTE: streaming mode keeps memory bounded regardless of the number of rows,
+		# 		rows are written in ascending order so it's safe here
+		xw = ExcelWriter(file_name, streaming = True)
 		
 		# create horizontal header
 		xw.set_header_list(xw.header_list)
@@ -428,114 +1535,17 @@ class UFCHistoryDB:
 
 		# write to excel file
 		# NOTE: Using dictionary rather than list makes it easier to change/revise and maintain
-		# can easily understand what is what
+		# 		column order is driven by ExcelWriter.header_list, a whole row is written at once
 		for row in rows:
 			if row is None or len(row) == 0:
 				continue
-			try:
-				xw.write_to_sheet(row_index, 0, row['Date'])
-				xw.write_to_sheet(row_index, 1, row['WeightClass'])
-				xw.write_to_sheet(row_index, 2, row['Winner'])
-				xw.write_to_sheet(row_index, 3, row['DecisionType'])
-				xw.write_to_sheet(row_index, 4, row['Rounds'])
-				xw.write_to_sheet(row_index, 5, row['Time'])
-				xw.write_to_sheet(row_index, 6, row['IsTitle?'])
-
-				if 'F1Name' in row:
-					xw.write_to_sheet(row_index, 7, row['F1Name'])
-					xw.write_to_sheet(row_index, 8, row['F1Height'])
-					xw.write_to_sheet(row_index, 9, row['F1Reach'])
-					xw.write_to_sheet(row_index, 10, row['F1Age'])
-
-				if 'F1SDBL' in row:
-					xw.write_to_sheet(row_index, 11, row['F1SDBL'])
-					xw.write_to_sheet(row_index, 12, row['F1SDBA'])
-					xw.write_to_sheet(row_index, 13, row['F1SDHL'])
-					xw.write_to_sheet(row_index, 14, row['F1SDHA'])
-					xw.write_to_sheet(row_index, 15, row['F1SDLL'])
-					xw.write_to_sheet(row_index, 16, row['F1SDLA'])
-					xw.write_to_sheet(row_index, 17, row['F1TSL'])
-					xw.write_to_sheet(row_index, 18, row['F1TSA'])
-					xw.write_to_sheet(row_index, 19, row['F1SSL'])
-					xw.write_to_sheet(row_index, 20, row['F1SSA'])
-					xw.write_to_sheet(row_index, 21, row['F1SA'])
-					xw.write_to_sheet(row_index, 22, row['F1KD'])
-
-					xw.write_to_sheet(row_index, 23, row['F1SCBL'])
-					xw.write_to_sheet(row_index, 24, row['F1SCBA'])
-					xw.write_to_sheet(row_index, 25, row['F1SCHL'])
-					xw.write_to_sheet(row_index, 26, row['F1SCHA'])
-					xw.write_to_sheet(row_index, 27, row['F1SCLL'])
-					xw.write_to_sheet(row_index, 28, row['F1SCLA'])
-					xw.write_to_sheet(row_index, 29, row['F1RV'])
-					xw.write_to_sheet(row_index, 30, row['F1SR'])
-					xw.write_to_sheet(row_index, 31, row['F1TDL'])
-					xw.write_to_sheet(row_index, 32, row['F1TDA'])
-					xw.write_to_sheet(row_index, 33, row['F1TDS'])
-
-					xw.write_to_sheet(row_index, 34, row['F1SGBL'])
-					xw.write_to_sheet(row_index, 35, row['F1SGBA'])
-					xw.write_to_sheet(row_index, 36, row['F1SGHL'])
-					xw.write_to_sheet(row_index, 37, row['F1SGHA'])
-					xw.write_to_sheet(row_index, 38, row['F1SGLL'])
-					xw.write_to_sheet(row_index, 39, row['F1SGLA'])
-					xw.write_to_sheet(row_index, 40, row['F1AD'])
-					xw.write_to_sheet(row_index, 41, row['F1ADTB'])
-					xw.write_to_sheet(row_index, 42, row['F1ADHG'])
-					xw.write_to_sheet(row_index, 43, row['F1ADTM'])
-					xw.write_to_sheet(row_index, 44, row['F1ADTS'])
-					xw.write_to_sheet(row_index, 45, row['F1SM'])
-
-				if 'F2Name' in row:
-					xw.write_to_sheet(row_index, 46, row['F2Name'])
-					xw.write_to_sheet(row_index, 47, row['F2Height'])
-					xw.write_to_sheet(row_index, 48, row['F2Reach'])
-					xw.write_to_sheet(row_index, 49, row['F2Age'])
-
-				if 'F2SDBL' in row:
-					xw.write_to_sheet(row_index, 50, row['F2SDBL'])
-					xw.write_to_sheet(row_index, 51, row['F2SDBA'])
-					xw.write_to_sheet(row_index, 52, row['F2SDHL'])
-					xw.write_to_sheet(row_index, 53, row['F2SDHA'])
-					xw.write_to_sheet(row_index, 54, row['F2SDLL'])
-					xw.write_to_sheet(row_index, 55, row['F2SDLA'])
-					xw.write_to_sheet(row_index, 56, row['F2TSL'])
-					xw.write_to_sheet(row_index, 57, row['F2TSA'])
-					xw.write_to_sheet(row_index, 58, row['F2SSL'])
-					xw.write_to_sheet(row_index, 59, row['F2SSA'])
-					xw.write_to_sheet(row_index, 60, row['F2SA'])
-					xw.write_to_sheet(row_index, 61, row['F2KD'])
-
-					xw.write_to_sheet(row_index, 62, row['F2SCBL'])
-					xw.write_to_sheet(row_index, 63, row['F2SCBA'])
-					xw.write_to_sheet(row_index, 64, row['F2SCHL'])
-					xw.write_to_sheet(row_index, 65, row['F2SCHA'])
-					xw.write_to_sheet(row_index, 66, row['F2SCLL'])
-					xw.write_to_sheet(row_index, 67, row['F2SCLA'])
-					xw.write_to_sheet(row_index, 68, row['F2RV'])
-					xw.write_to_sheet(row_index, 69, row['F2SR'])
-					xw.write_to_sheet(row_index, 70, row['F2TDL'])
-					xw.write_to_sheet(row_index, 71, row['F2TDA'])
-					xw.write_to_sheet(row_index, 72, row['F2TDS'])
-
-					xw.write_to_sheet(row_index, 73, row['F2SGBL'])
-					xw.write_to_sheet(row_index, 74, row['F2SGBA'])
-					xw.write_to_sheet(row_index, 75, row['F2SGHL'])
-					xw.write_to_sheet(row_index, 76, row['F2SGHA'])
-					xw.write_to_sheet(row_index, 77, row['F2SGLL'])
-					xw.write_to_sheet(row_index, 78, row['F2SGLA'])
-					xw.write_to_sheet(row_index, 79, row['F2AD'])
-					xw.write_to_sheet(row_index, 80, row['F2ADTB'])
-					xw.write_to_sheet(row_index, 81, row['F2ADHG'])
-					xw.write_to_sheet(row_index, 82, row['F2ADTM'])
-					xw.write_to_sheet(row_index, 83, row['F2ADTS'])
-					xw.write_to_sheet(row_index, 84, row['F2SM'])
-			except Exception as e:
-				print(f'Failed to write to excel due to error: {str(e)}')
-			finally:
-				row_index += 1
 
-				xw_bar.update(row_index - 4)
+			if not xw.write_dict_row(row_index, row):
+				print(f'Failed to write row {row_index} to excel')
+
+			row_index += 1
+
+			xw_bar.update(row_index - 4)
 
 		# save the file and close safely
 		xw.done()
@@ -567,28 +1577,35 @@ class UFCHistoryDB:
 
 		return result
 
-	def get_rows(self, index, rows, db_file):
-		""" get rows within id_list
-		param index: thread index
-		param rows: list of match info and fighter 1's info
+	@staticmethod
+	def get_rows(rows, db_file, profile = None):
+		""" build match dictionaries of a date range of matches
+			this runs in a worker process, each worker opens its own connection to the database
+		param rows: list of match info and fighter 1's info, see get_rows_for_schema
 		param db_file: absolute path to the database file
-		return: 
+		param profile: name of pragma profile, see DB_PROFILES
+		return: tuple of list of match dictionaries in order of rows(empty dictionary for skipped ones) and elapsed seconds
+				raises an exception if the database can't be read, a partial result would drop matches of the range
 		"""
 
+		result = []
+
 		try:
 			conn_ = sqlite3.connect(db_file)
 
+			UFCHistoryDB.apply_profile(conn_, profile)
+
 			cursor = conn_.cursor()
 		except Exception as e:
-			print(f'Thread({index}): Cannot connect to database {db_file}')
-			return
-		
+			print(f'Error(DB.get_rows): Cannot connect to database {db_file}. {str(e)}')
+			raise e
+
+		started = time.perf_counter()
 
 		for row in rows:
 
 			if row is None or len(row) == 0:
-				self.rows_for_schema.append({})
-				self.get_rows_bar.update(len(self.rows_for_schema))
+				result.append({})
 				continue
 
 			# dictionary to contain match information
@@ -722,9 +1739,15 @@ class UFCHistoryDB:
 
 			# Fighter 2 General Information
 			
-			sql = "SELECT id, name, height, reach, age FROM Fighters WHERE name=? and url=?"
+			# opponent id is resolved at ingest, fall back to name and url for old databases
+			if row[15] is not None:
+				sql = "SELECT id, name, height, reach, age FROM Fighters WHERE id=?"
 
-			val = (str(row[12]).strip(), row[14] if row[14] is not None else str(''))
+				val = (row[15],)
+			else:
+				sql = "SELECT id, name, height, reach, age FROM Fighters WHERE name=? and url=?"
+
+				val = (str(row[12]).strip(), row[14] if row[14] is not None else str(''))
 
 			try:
 				sql_result = cursor.execute(sql, val).fetchone()
@@ -741,8 +1764,7 @@ class UFCHistoryDB:
 				print("Cannot get fighter 2 information due to above error.")
 
 			if 'F2Id' not in dictionary: # skip over if identifier of fighter 2 is not avaiable
-				self.rows_for_schema.append({})
-				self.get_rows_bar.update(len(self.rows_for_schema))
+				result.append({})
 				continue
 
 			# Fighter 2 Statistics Information
@@ -774,434 +1796,777 @@ class UFCHistoryDB:
 					dictionary['F2SA'] = UFCHistoryDB.atoi(sql_result[7])
 					dictionary['F2KD'] = UFCHistoryDB.atoi(sql_result[8])
 
-					dictionary['F2SCBL'] = UFCHistoryDB.atoi(sql_result[9])
-					dictionary['F2SCBA'] = UFCHistoryDB.atoi(sql_result[10])
-					dictionary['F2SCHL'] = UFCHistoryDB.atoi(sql_result[11])
-					dictionary['F2SCHA'] = UFCHistoryDB.atoi(sql_result[12])
-					dictionary['F2SCLL'] = UFCHistoryDB.atoi(sql_result[13])
-					dictionary['F2SCLA'] = UFCHistoryDB.atoi(sql_result[14])
-					dictionary['F2RV'] = UFCHistoryDB.atoi(sql_result[15])
-					dictionary['F2SR'] = UFCHistoryDB.atoi(sql_result[16])
-					dictionary['F2TDL'] = UFCHistoryDB.atoi(sql_result[17])
-					dictionary['F2TDA'] = UFCHistoryDB.atoi(sql_result[18])
-					dictionary['F2TDS'] = UFCHistoryDB.atoi(sql_result[19])
+					dictionary['F2SCBL'] = UFCHistoryDB.atoi(sql_result[9])
+					dictionary['F2SCBA'] = UFCHistoryDB.atoi(sql_result[10])
+					dictionary['F2SCHL'] = UFCHistoryDB.atoi(sql_result[11])
+					dictionary['F2SCHA'] = UFCHistoryDB.atoi(sql_result[12])
+					dictionary['F2SCLL'] = UFCHistoryDB.atoi(sql_result[13])
+					dictionary['F2SCLA'] = UFCHistoryDB.atoi(sql_result[14])
+					dictionary['F2RV'] = UFCHistoryDB.atoi(sql_result[15])
+					dictionary['F2SR'] = UFCHistoryDB.atoi(sql_result[16])
+					dictionary['F2TDL'] = UFCHistoryDB.atoi(sql_result[17])
+					dictionary['F2TDA'] = UFCHistoryDB.atoi(sql_result[18])
+					dictionary['F2TDS'] = UFCHistoryDB.atoi(sql_result[19])
+
+					dictionary['F2SGBL'] = UFCHistoryDB.atoi(sql_result[20])
+					dictionary['F2SGBA'] = UFCHistoryDB.atoi(sql_result[21])
+					dictionary['F2SGHL'] = UFCHistoryDB.atoi(sql_result[22])
+					dictionary['F2SGHA'] = UFCHistoryDB.atoi(sql_result[23])
+					dictionary['F2SGLL'] = UFCHistoryDB.atoi(sql_result[24])
+					dictionary['F2SGLA'] = UFCHistoryDB.atoi(sql_result[25])
+					dictionary['F2AD'] = UFCHistoryDB.atoi(sql_result[26])
+					dictionary['F2ADTB'] = UFCHistoryDB.atoi(sql_result[27])
+					dictionary['F2ADHG'] = UFCHistoryDB.atoi(sql_result[28])
+					dictionary['F2ADTM'] = UFCHistoryDB.atoi(sql_result[29])
+					dictionary['F2ADTS'] = UFCHistoryDB.atoi(sql_result[30])
+					dictionary['F2SM'] = UFCHistoryDB.atoi(sql_result[31])
+			except Exception as e:
+				print(f'Error(DB.get_rows_for_schema): {str(e)}')
+				print("Cannot get Statistics information due to above error(F2).")
+
+			# fill up missing entries with empty string
+			if 'F2SDBL' not in dictionary:
+				dictionary['F2SDBL'] = 0
+				dictionary['F2SDBA'] = 0
+				dictionary['F2SDHL'] = 0
+				dictionary['F2SDHA'] = 0
+				dictionary['F2SDLL'] = 0
+				dictionary['F2SDLA'] = 0
+				dictionary['F2TSL'] = 0
+				dictionary['F2TSA'] = 0
+				dictionary['F2SSL'] = 0
+				dictionary['F2SSA'] = 0
+				dictionary['F2SA'] = 0
+				dictionary['F2KD'] = 0
+
+				dictionary['F2SCBL'] = 0
+				dictionary['F2SCBA'] = 0
+				dictionary['F2SCHL'] = 0
+				dictionary['F2SCHA'] = 0
+				dictionary['F2SCLL'] = 0
+				dictionary['F2SCLA'] = 0
+				dictionary['F2RV'] = 0
+				dictionary['F2SR'] = 0
+				dictionary['F2TDL'] = 0
+				dictionary['F2TDA'] = 0
+				dictionary['F2TDS'] = 0
+
+				dictionary['F2SGBL'] = 0
+				dictionary['F2SGBA'] = 0
+				dictionary['F2SGHL'] = 0
+				dictionary['F2SGHA'] = 0
+				dictionary['F2SGLL'] = 0
+				dictionary['F2SGLA'] = 0
+				dictionary['F2AD'] = 0
+				dictionary['F2ADTB'] = 0
+				dictionary['F2ADHG'] = 0
+				dictionary['F2ADTM'] = 0
+				dictionary['F2ADTS'] = 0
+				dictionary['F2SM'] = 0
+
+			result.append(dictionary)
+
+		cursor.close()
+
+		conn_.close()
+
+		return result, time.perf_counter() - started
+
+	@staticmethod
+	def get_date_partitions(rows, count):
+		""" split rows sorted by date into contiguous date ranges of similar size
+			matches of the same date always fall into the same partition
+		param rows: list of rows sorted by date, date is the first column
+		param count: maximum number of partitions
+		return: list of lists of rows, in order of dates
+		"""
+
+		size = max(1, -(-len(rows) // max(1, count)))
+
+		partitions = []
+		start = 0
+
+		while start < len(rows):
+			end = min(start + size, len(rows))
+
+			# move the boundary to the end of the date
+			while end < len(rows) and rows[end][0] == rows[end - 1][0]:
+				end += 1
+
+			partitions.append(rows[start:end])
+			start = end
+
+		return partitions
+
+	@staticmethod
+	def deduplicate_rows(rows):
+		""" get rid of duplicated matches and sort them by date
+			every match is registered by both fighters, the first registration in order of rows is kept
+		param rows: list of match dictionaries, empty dictionaries are skipped
+		return: deduplicated list of match dictionaries sorted by date
+		"""
+
+		done = set()
+		result = []
+
+		for row in rows:
+			if 'Date' not in row: # skip over empty row
+				continue
+			# NOTE: need to pay attention to picking those keys to remove duplicates
+			# 		and not to remove different matches on the same date
+			d = (row['Date'], row['Winner'], row['Time'])
+			if d not in done:
+				done.add(d)
+				result.append(row)
+
+		# sort list by date, stable so that the order of rows breaks ties
+		result.sort(key = lambda x : (x['Date'], x['Winner'], x['IsTitle?']))
+
+		return result
+
+	def export_rows(self, result):
+		""" build requested outputs(see export_outputs) from the export dataset
+		param result: deduplicated list of match dictionaries sorted by date
+		return:
+		"""
+
+		import export
+
+		# build all requested outputs concurrently
+		export.export_outputs(result, self.export_outputs if self.export_outputs is not None else export.DEFAULT_OUTPUTS, delta = self.export_delta)
+
+		profiler.snapshot('exported')
+
+		print(f'{len(result)} matches are registered!')
+
+	def write_match_history(self, rows, is_sum = False, write_to_db = False, db_name = 'match_history.db'):
+		""" write match history to a database
+		param rows: actual data list
+		param db_name: match history database name
+		param is_sum: True: get sum of each statistics value up to the match point, False: just write the statistic value of that match
+		return:
+		"""
+
+		if is_sum:
+			rows_ = UFCHistoryDB.get_match_history_sums(rows)
+		else:
+			rows_ = rows
+
+		# write sumed rows to excel
+		try:
+			self.write_to_excel(rows_, 'ufc_history_sum')
+			UFCHistoryDB.write_royce_history()
+		except Exception as e:
+			print(f'Failed to write excel file: {str(e)}')
+
+		# write match history into database, only new matches are summed up
+		if write_to_db:
+			if is_sum:
+				UFCHistoryDB.update_match_history_db(rows, db_name)
+			else:
+				UFCHistoryDB.write_match_history_to_db(rows_, db_name, False)
+
+		print('Writing match history done!')
+
+	@staticmethod
+	def get_fighter_components(rows):
+		""" group matches by connected component of the fighter graph, fighters are linked by their fights
+			sums of a match only depend on earlier matches of the same component
+		param rows: list of match dictionaries
+		return: list of lists of row indices, one per component in order of its first match
+		"""
+
+		# union-find of fighter ids
+		parents = {}
+
+		def find(id_):
+			root = id_
+			while parents[root] != root:
+				root = parents[root]
+
+			# compress the path
+			while parents[id_] != root:
+				parents[id_], id_ = root, parents[id_]
+
+			return root
+
+		for row in rows:
+			if row is None or 'F1Id' not in row or 'F2Id' not in row:
+				continue
+
+			parents.setdefault(row['F1Id'], row['F1Id'])
+			parents.setdefault(row['F2Id'], row['F2Id'])
+
+			root1 = find(row['F1Id'])
+			root2 = find(row['F2Id'])
+
+			if root1 != root2:
+				parents[root2] = root1
+
+		components = OrderedDict()
+
+		for index, row in enumerate(rows):
+			# NOTE: empty and broken rows are skipped while summing, they can go anywhere
+			if row is None or 'F1Id' not in row or 'F2Id' not in row:
+				key = None
+			else:
+				key = find(row['F1Id'])
+
+			components.setdefault(key, []).append(index)
+
+		return list(components.values())
+
+	@staticmethod
+	def sum_rows(rows):
+		""" get sum of each statistics value up to the match point for both fighters
+			this runs in a worker process, all matches of a fighter must be in the same list
+		param rows: actual data list, make sure it's sorted by date
+		return: list of summed rows in order of rows, None for skipped ones
+		"""
+
+		rows_ = []
+
+		sums = []
+
+		for row in rows: # iterate over the list
+			if row is None or len(row) == 0:
+				sums.append(None)
+				continue
+
+			try:
+
+				result = {}
+				
+				is_fighter1_done = False
+				is_fighter2_done = False
+
+				# seek for the last matching match history of both fighters(fighter1 and fighter2) in reversed order
+				# make sure that the source list is already sorted by date
+				for r in reversed(rows_):
+					if not is_fighter1_done: # need to seek for fighter 1's last history
+						if r['F1Id'] == row['F1Id'] and not (r['Date'] == row['Date'] and r['Winner'] == row['Winner'] and r['Time'] == row['Time']):
+							for key, value in r.items():
+								if key.startswith('F1') and not (key.endswith('Name') or key.endswith('Height') or key.endswith('Reach') or key.endswith('Reach') or key.endswith('Age') or key.endswith('Id')):
+									result[key] = value
+
+							is_fighter1_done = True
+
+						if r['F2Id'] == row['F1Id'] and not (r['Date'] == row['Date'] and r['Winner'] == row['Winner'] and r['Time'] == row['Time']):
+							for key, value in r.items():
+								if key.startswith('F2') and not (key.endswith('Name') or key.endswith('Height') or key.endswith('Reach') or key.endswith('Reach') or key.endswith('Age') or key.endswith('Id')):
+									result[key.replace('F2', 'F1')] = value	
+
+							is_fighter1_done = True
+
+					if not is_fighter2_done: # need to seek for fighter 2's last history
+						if r['F1Id'] == row['F2Id'] and not (r['Date'] == row['Date'] and r['Winner'] == row['Winner'] and r['Time'] == row['Time']):
+							for key, value in r.items():
+								if key.startswith('F1') and not (key.endswith('Name') or key.endswith('Height') or key.endswith('Reach') or key.endswith('Reach') or key.endswith('Age') or key.endswith('Id')):
+									result[key.replace('F1', 'F2')] = value
+
+							is_fighter2_done = True
+
+						if r['F2Id'] == row['F2Id'] and not (r['Date'] == row['Date'] and r['Winner'] == row['Winner'] and r['Time'] == row['Time']):
+							for key, value in r.items():
+								if key.startswith('F2') and not (key.endswith('Name') or key.endswith('Height') or key.endswith('Reach') or key.endswith('Reach') or key.endswith('Age') or key.endswith('Id')):
+									result[key] = value
+
+							is_fighter2_done = True
+
+					if is_fighter1_done and is_fighter2_done:
+						break
+
+				# no prior match history, only need to consider current statistics
+				if result is None or len(result) == 0:
+					result = row
+				else:
+
+					if 'F1SDBL' not in result: # fighter 1's history was not found
+						for key, value in row.items():
+							if key.startswith('F2') and not (key.endswith('Name') or key.endswith('Height') or key.endswith('Reach') or key.endswith('Reach') or key.endswith('Age') or key.endswith('Id')):
+								result[key] += value
+							else:
+								result[key] = value
+
+					elif 'F2SDBL' not in result: # fighter 2's history was not found
+						for key, value in row.items():
+							if key.startswith('F1') and not (key.endswith('Name') or key.endswith('Height') or key.endswith('Reach') or key.endswith('Reach') or key.endswith('Age') or key.endswith('Id')):
+								result[key] += value
+							else:
+								result[key] = value
+
+					else:
+						# sum up prior statistics with current one
+						for key, value in row.items():
+							if (key.startswith('F1') or key.startswith('F2')) and not (key.endswith('Name') or key.endswith('Height') or key.endswith('Reach') or key.endswith('Reach') or key.endswith('Age') or key.endswith('Id')):
+								result[key] += value
+							else:
+								result[key] = value
 
-					dictionary['F2SGBL'] = UFCHistoryDB.atoi(sql_result[20])
-					dictionary['F2SGBA'] = UFCHistoryDB.atoi(sql_result[21])
-					dictionary['F2SGHL'] = UFCHistoryDB.atoi(sql_result[22])
-					dictionary['F2SGHA'] = UFCHistoryDB.atoi(sql_result[23])
-					dictionary['F2SGLL'] = UFCHistoryDB.atoi(sql_result[24])
-					dictionary['F2SGLA'] = UFCHistoryDB.atoi(sql_result[25])
-					dictionary['F2AD'] = UFCHistoryDB.atoi(sql_result[26])
-					dictionary['F2ADTB'] = UFCHistoryDB.atoi(sql_result[27])
-					dictionary['F2ADHG'] = UFCHistoryDB.atoi(sql_result[28])
-					dictionary['F2ADTM'] = UFCHistoryDB.atoi(sql_result[29])
-					dictionary['F2ADTS'] = UFCHistoryDB.atoi(sql_result[30])
-					dictionary['F2SM'] = UFCHistoryDB.atoi(sql_result[31])
 			except Exception as e:
-				print(f'Error(DB.get_rows_for_schema): {str(e)}')
-				print("Cannot get Statistics information due to above error(F2).")
+				print(f'Exception while getting sums(DB.write_match_history_to_db): {str(e)}')
+				sums.append(None)
+				continue
 
-			# fill up missing entries with empty string
-			if 'F2SDBL' not in dictionary:
-				dictionary['F2SDBL'] = 0
-				dictionary['F2SDBA'] = 0
-				dictionary['F2SDHL'] = 0
-				dictionary['F2SDHA'] = 0
-				dictionary['F2SDLL'] = 0
-				dictionary['F2SDLA'] = 0
-				dictionary['F2TSL'] = 0
-				dictionary['F2TSA'] = 0
-				dictionary['F2SSL'] = 0
-				dictionary['F2SSA'] = 0
-				dictionary['F2SA'] = 0
-				dictionary['F2KD'] = 0
+			rows_.append(result)
+			sums.append(result)
 
-				dictionary['F2SCBL'] = 0
-				dictionary['F2SCBA'] = 0
-				dictionary['F2SCHL'] = 0
-				dictionary['F2SCHA'] = 0
-				dictionary['F2SCLL'] = 0
-				dictionary['F2SCLA'] = 0
-				dictionary['F2RV'] = 0
-				dictionary['F2SR'] = 0
-				dictionary['F2TDL'] = 0
-				dictionary['F2TDA'] = 0
-				dictionary['F2TDS'] = 0
+		return sums
 
-				dictionary['F2SGBL'] = 0
-				dictionary['F2SGBA'] = 0
-				dictionary['F2SGHL'] = 0
-				dictionary['F2SGHA'] = 0
-				dictionary['F2SGLL'] = 0
-				dictionary['F2SGLA'] = 0
-				dictionary['F2AD'] = 0
-				dictionary['F2ADTB'] = 0
-				dictionary['F2ADHG'] = 0
-				dictionary['F2ADTM'] = 0
-				dictionary['F2ADTS'] = 0
-				dictionary['F2SM'] = 0
+	@staticmethod
+	def get_match_history_sums(rows, workers = None, aligned = False):
+		""" get sum of each statistics value up to the match point for both fighters
+			connected components of the fighter graph(see get_fighter_components) are summed up in worker processes
+		param rows: actual data list, make sure it's sorted by date
+		param workers: number of worker processes, None: cpu count
+		param aligned: True: keep None in place of rows which couldn't be summed up, so that sums[i] is the sum of rows[i]
+		return: list of summed rows
+		"""
 
-			self.rows_for_schema.append(dictionary)
-			
-			self.get_rows_bar.update(len(self.rows_for_schema))
+		print('Doing the sum on statistics...')
 
-		cursor.close()
+		if workers is None:
+			workers = os.cpu_count() or 1
 
-		conn_.close()
+		sum_bar = progressbar.ProgressBar(maxval=len(rows), \
+								widgets=['SUM:', progressbar.Bar('=', '[', ']'), ' ', progressbar.Percentage(), ' | ', progressbar.Counter(), '/', str(len(rows))])
 
-		self.thread_counter += 1
+		sum_bar.start()
 
-		# check whether all threads are finished and then write to excel
-		# remove temp files and folder
+		components = UFCHistoryDB.get_fighter_components(rows)
 
-		if self.thread_counter >= self.thread_count:
-			self.get_rows_bar.update(self.total_row_count)
-			self.get_rows_bar.finish()
-			print('All threads are finished!')
+		# NOTE: small datasets aren't worth starting processes
+		if workers <= 1 or len(components) <= 1 or len(rows) < MIN_PARALLEL_SUM_ROWS:
+			sums = UFCHistoryDB.sum_rows(rows)
+		else:
+			# distribute components over workers, largest first onto the least loaded one
+			partitions = [[] for _ in range(min(workers, len(components)))]
 
-			# get rid of duplicates
-			done = []
-			result = []
-			for row in self.rows_for_schema:
-				if 'Date' not in row: # skip over empty row
-					continue
-				# NOTE: need to pay attention to picking those keys to remove duplicates 
-				# 		and not to remove different matches on the same date
-				d = (row['Date'], row['Winner'], row['Time'])
-				if d not in done:
-					done.append(d)
-					result.append(row)
+			for component in sorted(components, key = len, reverse = True):
+				min(partitions, key = len).extend(component)
 
-			# sort list by date
-			result = sorted(result, key = lambda x : (x['Date'], x['Winner'], x['IsTitle?']))
+			partitions = [sorted(partition) for partition in partitions if len(partition) > 0]
 
-			try:
-				self.write_to_excel(result)
-			except Exception as e:
-				print(f'Failed to write to excel due to error: {str(e)}')
-			
-			self.write_match_history(result, is_sum = True, write_to_db = True)
+			# summed rows in order of rows, partitions are merged back by indices
+			sums = [None] * len(rows)
+			processed = 0
 
-			try:
-				UFCHistoryDB.write_pickle_file(result)
-			except Exception as e:
-				print(f'Failed to write pickle file due to error: {str(e)}')
+			with ProcessPoolExecutor(max_workers = len(partitions)) as pool:
 
-			try:
-				rmtree(self.tmp_dir)
-			except Exception as e:
-				pass
+				futures = {pool.submit(UFCHistoryDB.sum_rows, [rows[index] for index in partition]): partition for partition in partitions}
 
-			print(f'{len(result)} matches are registered!')
+				for future in as_completed(futures):
+					partition = futures[future]
 
-			# code for test unpickling
-			# unpickled_data = UFCHistoryDB.read_pickle_file()
-			# for row in unpickled_data:
-			# 	print(row)
-			# 	print()
+					try:
+						for index, result in zip(partition, future.result()):
+							sums[index] = result
+					except Exception as e:
+						print(f'Exception while getting sums(DB.get_match_history_sums): {str(e)}')
 
-	def write_match_history(self, rows, is_sum = False, write_to_db = False, db_name = 'match_history.db'):
-		""" write match history to a database
-		param rows: actual data list
-		param db_name: match history database name
-		param is_sum: True: get sum of each statistics value up to the match point, False: just write the statistic value of that match
+					processed += len(partition)
+					sum_bar.update(processed)
+
+		rows_ = sums if aligned else [result for result in sums if result is not None]
+
+		sum_bar.update(len(rows))
+		sum_bar.finish()
+
+		metrics.inc('sum_components_total', len(components))
+
+		print('Doing the sum of statistics is done!')
+
+		return rows_
+
+	@staticmethod
+	def write_royce_history():
+		""" write royce history workbooks
+		param:
 		return:
 		"""
 
-		rows_ = []
+		royce_list = []
+		royce_sum = []
 
-		if is_sum:
+		UFCHistoryDB.write_to_excel(royce_list, 'royce_history')
+		UFCHistoryDB.write_to_excel(royce_sum, 'royce_sum')
 
-			print('Doing the sum on statistics...')
+	@staticmethod
+	def write_match_history_to_db(rows_, db_name = 'match_history.db', is_sum = True):
+		""" write (summed) match history rows into table 'MatchHistory' of database 'db_name'
+			existing database file is removed first
+		param rows_: list of match rows
+		param db_name: match history database name
+		param is_sum: True: rows are summed, running totals of fighters are written into table 'RunningTotals'
+		return:
+		"""
 
-			sum_bar = progressbar.ProgressBar(maxval=len(rows), \
-									widgets=['SUM:', progressbar.Bar('=', '[', ']'), ' ', progressbar.Percentage(), ' | ', progressbar.Counter(), '/', str(len(rows))])
+		try:
+			os.remove(db_name)
+		except Exception as e:
+			# print(f'Failed to remove old db file: {str(e)}')
+			pass
 
-			sum_bar.start()
+		conn_ = None
+		cursor = None
 
-			royce_list = []
-			royce_sum = []
+		try:
+			conn_ = sqlite3.connect(db_name)
+			UFCHistoryDB.apply_profile(conn_, 'bulk')
+			cursor = conn_.cursor()
+		except Exception as e:
+			print(f'Exception(DB.write_match_history_to_db): Cannot connect to database {db_name} : {str(e)}')
+			return
 
-			index = 0
+		if conn_ is None or cursor is None:
+			print('Failed to connect database(DB.write_match_history_to_db)')
+			return
 
-			for index, row in enumerate(rows): # iterate over the list
-				if row is None or len(row) == 0:
-					# update progress bar and skip over
-					index += 1
-					sum_bar.update(index)
-					continue
+		cursor.execute("""CREATE TABLE IF NOT EXISTS MatchHistory (
+					match_id integer NOT NULL PRIMARY KEY AUTOINCREMENT,
+					match_date text NOT NULL,
+					weight_class text,
+					winner text,
+					decision_type text,
+					rounds integer,
+					match_time text,
+					is_title text,
+
+					f1id integer,
+					f1name text,
+					f1height text,
+					f1reach text,
+					f1age integer,
+					f1sdbl integer,
+					f1sdba integer,
+					f1sdhl integer,
+					f1sdha integer,
+					f1sdll integer,
+					f1sdla integer,
+					f1tsl integer,
+					f1tsa integer,
+					f1ssl integer,
+					f1ssa integer,
+					f1sa integer,
+					f1kd integer,
+
+					f1scbl integer,
+					f1scba integer,
+					f1schl integer,
+					f1scha integer,
+					f1scll integer,
+					f1scla integer,
+					f1rv integer,
+					f1sr integer,
+					f1tdl integer,
+					f1tda integer,
+					f1tds integer,
+
+					f1sgbl integer,
+					f1sgba integer,
+					f1sghl integer,
+					f1sgha integer,
+					f1sgll integer,
+					f1sgla integer,
+					f1ad integer,
+					f1adtb integer,
+					f1adhg integer,
+					f1adtm integer,
+					f1adts integer,
+					f1sm integer,
+
+					f2id integer,
+					f2name text,
+					f2height text,
+					f2reach text,
+					f2age integer,
+
+					f2sdbl integer,
+					f2sdba integer,
+					f2sdhl integer,
+					f2sdha integer,
+					f2sdll integer,
+					f2sdla integer,
+					f2tsl integer,
+					f2tsa integer,
+					f2ssl integer,
+					f2ssa integer,
+					f2sa integer,
+					f2kd integer,
+
+					f2scbl integer,
+					f2scba integer,
+					f2schl integer,
+					f2scha integer,
+					f2scll integer,
+					f2scla integer,
+					f2rv integer,
+					f2sr integer,
+					f2tdl integer,
+					f2tda integer,
+					f2tds integer,
+
+					f2sgbl integer,
+					f2sgba integer,
+					f2sghl integer,
+					f2sgha integer,
+					f2sgll integer,
+					f2sgla integer,
+					f2ad integer,
+					f2adtb integer,
+					f2adhg integer,
+					f2adtm integer,
+					f2adts integer,
+					f2sm integer
+					)""")
 
-				try:
+		cursor.close()
+		conn_.close()
 
-					result = {}
-					
-					is_fighter1_done = False
-					is_fighter2_done = False
+		try:
+			conn_ = sqlite3.connect(db_name)
+			UFCHistoryDB.apply_profile(conn_, 'bulk')
+			cursor = conn_.cursor()
+		except Exception as e:
+			print(f'Exception while reconnecting to database(DB.write_match_history_to_db): {str(e)}')
+			return
 
-					# seek for the last matching match history of both fighters(fighter1 and fighter2) in reversed order
-					# make sure that the source list is already sorted by date
-					for r in reversed(rows_):
-						if not is_fighter1_done: # need to seek for fighter 1's last history
-							if r['F1Id'] == row['F1Id'] and not (r['Date'] == row['Date'] and r['Winner'] == row['Winner'] and r['Time'] == row['Time']):
-								for key, value in r.items():
-									if key.startswith('F1') and not (key.endswith('Name') or key.endswith('Height') or key.endswith('Reach') or key.endswith('Reach') or key.endswith('Age') or key.endswith('Id')):
-										result[key] = value
+		# bulk insert to database
+		cursor.execute('BEGIN TRANSACTION')
 
-								is_fighter1_done = True
+		# running totals of every fighter after his last match
+		totals = {}
 
-							if r['F2Id'] == row['F1Id'] and not (r['Date'] == row['Date'] and r['Winner'] == row['Winner'] and r['Time'] == row['Time']):
-								for key, value in r.items():
-									if key.startswith('F2') and not (key.endswith('Name') or key.endswith('Height') or key.endswith('Reach') or key.endswith('Reach') or key.endswith('Age') or key.endswith('Id')):
-										result[key.replace('F2', 'F1')] = value	
+		for row in rows_:
+			match_id = UFCHistoryDB.insert_match_history_row(cursor, row)
 
-								is_fighter1_done = True
+			if match_id is None:
+				continue
 
-						if not is_fighter2_done: # need to seek for fighter 2's last history
-							if r['F1Id'] == row['F2Id'] and not (r['Date'] == row['Date'] and r['Winner'] == row['Winner'] and r['Time'] == row['Time']):
-								for key, value in r.items():
-									if key.startswith('F1') and not (key.endswith('Name') or key.endswith('Height') or key.endswith('Reach') or key.endswith('Reach') or key.endswith('Age') or key.endswith('Id')):
-										result[key.replace('F1', 'F2')] = value
+			for side in ('F1', 'F2'):
+				totals[row[f'{side}Id']] = (match_id, row['Date'], [row[side + column] for column in SUM_COLUMNS])
 
-								is_fighter2_done = True
+		if is_sum:
+			UFCHistoryDB.write_running_totals(cursor, totals)
 
-							if r['F2Id'] == row['F2Id'] and not (r['Date'] == row['Date'] and r['Winner'] == row['Winner'] and r['Time'] == row['Time']):
-								for key, value in r.items():
-									if key.startswith('F2') and not (key.endswith('Name') or key.endswith('Height') or key.endswith('Reach') or key.endswith('Reach') or key.endswith('Age') or key.endswith('Id')):
-										result[key] = value
+		cursor.execute('COMMIT')
 
-								is_fighter2_done = True
+	@staticmethod
+	def insert_match_history_row(cursor, row):
+		""" insert a (summed) match row into table 'MatchHistory'
+		param cursor: cursor of match history database
+		param row: match row
+		return: match_id of inserted row, None if failed
+		"""
 
-						if is_fighter1_done and is_fighter2_done:
-							break
+		if row is None or len(row) == 0:
+			return None
 
-					# no prior match history, only need to consider current statistics
-					if result is None or len(result) == 0:
-						result = row
-					else:
+		sql = """ INSERT INTO MatchHistory (match_date, weight_class, winner, decision_type, rounds, match_time, is_title,
+								f1id, f1name, f1height,	f1reach, f1age,
+								f1sdbl, f1sdba, f1sdhl, f1sdha, f1sdll, f1sdla, f1tsl, f1tsa, f1ssl, f1ssa, f1sa, f1kd,
+								f1scbl, f1scba, f1schl, f1scha, f1scll,	f1scla, f1rv, f1sr, f1tdl, f1tda, f1tds,
+								f1sgbl, f1sgba, f1sghl, f1sgha, f1sgll, f1sgla, f1ad, f1adtb, f1adhg, f1adtm, f1adts, f1sm,
+								f2id, f2name, f2height, f2reach, f2age,
+								f2sdbl, f2sdba, f2sdhl, f2sdha, f2sdll, f2sdla, f2tsl, f2tsa, f2ssl, f2ssa, f2sa, f2kd,
+								f2scbl, f2scba, f2schl, f2scha, f2scll,	f2scla, f2rv, f2sr, f2tdl, f2tda, f2tds,
+								f2sgbl, f2sgba, f2sghl, f2sgha, f2sgll, f2sgla, f2ad, f2adtb, f2adhg, f2adtm, f2adts, f2sm)
+						 VALUES (?, ?, ?, ?, ?, ?, ?,
+						 		?, ?, ?, ?, ?,
+						 		?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+						 		?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+						 		?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+						 		?, ?, ?, ?, ?,
+						 		?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+						 		?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+						 		?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+		"""
 
-						if 'F1SDBL' not in result: # fighter 1's history was not found
-							for key, value in row.items():
-								if key.startswith('F2') and not (key.endswith('Name') or key.endswith('Height') or key.endswith('Reach') or key.endswith('Reach') or key.endswith('Age') or key.endswith('Id')):
-									result[key] += value
-								else:
-									result[key] = value
+		try:
+			val = (row['Date'], row['WeightClass'], row['Winner'],	row['DecisionType'], row['Rounds'], row['Time'], row['IsTitle?'],
+				row['F1Id'], row['F1Name'], row['F1Height'], row['F1Reach'], row['F1Age'],
+				row['F1SDBL'], row['F1SDBA'], row['F1SDHL'], row['F1SDHA'], row['F1SDLL'], row['F1SDLA'], row['F1TSL'], row['F1TSA'], row['F1SSL'], row['F1SSA'], row['F1SA'], row['F1KD'],
+				row['F1SCBL'], row['F1SCBA'], row['F1SCHL'], row['F1SCHA'], row['F1SCLL'], row['F1SCLA'], row['F1RV'], row['F1SR'], row['F1TDL'], row['F1TDA'], row['F1TDS'], 
+				row['F1SGBL'], row['F1SGBA'], row['F1SGHL'], row['F1SGHA'], row['F1SGLL'], row['F1SGLA'], row['F1AD'], row['F1ADTB'], row['F1ADHG'], row['F1ADTM'], row['F1ADTS'], row['F1SM'],
+				row['F2Id'], row['F2Name'], row['F2Height'], row['F2Reach'], row['F2Age'],
+				row['F2SDBL'], row['F2SDBA'], row['F2SDHL'], row['F2SDHA'], row['F2SDLL'], row['F2SDLA'], row['F2TSL'], row['F2TSA'], row['F2SSL'], row['F2SSA'], row['F2SA'], row['F2KD'],
+				row['F2SCBL'], row['F2SCBA'], row['F2SCHL'], row['F2SCHA'], row['F2SCLL'], row['F2SCLA'], row['F2RV'], row['F2SR'], row['F2TDL'], row['F2TDA'], row['F2TDS'], 
+				row['F2SGBL'], row['F2SGBA'], row['F2SGHL'], row['F2SGHA'], row['F2SGLL'], row['F2SGLA'], row['F2AD'], row['F2ADTB'], row['F2ADHG'], row['F2ADTM'], row['F2ADTS'], row['F2SM'],
+				)
+		except Exception as e:
+			print(f'Exception while making query(DB.write_match_history_to_db): {str(e)}')
+			print(row)
+			return None
 
-						elif 'F2SDBL' not in result: # fighter 2's history was not found
-							for key, value in row.items():
-								if key.startswith('F1') and not (key.endswith('Name') or key.endswith('Height') or key.endswith('Reach') or key.endswith('Reach') or key.endswith('Age') or key.endswith('Id')):
-									result[key] += value
-								else:
-									result[key] = value
+		cursor.execute(sql, val)
 
-						else:
-							# sum up prior statistics with current one
-							for key, value in row.items():
-								if (key.startswith('F1') or key.startswith('F2')) and not (key.endswith('Name') or key.endswith('Height') or key.endswith('Reach') or key.endswith('Reach') or key.endswith('Age') or key.endswith('Id')):
-									result[key] += value
-								else:
-									result[key] = value
+		return cursor.lastrowid
 
-				except Exception as e:
-					print(f'Exception while getting sums(DB.write_match_history_to_db): {str(e)}')
-					continue
+	@staticmethod
+	def write_running_totals(cursor, totals):
+		""" create table 'RunningTotals' if needed and upsert running totals of fighters into it
+		param cursor: cursor of match history database
+		param totals: dictionary of fighter id and tuple of match_id, date and list of totals(see SUM_COLUMNS) after that match
+		return:
+		"""
 
-				rows_.append(result)
-				# update progress bar
-				index += 1
-				sum_bar.update(index)
+		cursor.execute(f"""CREATE TABLE IF NOT EXISTS RunningTotals (
+					fighter_id integer NOT NULL PRIMARY KEY,
+					match_id integer NOT NULL,
+					match_date text NOT NULL,
+					{', '.join(f'{column.lower()} integer' for column in SUM_COLUMNS)}
+					)""")
 
-			sum_bar.finish()
+		cursor.executemany(f"""INSERT OR REPLACE INTO RunningTotals (fighter_id, match_id, match_date, {', '.join(column.lower() for column in SUM_COLUMNS)})
+								VALUES ({', '.join(['?'] * (len(SUM_COLUMNS) + 3))})""",
+							[(id_, match_id, date, *values) for id_, (match_id, date, values) in totals.items()])
 
-			print('Doing the sum of statistics is done!')
-		else:
-			rows_ = rows
+	@staticmethod
+	def get_match_key(row):
+		""" returns a key which identifies a match row
+		param row: match row
+		return: tuple of date, fighter ids, winner and time
+		"""
 
-		# write sumed rows to excel
-		try:
-			self.write_to_excel(rows_, 'ufc_history_sum')
-			self.write_to_excel(royce_list, 'royce_history')
-			self.write_to_excel(royce_sum, 'royce_sum')
-		except Exception as e:
-			print(f'Failed to write excel file: {str(e)}')
-		
+		return (row['Date'], row['F1Id'], row['F2Id'], row['Winner'], row['Time'])
 
-		# write match history into database
-		if write_to_db:
-			try:
-				os.remove(db_name)
-			except Exception as e:
-				# print(f'Failed to remove old db file: {str(e)}')
-				pass
+	@staticmethod
+	def update_match_history_db(rows, db_name = 'match_history.db', full = False):
+		""" bring table 'MatchHistory' up to date with rows, only fighters of new matches are summed again
+			from their first new match onward and their rows are upserted, the other rows are kept as they are
+			the whole database is rebuilt if it doesn't exist yet or any of its matches is not in rows anymore
+		param rows: deduplicated list of match rows(not summed) sorted by date, see get_rows
+		param db_name: match history database name
+		param full: True: always rebuild the whole database
+		return: number of inserted or updated rows
+		"""
 
-			conn_ = None
-			cursor = None
+		started = time.perf_counter()
 
+		conn_ = None
+
+		if not full and os.path.isfile(db_name):
 			try:
 				conn_ = sqlite3.connect(db_name)
-				cursor = conn_.cursor()
+				UFCHistoryDB.apply_profile(conn_, 'safe')
+				tables = [row[0] for row in conn_.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()]
 			except Exception as e:
-				print(f'Exception(DB.write_match_history_to_db): Cannot connect to database {db_name} : {str(e)}')
-				return
+				print(f'Exception(DB.update_match_history_db): Cannot read database {db_name} : {str(e)}')
+				tables = []
 
-			if conn_ is None or cursor is None:
-				print('Failed to connect database(DB.write_match_history_to_db)')
-				return
+			if 'MatchHistory' not in tables or 'RunningTotals' not in tables:
+				conn_.close()
+				conn_ = None
 
-			cursor.execute("""CREATE TABLE IF NOT EXISTS MatchHistory (
-						match_id integer NOT NULL PRIMARY KEY AUTOINCREMENT,
-						match_date text NOT NULL,
-						weight_class text,
-						winner text,
-						decision_type text,
-						rounds integer,
-						match_time text,
-						is_title text,
-
-						f1id integer,
-						f1name text,
-						f1height text,
-						f1reach text,
-						f1age integer,
-						f1sdbl integer,
-						f1sdba integer,
-						f1sdhl integer,
-						f1sdha integer,
-						f1sdll integer,
-						f1sdla integer,
-						f1tsl integer,
-						f1tsa integer,
-						f1ssl integer,
-						f1ssa integer,
-						f1sa integer,
-						f1kd integer,
-
-						f1scbl integer,
-						f1scba integer,
-						f1schl integer,
-						f1scha integer,
-						f1scll integer,
-						f1scla integer,
-						f1rv integer,
-						f1sr integer,
-						f1tdl integer,
-						f1tda integer,
-						f1tds integer,
-
-						f1sgbl integer,
-						f1sgba integer,
-						f1sghl integer,
-						f1sgha integer,
-						f1sgll integer,
-						f1sgla integer,
-						f1ad integer,
-						f1adtb integer,
-						f1adhg integer,
-						f1adtm integer,
-						f1adts integer,
-						f1sm integer,
-
-						f2id integer,
-						f2name text,
-						f2height text,
-						f2reach text,
-						f2age integer,
-
-						f2sdbl integer,
-						f2sdba integer,
-						f2sdhl integer,
-						f2sdha integer,
-						f2sdll integer,
-						f2sdla integer,
-						f2tsl integer,
-						f2tsa integer,
-						f2ssl integer,
-						f2ssa integer,
-						f2sa integer,
-						f2kd integer,
-
-						f2scbl integer,
-						f2scba integer,
-						f2schl integer,
-						f2scha integer,
-						f2scll integer,
-						f2scla integer,
-						f2rv integer,
-						f2sr integer,
-						f2tdl integer,
-						f2tda integer,
-						f2tds integer,
-
-						f2sgbl integer,
-						f2sgba integer,
-						f2sghl integer,
-						f2sgha integer,
-						f2sgll integer,
-						f2sgla integer,
-						f2ad integer,
-						f2adtb integer,
-						f2adhg integer,
-						f2adtm integer,
-						f2adts integer,
-						f2sm integer
-						)""")
+		if conn_ is not None:
+			# match_id of every match already in the database
+			existing = {(date, f1id, f2id, winner, match_time): match_id for date, f1id, f2id, winner, match_time, match_id
+							in conn_.execute("SELECT match_date, f1id, f2id, winner, match_time, match_id FROM MatchHistory").fetchall()}
 
-			cursor.close()
+			keys = [UFCHistoryDB.get_match_key(row) if row is not None and len(row) > 0 else None for row in rows]
+
+			if len(set(existing) - set(keys)) > 0:
+				print(f'{len(set(existing) - set(keys))} matches of {db_name} are not found anymore, rebuilding it...')
+				conn_.close()
+				conn_ = None
+
+		if conn_ is None:
+			UFCHistoryDB.write_match_history_to_db(UFCHistoryDB.get_match_history_sums(rows), db_name)
+
+			metrics.observe('stage_seconds', time.perf_counter() - started, stage='match_history_full')
+
+			return len(rows)
+
+		# index of the first new match of every fighter which has new matches
+		first_new = {}
+
+		for index, key in enumerate(keys):
+			if key is not None and key not in existing:
+				for id_ in (key[1], key[2]):
+					first_new.setdefault(id_, index)
+
+		if len(first_new) == 0:
 			conn_.close()
+			print(f'{db_name} is up to date')
+			return 0
 
-			try:
-				conn_ = sqlite3.connect(db_name)
-				cursor = conn_.cursor()
-			except Exception as e:
-				print(f'Exception while reconnecting to database(DB.write_match_history_to_db): {str(e)}')
-				return
+		cursor = conn_.cursor()
 
-			# bulk insert to database
-
-			sql = """ INSERT INTO MatchHistory (match_date, weight_class, winner, decision_type, rounds, match_time, is_title,
-									f1id, f1name, f1height,	f1reach, f1age,
-									f1sdbl, f1sdba, f1sdhl, f1sdha, f1sdll, f1sdla, f1tsl, f1tsa, f1ssl, f1ssa, f1sa, f1kd,
-									f1scbl, f1scba, f1schl, f1scha, f1scll,	f1scla, f1rv, f1sr, f1tdl, f1tda, f1tds,
-									f1sgbl, f1sgba, f1sghl, f1sgha, f1sgll, f1sgla, f1ad, f1adtb, f1adhg, f1adtm, f1adts, f1sm,
-									f2id, f2name, f2height, f2reach, f2age,
-									f2sdbl, f2sdba, f2sdhl, f2sdha, f2sdll, f2sdla, f2tsl, f2tsa, f2ssl, f2ssa, f2sa, f2kd,
-									f2scbl, f2scba, f2schl, f2scha, f2scll,	f2scla, f2rv, f2sr, f2tdl, f2tda, f2tds,
-									f2sgbl, f2sgba, f2sghl, f2sgha, f2sgll, f2sgla, f2ad, f2adtb, f2adhg, f2adtm, f2adts, f2sm)
-							 VALUES (?, ?, ?, ?, ?, ?, ?,
-							 		?, ?, ?, ?, ?,
-							 		?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
-							 		?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
-							 		?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
-							 		?, ?, ?, ?, ?,
-							 		?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
-							 		?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
-							 		?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-			"""
+		cursor.execute('BEGIN TRANSACTION')
+
+		# summed statistics of affected fighters per row index, {index: {side: totals}}
+		summed = {}
+
+		# match_id and side of the last existing match of a fighter before his first new match
+		previous_match = {}
+
+		totals = {}
 
-			cursor.execute('BEGIN TRANSACTION')
-			for row in rows_:
-				if row is None or len(row) == 0:
+		# sum up every affected fighter again from his first new match onward
+		for index, row in enumerate(rows):
+			if keys[index] is None:
+				continue
+
+			for side in ('F1', 'F2'):
+				id_ = row[f'{side}Id']
+
+				if id_ not in first_new:
 					continue
-				try:
-					val = (row['Date'], row['WeightClass'], row['Winner'],	row['DecisionType'], row['Rounds'], row['Time'], row['IsTitle?'],
-						row['F1Id'], row['F1Name'], row['F1Height'], row['F1Reach'], row['F1Age'],
-						row['F1SDBL'], row['F1SDBA'], row['F1SDHL'], row['F1SDHA'], row['F1SDLL'], row['F1SDLA'], row['F1TSL'], row['F1TSA'], row['F1SSL'], row['F1SSA'], row['F1SA'], row['F1KD'],
-						row['F1SCBL'], row['F1SCBA'], row['F1SCHL'], row['F1SCHA'], row['F1SCLL'], row['F1SCLA'], row['F1RV'], row['F1SR'], row['F1TDL'], row['F1TDA'], row['F1TDS'], 
-						row['F1SGBL'], row['F1SGBA'], row['F1SGHL'], row['F1SGHA'], row['F1SGLL'], row['F1SGLA'], row['F1AD'], row['F1ADTB'], row['F1ADHG'], row['F1ADTM'], row['F1ADTS'], row['F1SM'],
-						row['F2Id'], row['F2Name'], row['F2Height'], row['F2Reach'], row['F2Age'],
-						row['F2SDBL'], row['F2SDBA'], row['F2SDHL'], row['F2SDHA'], row['F2SDLL'], row['F2SDLA'], row['F2TSL'], row['F2TSA'], row['F2SSL'], row['F2SSA'], row['F2SA'], row['F2KD'],
-						row['F2SCBL'], row['F2SCBA'], row['F2SCHL'], row['F2SCHA'], row['F2SCLL'], row['F2SCLA'], row['F2RV'], row['F2SR'], row['F2TDL'], row['F2TDA'], row['F2TDS'], 
-						row['F2SGBL'], row['F2SGBA'], row['F2SGHL'], row['F2SGHA'], row['F2SGLL'], row['F2SGLA'], row['F2AD'], row['F2ADTB'], row['F2ADHG'], row['F2ADTM'], row['F2ADTS'], row['F2SM'],
-						)
-				except Exception as e:
-					print(f'Exception while making query(DB.write_match_history_to_db): {str(e)}')
-					print(row)
+
+				if index < first_new[id_]:
+					previous_match[id_] = (existing[keys[index]], side)
 					continue
-				
-				cursor.execute(sql, val)
 
-			cursor.execute('COMMIT')
-		print('Writing match history done!')
+				if id_ not in totals:
+					if id_ in previous_match:
+						# totals after the previous match are the starting point
+						match_id, previous_side = previous_match[id_]
+						totals[id_] = list(cursor.execute(f"""SELECT {', '.join(previous_side.lower() + column.lower() for column in SUM_COLUMNS)}
+																FROM MatchHistory WHERE match_id=?""", (match_id,)).fetchone())
+					else:
+						totals[id_] = [0] * len(SUM_COLUMNS)
+
+				totals[id_] = [total + row[side + column] for total, column in zip(totals[id_], SUM_COLUMNS)]
+
+				summed.setdefault(index, {})[side] = totals[id_]
+
+		running_totals = {}
+
+		for index, sides in summed.items():
+			row = rows[index]
+
+			if keys[index] in existing:
+				match_id = existing[keys[index]]
+
+				for side, values in sides.items():
+					cursor.execute(f"""UPDATE MatchHistory SET {', '.join(f'{side.lower()}{column.lower()}=?' for column in SUM_COLUMNS)}
+										WHERE match_id=?""", (*values, match_id))
+			else:
+				# both fighters of a new match are affected
+				result = dict(row)
+
+				for side, values in sides.items():
+					result.update(zip([side + column for column in SUM_COLUMNS], values))
+
+				match_id = UFCHistoryDB.insert_match_history_row(cursor, result)
+
+				if match_id is None:
+					continue
+
+			for side, values in sides.items():
+				running_totals[row[f'{side}Id']] = (match_id, row['Date'], values)
+
+		UFCHistoryDB.write_running_totals(cursor, running_totals)
+
+		cursor.execute('COMMIT')
+
+		conn_.close()
+
+		metrics.observe('stage_seconds', time.perf_counter() - started, stage='match_history_update')
+
+		print(f'Updated {len(summed)} rows of {len(first_new)} fighters in {db_name}')
+
+		return len(summed)
 
 	@staticmethod
 	def write_pickle_file(rows, file_name = 'match_history_sum'):
@@ -1258,22 +2623,109 @@ class UFCHistoryDB:
 		
 		infile.close() # close the file
 
+		# rows of delta exports are in part files, see export.py
+		part = 1
+		while os.path.isfile(f'{file_name}.part{part}'):
+			try:
+				with open(f'{file_name}.part{part}', 'rb') as infile:
+					data_list += pickle.load(infile)
+			except Exception as e:
+				print(f'Failed to retrieve data from pickled file {file_name}.part{part}. {str(e)}')
+				return None
+
+			part += 1
+
 		print(f'Retrieved {len(data_list)} rows from pickled file.') # log
 
 		return data_list
 
+	def get_export_cache_key(self):
+		""" returns content fingerprint of the database combined with the code version
+			it changes whenever a row of a source table is inserted, updated or deleted(see create_table_versions),
+			the schema changes or this file changes
+		param:
+		return: hex digest, None if the database has no table versions(read-only database of an older version)
+		"""
+
+		try:
+			versions = self.c.execute("SELECT name, version FROM TableVersions ORDER BY name").fetchall()
+		except Exception:
+			return None
+
+		with open(os.path.realpath(__file__), 'rb') as infile:
+			parts = [hashlib.md5(infile.read()).hexdigest(), self.db_file_, self.c.execute("PRAGMA schema_version").fetchone()[0], versions]
+
+		return hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+
+	@staticmethod
+	def read_export_cache(key, file_name = EXPORT_CACHE_FILE):
+		""" returns cached export dataset if it was built from the same database content
+		param key: cache key, see get_export_cache_key
+		param file_name: cache file name, relative to the script directory
+		return: list of match dictionaries, None if there's no valid cache
+		"""
+
+		try:
+			with open(os.path.join(os.path.dirname(os.path.realpath(__file__)), file_name), 'rb') as infile:
+				cached_key, rows = pickle.load(infile)
+		except Exception:
+			return None
+
+		return rows if cached_key == key else None
+
+	@staticmethod
+	def write_export_cache(key, rows, file_name = EXPORT_CACHE_FILE):
+		""" write export dataset into the cache
+		param key: cache key, see get_export_cache_key
+		param rows: deduplicated list of match dictionaries sorted by date
+		param file_name: cache file name, relative to the script directory
+		return:
+		"""
+
+		path = os.path.join(os.path.dirname(os.path.realpath(__file__)), file_name)
+
+		try:
+			# NOTE: written into a temp file first, an interrupted write doesn't leave a broken cache
+			with open(path + '.tmp', 'wb') as outfile:
+				pickle.dump((key, rows), outfile, protocol = pickle.HIGHEST_PROTOCOL)
+
+			os.replace(path + '.tmp', path)
+		except Exception as e:
+			print(f'Failed to write export cache {file_name}. {str(e)}')
+
 	def get_rows_for_schema(self):
 		""" get all rows to be written to the excel file
 		param:
 		return:
 		"""
 
+		if self.use_export_cache:
+			self.export_cache_key = self.get_export_cache_key()
+
+			rows = UFCHistoryDB.read_export_cache(self.export_cache_key) if self.export_cache_key is not None else None
+
+			if rows is not None:
+				print(f'Database is unchanged since the last export, using {len(rows)} cached rows')
+
+				metrics.inc('export_cache_hits_total')
+
+				self.close_connection()
+
+				self.export_rows(rows)
+				return
+
+			metrics.inc('export_cache_misses_total')
+
+		# databases created before opponent ids were resolved at ingest don't have History.opp_id
+		columns = [column[1] for column in self.c.execute("PRAGMA table_info(History)").fetchall()]
+		opp_id = 'History.opp_id' if 'opp_id' in columns else 'NULL'
+
 		# make a query to get initial data
-		sql = """SELECT History.match_date, Fighters.weight_class, History.decision, History.rnd, History.match_time, 
+		sql = f"""SELECT History.match_date, Fighters.weight_class, History.decision, History.rnd, History.match_time, 
 						History.event, Fighters.id, Fighters.name, Fighters.height, Fighters.reach, Fighters.age, Fighters.url, 
-						History.opponent, History.result, History.opp_url
+						History.opponent, History.result, History.opp_url, {opp_id}
 						FROM Fighters, History WHERE Fighters.id == History.id
-						ORDER BY match_date ASC"""
+						ORDER BY History.match_date ASC, History.id ASC, History.rowid ASC"""
 
 		# list of dictionaries, each dictionary contains a match information fit for schema
 		# NOTE: Using dictionary rather than list makes it easier to change/revise and maintain
@@ -1281,6 +2733,9 @@ class UFCHistoryDB:
 
 		print('Getting rows for excel output from database...')
 
+		# used to measure the time spent on getting rows
+		self.get_rows_started = time.perf_counter()
+
 		# fetch queried result
 		rows = self.c.execute(sql).fetchall()
 
@@ -1292,44 +2747,75 @@ class UFCHistoryDB:
 			print('Cannot get information for excel output from database')
 			return
 
-		# this is used to check if all threads are finished
-		self.total_row_count = len(rows)
+		workers = self.export_workers if self.export_workers is not None else (os.cpu_count() or 1)
+
+		# NOTE: a few partitions per worker keep all of them busy, late dates have more matches
+		partitions = UFCHistoryDB.get_date_partitions(rows, workers * 4)
 
 		# shows the progress of total processing
-		self.get_rows_bar = progressbar.ProgressBar(maxval=len(rows), \
+		bar = progressbar.ProgressBar(maxval=len(rows), \
 									widgets=['QUERYING DB:', progressbar.Bar('=', '[', ']'), ' ', progressbar.Percentage(), ' | ', progressbar.Counter(), '/', str(len(rows))])
 
-		# self.total_row_count = 1000
-		# self.get_rows_bar = progressbar.ProgressBar(maxval=1000, \
-									# widgets=[progressbar.Bar('=', '[', ']'), ' ', progressbar.Percentage(), ' | ', progressbar.Counter(), '/', '1000'])
+		bar.start()
+
+		# match dictionaries of every partition, merged in order of dates once all of them are done
+		results = [None] * len(partitions)
+		processed = 0
+		failed = 0
+
+		with ProcessPoolExecutor(max_workers = min(workers, len(partitions))) as pool:
+
+			futures = {pool.submit(UFCHistoryDB.get_rows, partition, self.db_file_, self.profile_): index for index, partition in enumerate(partitions)}
+
+			for future in as_completed(futures):
+				index = futures[future]
+
+				try:
+					results[index], elapsed = future.result()
+				except Exception as e:
+					print(f'Error(DB.get_rows_for_schema): {str(e)}')
+					results[index], elapsed = [], 0.0
+					failed += 1
+
+					# the export is stopped anyway, don't start the remaining ranges
+					for pending in futures:
+						pending.cancel()
+
+				# worker processes have their own metrics, so record them here
+				metrics.observe('get_rows_worker_seconds', elapsed)
+				metrics.inc('get_rows_input_rows_total', len(partitions[index]))
+
+				processed += len(partitions[index])
+				bar.update(processed)
+
+		bar.finish()
+
+		# NOTE: an incomplete dataset mustn't be cached or exported, delta watermarks would skip the missing matches for good
+		if failed > 0:
+			print(f'Cannot get rows of {failed} date ranges, export is stopped')
+			return
 
-		self.get_rows_bar.start()
+		rows_for_schema = [row for result in results for row in result]
 
-		# devide the rows into smaller pieces to load them on threads
-		tmp_list = [rows[x:x + int(len(rows) / (self.thread_count - 1))] for x in range(0, len(rows) - 1, int(len(rows) / (self.thread_count - 1)))]
-		# tmp_list = [rows[x:x + int(1000 / self.thread_count)] for x in range(0, 999, int(1000 / self.thread_count))]
+		metrics.observe('stage_seconds', time.perf_counter() - self.get_rows_started, stage='get_rows')
 
-		# ensure thread_count equals to the number of sub lists in tmp_list
-		self.thread_count = len(tmp_list)
+		profiler.snapshot('rows_for_schema_built')
 
-		# ensure the temp directory does exist
-		if not os.path.exists(self.tmp_dir):
-			os.mkdir(self.tmp_dir)
+		dedup_started = time.perf_counter()
 
-		# now the threads
-		# copy current database to temp directory and rename it with indices
-		# each thread works on the thread which is named with thread's index
-		for index, list_ in enumerate(tmp_list):
+		# get rid of duplicates
+		result = UFCHistoryDB.deduplicate_rows(rows_for_schema)
 
-			# path for temp db file
-			db_path = os.path.join(self.tmp_dir, f'tmp_{index + 1}.db')
+		metrics.observe('stage_seconds', time.perf_counter() - dedup_started, stage='dedup')
+		metrics.inc('export_rows_total', len(result))
+		metrics.inc('export_rows_dropped_total', len([row for row in rows_for_schema if 'Date' not in row]))
 
-			# make a copy of current database
-			copyfile(self.db_file_, db_path)
+		profiler.snapshot('deduplicated')
 
-			thread_ = threading.Thread(target=self.get_rows, args=(index, list_, db_path))
+		if self.export_cache_key is not None:
+			UFCHistoryDB.write_export_cache(self.export_cache_key, result)
 
-			thread_.start()
+		self.export_rows(result)
 
 
 if __name__ == "__main__":
@@ -103,16 +103,29 @@ class ExcelWriter:
 		'F2SM'
 	]
 
-	def __init__(self, xl_file: str):
+	# header labels which differ from the keys of the row dictionaries
+	key_aliases = {
+		'F1SCLl': 'F1SCLL',
+		'F2SCLl': 'F2SCLL'
+	}
+
+	def __init__(self, xl_file: str, streaming: bool = False):
 		""" constructor
 		:param xl_file: excel file name
+		:param streaming: True: flush every row to disk as soon as the next row is started(constant memory),
+							rows must be written in ascending order, False: keep the whole sheet in memory
 		"""
 
 		# file name
 		self.file_name = xl_file
 
+		# streaming mode flag
+		self.streaming = streaming
+
 		# create a workbook for instance
-		self.wb = Workbook(f'{xl_file}.xlsx')
+		# NOTE: in constant memory mode xlsxwriter writes each row to a temp file once it's completed,
+		# 		so the memory usage doesn't grow with the number of rows
+		self.wb = Workbook(f'{xl_file}.xlsx', {'constant_memory': streaming})
 
 		# create a new sheet for the workbook
 		self.sheet = self.wb.add_worksheet('Sheet 1')
@@ -166,6 +179,41 @@ class ExcelWriter:
 			print(f'Error(Excel.write_to_sheet): {str(e)}')
 			return False
 
+	def write_row(self, row_id: int, values: list):
+		""" write a list of values to the sheet at row 'row_id' starting from the first column
+		:param row_id: index of row on the sheet
+		:param values: list of values, ordered same as the columns
+		:return: true if successful or false in case of failure
+		"""
+
+		try:
+			self.sheet.write_row(row_id, 0, values)
+			return True
+		except Exception as e:
+			print(f'Error(Excel.write_row): {str(e)}')
+			return False
+
+	def write_dict_row(self, row_id: int, row: dict):
+		""" write a dictionary to the sheet at row 'row_id', column order is driven by header_list
+			missing keys are left as blank cells
+		:param row_id: index of row on the sheet
+		:param row: dictionary of a single match, keyed by header labels
+		:return: true if successful or false in case of failure
+		"""
+
+		return self.write_row(row_id, [row.get(key) for key in self.column_keys()])
+
+	def column_keys(self) -> list:
+		""" returns the list of row dictionary keys in the same order as header_list
+		:return: list of keys
+		"""
+
+		# cache keys on first use since this is called per row
+		if getattr(self, '_column_keys', None) is None:
+			self._column_keys = [self.key_aliases.get(label, label) for label in self.header_list]
+
+		return self._column_keys
+
 	# def write_to_file(self, file_name='xlsx_temp'):
 	# 	""" write the sheet(s) into a file named 'file_name'
 	# 	param file_name: file name to be written on the disk
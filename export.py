@@ -0,0 +1,310 @@
+
+import os
+import glob
+import json
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import wait
+from concurrent.futures import FIRST_COMPLETED
+
+import database
+import snapshot
+import metrics
+
+# all outputs which can be built from a single export dataset
+# 	excel: ufc_history.xlsx
+# 	sum: ufc_history_sum.xlsx
+# 	royce: royce_history.xlsx, royce_sum.xlsx
+# 	db: match_history.db, updated incrementally, see UFCHistoryDB.update_match_history_db
+# 	snapshot: match_history_sum.snap, memory-mappable binary snapshot, see snapshot.py
+# 	pickle: match_history_sum
+ALL_OUTPUTS = ('excel', 'sum', 'royce', 'db', 'snapshot', 'pickle')
+
+# outputs built when nothing is specified
+# NOTE: snapshot replaces the pickle file, pickle is still available on request
+DEFAULT_OUTPUTS = ('excel', 'sum', 'royce', 'db', 'snapshot')
+
+# outputs which need cumulative sums of statistics
+SUM_OUTPUTS = ('sum', 'db')
+
+# outputs which can be built as a delta of matches added since the last export, and their file names
+# NOTE: deltas are written into part files next to the full output, e.g. ufc_history.part1.xlsx,
+# 		a full export removes them. match_history.db is updated incrementally by itself
+# 		snapshot is always written in full, Snapshot memory-maps a single file
+DELTA_FILES = {
+	'excel': ('ufc_history', '.xlsx'),
+	'sum': ('ufc_history_sum', '.xlsx'),
+	'pickle': ('match_history_sum', '')
+}
+
+# part files of snapshots written by delta exports of older versions, removed by a snapshot export
+SNAPSHOT_PART_FILES = 'match_history_sum.part*.snap'
+
+# watermark of every output, number of exported rows, date of the last one and fingerprint of them
+EXPORT_STATE_FILE = 'export_state.json'
+
+def parse_outputs(text: str) -> list:
+	""" returns a list of output names from comma separated string
+	:param text: comma separated output names, e.g. 'excel,db'
+	:return: list of valid output names, None if any of them is unknown
+	"""
+
+	outputs = [name.strip() for name in text.split(',') if len(name.strip()) > 0]
+
+	for name in outputs:
+		if name not in ALL_OUTPUTS:
+			print(f'Unknown output: {name}, available outputs: {",".join(ALL_OUTPUTS)}')
+			return None
+
+	return outputs
+
+def _run_timed(name, func, *args):
+	""" run func(*args) and measure the time spent on it
+		this runs in a worker process, so it must stay on module level to be picklable
+	:param name: name of the output
+	:param func: function to run
+	:param args: arguments of func
+	:return: tuple of name, elapsed seconds and return value of func
+	"""
+
+	start = time.time()
+
+	value = func(*args)
+
+	return name, time.time() - start, value
+
+def _write_excel(rows, file_name = 'ufc_history'):
+	database.UFCHistoryDB.write_to_excel(rows, file_name)
+
+def _write_sum_excel(rows_sum, file_name = 'ufc_history_sum'):
+	database.UFCHistoryDB.write_to_excel(rows_sum, file_name)
+
+def _write_royce():
+	database.UFCHistoryDB.write_royce_history()
+
+def _write_db(rows):
+	database.UFCHistoryDB.update_match_history_db(rows)
+
+def _write_pickle(rows, file_name = 'match_history_sum'):
+	return database.UFCHistoryDB.write_pickle_file(rows, file_name)
+
+def _write_snapshot(rows, file_name = 'match_history_sum.snap'):
+	return snapshot.write_snapshot(rows, file_name)
+
+def _get_sums(rows):
+	# NOTE: aligned with rows, so that sums of a delta start at the same index as its rows
+	return database.UFCHistoryDB.get_match_history_sums(rows, aligned = True)
+
+def get_part_file(name, part = None) -> str:
+	""" returns file name of a delta output
+	:param name: output name, one of DELTA_FILES
+	:param part: part number starting from 1, None: full output
+	:return: file name, without extension for excel outputs
+	"""
+
+	base, extension = DELTA_FILES[name]
+
+	if part is not None:
+		base = f'{base}.part{part}'
+
+	# NOTE: excel writer adds the extension by itself
+	return base if extension == '.xlsx' else base + extension
+
+def remove_part_files(name):
+	""" remove part files of an output, done before a full export
+	:param name: output name, one of DELTA_FILES
+	:return:
+	"""
+
+	base, extension = DELTA_FILES[name]
+
+	for file_name in glob.glob(f'{glob.escape(base)}.part*{extension}'):
+		# pickle parts have no extension, so don't touch snapshot parts of the same name
+		if extension == '' and file_name.endswith('.snap'):
+			continue
+
+		try:
+			os.remove(file_name)
+		except Exception as e:
+			print(f'Failed to remove part file {file_name}. {str(e)}')
+
+def get_fingerprints(rows, count):
+	""" returns fingerprints of the first 'count' rows and of all rows
+		a watermark is valid as long as the rows it covers didn't change, new matches are added after them
+	:param rows: list of match dictionaries sorted by date
+	:param count: number of rows covered by a watermark
+	:return: tuple of hex digests of rows[:count] and rows
+	"""
+
+	digest = hashlib.md5()
+	prefix = digest.hexdigest() if count == 0 else None
+
+	for index, row in enumerate(rows, 1):
+		digest.update(repr(sorted(row.items()) if row is not None else None).encode('utf-8'))
+
+		if index == count:
+			prefix = digest.hexdigest()
+
+	return prefix, digest.hexdigest()
+
+def read_export_state(file_name = EXPORT_STATE_FILE) -> dict:
+	""" returns watermarks of outputs written by the last export
+	:param file_name: state file name
+	:return: dictionary of output name and watermark dictionary, empty if there's no valid state
+	"""
+
+	try:
+		with open(file_name, 'r') as infile:
+			return json.load(infile)
+	except Exception:
+		return {}
+
+def write_export_state(state, file_name = EXPORT_STATE_FILE):
+	""" write watermarks of outputs
+	:param state: dictionary of output name and watermark dictionary
+	:param file_name: state file name
+	:return:
+	"""
+
+	try:
+		with open(file_name, 'w') as outfile:
+			json.dump(state, outfile, indent = 2)
+	except Exception as e:
+		print(f'Failed to write export state {file_name}. {str(e)}')
+
+def get_delta_start(watermark, rows) -> int:
+	""" returns index of the first row which is not exported yet
+	:param watermark: watermark dictionary of an output, None if it was never exported
+	:param rows: list of match dictionaries sorted by date
+	:return: number of exported rows, None if the watermark is invalid and the output has to be rebuilt
+	"""
+
+	if watermark is None or watermark.get('count', 0) > len(rows):
+		return None
+
+	if get_fingerprints(rows, watermark['count'])[0] != watermark.get('fingerprint'):
+		return None
+
+	return watermark['count']
+
+def export_outputs(rows, outputs = DEFAULT_OUTPUTS, max_workers = None, delta = False):
+	""" build requested outputs from rows concurrently in worker processes
+		outputs which don't depend on each other run in parallel,
+		sum dependent outputs are submitted as soon as the sums are ready
+	:param rows: deduplicated list of match dictionaries sorted by date
+	:param outputs: names of outputs to build, see ALL_OUTPUTS
+	:param max_workers: maximum number of worker processes, None: one per output up to cpu count
+	:param delta: True: write only matches added since the last export of each output into part files,
+				an output is rebuilt if its watermark is invalid, False: rebuild all outputs
+	:return: dictionary of output name and elapsed seconds, 'total' for wall time
+	"""
+
+	timings = {}
+
+	start = time.time()
+
+	# time spent on cumulative sums, added to the time of the sum output
+	sums_elapsed = 0
+
+	state = read_export_state()
+
+	fingerprint = get_fingerprints(rows, len(rows))[1]
+
+	# first row to write and part number of every delta output, part None: full output
+	deltas = {}
+
+	for name in DELTA_FILES:
+		if name not in outputs:
+			continue
+
+		watermark = state.get(name)
+		first = get_delta_start(watermark, rows) if delta else None
+
+		if first is None:
+			if delta:
+				print(f'Watermark of {name} is invalid, rebuilding it...')
+			remove_part_files(name)
+			deltas[name] = (0, None)
+		elif first == len(rows):
+			print(f'{name} is up to date')
+		else:
+			deltas[name] = (first, watermark.get('parts', 0) + 1)
+
+	if max_workers is None:
+		max_workers = max(1, min(len(outputs), os.cpu_count() or 1))
+
+	print(f'Exporting {", ".join(outputs)}...')
+
+	with ProcessPoolExecutor(max_workers = max_workers) as pool:
+
+		pending = set()
+
+		if 'excel' in deltas:
+			pending.add(pool.submit(_run_timed, 'excel', _write_excel, rows[deltas['excel'][0]:], get_part_file('excel', deltas['excel'][1])))
+
+		if 'royce' in outputs:
+			pending.add(pool.submit(_run_timed, 'royce', _write_royce))
+
+		if 'snapshot' in outputs:
+			for file_name in glob.glob(SNAPSHOT_PART_FILES):
+				try:
+					os.remove(file_name)
+				except Exception as e:
+					print(f'Failed to remove part file {file_name}. {str(e)}')
+
+			pending.add(pool.submit(_run_timed, 'snapshot', _write_snapshot, rows))
+
+		if 'pickle' in deltas:
+			pending.add(pool.submit(_run_timed, 'pickle', _write_pickle, rows[deltas['pickle'][0]:], get_part_file('pickle', deltas['pickle'][1])))
+
+		# NOTE: match history database sums up only fighters of new matches by itself
+		if 'db' in outputs:
+			pending.add(pool.submit(_run_timed, 'db', _write_db, rows))
+
+		# NOTE: sums of new matches depend on all previous ones, so they are computed on all rows
+		if 'sum' in deltas:
+			pending.add(pool.submit(_run_timed, 'sum_calc', _get_sums, rows))
+
+		while len(pending) > 0:
+			done, pending = wait(pending, return_when = FIRST_COMPLETED)
+
+			for future in done:
+				try:
+					name, elapsed, value = future.result()
+				except Exception as e:
+					print(f'Failed to export due to error: {str(e)}')
+					continue
+
+				# sums are a step of the sum output, not an output of their own, so their time is added to it
+				if name == 'sum_calc':
+					sums_elapsed = elapsed
+					sums = [row for row in value[deltas['sum'][0]:] if row is not None]
+					pending.add(pool.submit(_run_timed, 'sum', _write_sum_excel, sums, get_part_file('sum', deltas['sum'][1])))
+					continue
+
+				if name == 'sum':
+					elapsed += sums_elapsed
+
+				timings[name] = elapsed
+
+				# worker processes have their own metrics, so record the timing here
+				metrics.observe('export_output_seconds', elapsed, output = name)
+
+				# NOTE: writers return False if they failed, the watermark is kept then
+				if name in deltas and value is not False:
+					state[name] = {'count': len(rows), 'last_date': rows[-1]['Date'] if len(rows) > 0 else None,
+									'fingerprint': fingerprint, 'parts': deltas[name][1] or 0, 'updated': time.time()}
+
+	write_export_state(state)
+
+	timings['total'] = time.time() - start
+
+	metrics.observe('stage_seconds', timings['total'], stage = 'export')
+
+	# report time spent per output
+	print('Export report:')
+	for name, elapsed in timings.items():
+		print(f'  {name:<10} {elapsed:8.2f}s')
+
+	return timings
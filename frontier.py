@@ -0,0 +1,223 @@
+
+import os
+import json
+import math
+import time
+import hashlib
+import sqlite3
+from datetime import datetime as DT
+
+import metrics
+import database
+
+# persistent crawl frontier, every known fighter url with its fetch and change history
+# NOTE: a run with a request budget fetches only the fighters whose data most likely changed since they
+# 		were fetched last time, the others are kept as they are in the database
+#
+# expected change rate of a fighter(changes per day) is estimated from its own history with a prior
+# which depends on how long ago the fighter fought last time:
+#
+# 	rate = (changes + 1) / (observed days + max(ACTIVE_INTERVAL, days since last fight))
+# 	priority = 1 - exp(-rate * days since last fetch), probability that the pages changed since then
+#
+# so an active champion is refetched much more often than a fighter retired in 1997
+
+# typical number of days between two fights of an active fighter
+ACTIVE_INTERVAL = 180
+
+# fighters fetched within this number of days are never refetched
+MIN_RECRAWL_DAYS = 1
+
+# requests needed to fetch a fighter, history and stats pages
+REQUESTS_PER_FIGHTER = 2
+
+SECONDS_PER_DAY = 86400
+
+class Frontier:
+	""" fighter urls and their fetch history in table 'Frontier'
+	"""
+
+	def __init__(self, db_file = 'ufc_frontier.db'):
+		""" constructor
+		:param db_file: database file name, relative to the script directory unless absolute
+		:return:
+		"""
+
+		self.db_file_ = os.path.join(os.path.dirname(os.path.realpath(__file__)), db_file)
+
+		# autocommit mode, transactions are started explicitly
+		self.conn = sqlite3.connect(self.db_file_, timeout = 60, isolation_level = None)
+
+		self.c = self.conn.cursor()
+
+		self.c.execute("""CREATE TABLE IF NOT EXISTS Frontier (
+					id integer PRIMARY KEY,
+					url text NOT NULL,
+					discovered real NOT NULL,
+					first_fetched real,
+					last_fetched real,
+					last_fight text,
+					fetches integer NOT NULL DEFAULT 0,
+					changes integer NOT NULL DEFAULT 0,
+					last_changed real,
+					signature text
+					)""")
+
+	def close(self):
+		self.c.close()
+		self.conn.close()
+
+	def count(self) -> int:
+		""" returns number of fighters in the frontier
+		"""
+
+		return self.c.execute("SELECT COUNT(*) FROM Frontier").fetchone()[0]
+
+	def add_urls(self, urls) -> int:
+		""" add discovered fighter urls, fighters which are already in the frontier are kept as they are
+		:param urls: list of fighter urls
+		:return: number of added fighters
+		"""
+
+		now = time.time()
+
+		self.c.execute('BEGIN IMMEDIATE')
+
+		try:
+			before = self.count()
+
+			self.c.executemany("INSERT OR IGNORE INTO Frontier (id, url, discovered) VALUES (?, ?, ?)",
+								[(database.UFCHistoryDB.get_fighter_id(url), url, now) for url in urls])
+
+			added = self.count() - before
+
+			self.c.execute('COMMIT')
+		except Exception as e:
+			self.c.execute('ROLLBACK')
+			raise e
+
+		metrics.inc('frontier_added_total', added)
+
+		return added
+
+	@staticmethod
+	def get_priority(row, now) -> float:
+		""" returns probability that pages of a fighter changed since the last fetch, see the top of this file
+		:param row: tuple of first_fetched, last_fetched, last_fight, changes
+		:param now: current timestamp
+		:return: priority in range 0 ~ 1, never fetched fighters get 1
+		"""
+
+		first_fetched, last_fetched, last_fight, changes = row
+
+		if last_fetched is None:
+			return 1.0
+
+		idle_days = (now - last_fetched) / SECONDS_PER_DAY
+
+		if idle_days < MIN_RECRAWL_DAYS:
+			return 0.0
+
+		if last_fight is not None:
+			inactive_days = (now - DT.strptime(last_fight, '%Y-%m-%d').timestamp()) / SECONDS_PER_DAY
+		else:
+			inactive_days = (now - first_fetched) / SECONDS_PER_DAY
+
+		observed_days = (last_fetched - first_fetched) / SECONDS_PER_DAY
+
+		rate = (changes + 1) / (observed_days + max(ACTIVE_INTERVAL, inactive_days))
+
+		return 1.0 - math.exp(-rate * idle_days)
+
+	def schedule(self, budget = None, urls = None) -> list:
+		""" returns urls of fighters to fetch in this run, most likely changed first
+		:param budget: maximum number of http requests of the run, None: all fighters which are due
+		:param urls: list of fighter urls to schedule from, e.g. a shard, None: all fighters in the frontier
+		:return: list of urls
+		"""
+
+		now = time.time()
+
+		rows = self.c.execute("SELECT id, url, first_fetched, last_fetched, last_fight, changes FROM Frontier").fetchall()
+
+		if urls is not None:
+			ids = set(database.UFCHistoryDB.get_fighter_id(url) for url in urls)
+			rows = [row for row in rows if row[0] in ids]
+
+		scheduled = [(Frontier.get_priority(row[2:], now), row[1]) for row in rows]
+
+		scheduled = [item for item in scheduled if item[0] > 0]
+
+		# NOTE: stable sort, ties(e.g. never fetched fighters) stay in order of ids
+		scheduled.sort(key = lambda item: item[0], reverse = True)
+
+		if budget is not None:
+			scheduled = scheduled[:budget // REQUESTS_PER_FIGHTER]
+
+		metrics.inc('frontier_scheduled_total', len(scheduled))
+
+		return [url for priority, url in scheduled]
+
+	@staticmethod
+	def get_signature(info) -> str:
+		""" returns a hash of fetched data of a fighter, it changes whenever anything on the pages changes
+		:param info: fetched tuple(see scraper.fetch_fighter)
+		:return: hex digest
+		"""
+
+		data = [info[1].to_dict()] + [[row.to_dict() for row in rows or []] for rows in info[2:]]
+
+		return hashlib.md5(json.dumps(data, sort_keys = True, default = str).encode('utf-8')).hexdigest()
+
+	def record_fetched(self, info_list) -> int:
+		""" record fetched fighters, last fight date and whether their data changed since the last fetch
+		:param info_list: list of fetched tuples(see scraper.fetch_fighter)
+		:return: number of changed fighters
+		"""
+
+		now = time.time()
+
+		self.c.execute('BEGIN IMMEDIATE')
+
+		try:
+			signatures = dict(self.c.execute("SELECT id, signature FROM Frontier").fetchall())
+
+			changed = 0
+
+			for info in info_list:
+				id_ = info[0]
+				signature = Frontier.get_signature(info)
+
+				dates = [row['DATE'] for row in info[2] or [] if 'DATE' in row]
+				last_fight = max(dates) if len(dates) > 0 else None
+
+				# a fighter fetched for the first time isn't counted as a change
+				is_changed = id_ in signatures and signatures[id_] is not None and signatures[id_] != signature
+
+				changed += is_changed
+
+				self.c.execute("""INSERT INTO Frontier (id, url, discovered, first_fetched, last_fetched, last_fight, fetches, changes, last_changed, signature)
+									VALUES (?, ?, ?, ?, ?, ?, 1, 0, NULL, ?)
+								ON CONFLICT(id) DO UPDATE SET first_fetched=COALESCE(first_fetched, excluded.first_fetched),
+									last_fetched=excluded.last_fetched, last_fight=excluded.last_fight, fetches=fetches + 1,
+									changes=changes + ?, last_changed=CASE WHEN ? THEN excluded.last_fetched ELSE last_changed END,
+									signature=excluded.signature""",
+								(id_, info[1]['url'], now, now, now, last_fight, signature, int(is_changed), int(is_changed)))
+
+			self.c.execute('COMMIT')
+		except Exception as e:
+			self.c.execute('ROLLBACK')
+			raise e
+
+		metrics.inc('frontier_changed_total', changed)
+
+		return changed
+
+	def status(self) -> dict:
+		""" returns number of fighters in the frontier, fetched and changed ones
+		"""
+
+		total, fetched, changed = self.c.execute("""SELECT COUNT(*), COUNT(last_fetched), COALESCE(SUM(changes > 0), 0)
+														FROM Frontier""").fetchone()
+
+		return {'total': total, 'fetched': fetched, 'changed': changed}
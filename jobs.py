@@ -0,0 +1,159 @@
+
+import os
+import time
+import socket
+import sqlite3
+
+import metrics
+import database
+
+# lease based job queue in a sqlite file shared by scraper processes on one or more hosts
+# NOTE: the file must be on a disk with working file locks, sqlite serializes claims with BEGIN IMMEDIATE
+#
+# status of a job: pending >> leased >> done
+# 					 		 leased >> pending(failed, retried) >> ... >> failed(max_attempts reached)
+# 					 		 leased >> pending(lease expired, worker died)
+
+class JobQueue:
+	""" queue of fighter urls in table 'Jobs'
+	"""
+
+	def __init__(self, db_file = 'ufc_jobs.db', lease_seconds = 600, max_attempts = 3):
+		""" constructor
+		:param db_file: shared database file name, relative to the script directory unless absolute
+		:param lease_seconds: seconds a claimed job is kept by a worker before others can take it over
+		:param max_attempts: number of attempts before a job is marked as failed
+		:return:
+		"""
+
+		self.db_file_ = os.path.join(os.path.dirname(os.path.realpath(__file__)), db_file)
+
+		self.lease_seconds = lease_seconds
+
+		self.max_attempts = max_attempts
+
+		# autocommit mode, transactions are started explicitly
+		self.conn = sqlite3.connect(self.db_file_, timeout = 60, isolation_level = None)
+
+		self.c = self.conn.cursor()
+
+		self.c.execute("""CREATE TABLE IF NOT EXISTS Jobs (
+					id integer NOT NULL,
+					url text PRIMARY KEY,
+					status text NOT NULL DEFAULT 'pending',
+					attempts integer NOT NULL DEFAULT 0,
+					worker text,
+					lease_until real,
+					error text,
+					updated real
+					)""")
+
+		self.c.execute("""CREATE INDEX IF NOT EXISTS index_jobs_status ON Jobs(status, lease_until)
+			""")
+
+	def close(self):
+		self.c.close()
+		self.conn.close()
+
+	@staticmethod
+	def default_worker():
+		""" returns a worker name unique per process, e.g. 'host-1234'
+		"""
+
+		return f'{socket.gethostname()}-{os.getpid()}'
+
+	def count(self) -> int:
+		""" returns number of jobs in the queue
+		"""
+
+		return self.c.execute("SELECT COUNT(*) FROM Jobs").fetchone()[0]
+
+	def add_urls(self, urls) -> int:
+		""" add fighter urls as pending jobs, urls which are already in the queue are ignored
+			ids are stable fighter ids of urls(see UFCHistoryDB.get_fighter_id), jobs are claimed in the order of urls
+		:param urls: list of fighter urls
+		:return: number of added jobs
+		"""
+
+		self.c.execute('BEGIN IMMEDIATE')
+
+		try:
+			before = self.count()
+
+			self.c.executemany("INSERT OR IGNORE INTO Jobs (id, url, updated) VALUES (?, ?, ?)",
+								[(database.UFCHistoryDB.get_fighter_id(url), url, time.time()) for url in urls])
+
+			added = self.count() - before
+
+			self.c.execute('COMMIT')
+		except Exception as e:
+			self.c.execute('ROLLBACK')
+			raise e
+
+		metrics.inc('jobs_added_total', added)
+
+		return added
+
+	def claim(self, worker, count = 1) -> list:
+		""" lease up to 'count' jobs to 'worker', pending jobs and jobs with an expired lease are claimed
+		:param worker: worker name
+		:param count: maximum number of jobs to claim
+		:return: list of tuples of id and url
+		"""
+
+		now = time.time()
+
+		self.c.execute('BEGIN IMMEDIATE')
+
+		try:
+			# expired leases which used up all attempts won't come back
+			self.c.execute("""UPDATE Jobs SET status='failed', error='lease expired', updated=?
+								WHERE status='leased' AND lease_until<? AND attempts>=?""", (now, now, self.max_attempts))
+
+			claimed = self.c.execute("""SELECT id, url FROM Jobs
+											WHERE status='pending' OR (status='leased' AND lease_until<?)
+											ORDER BY rowid LIMIT ?""", (now, count)).fetchall()
+
+			self.c.executemany("""UPDATE Jobs SET status='leased', attempts=attempts+1, worker=?, lease_until=?, updated=?
+									WHERE url=?""", [(worker, now + self.lease_seconds, now, url) for id_, url in claimed])
+
+			self.c.execute('COMMIT')
+		except Exception as e:
+			self.c.execute('ROLLBACK')
+			raise e
+
+		metrics.inc('jobs_claimed_total', len(claimed))
+
+		return claimed
+
+	def complete(self, worker, urls):
+		""" mark jobs as done
+		:param worker: worker name
+		:param urls: list of urls of finished jobs
+		:return:
+		"""
+
+		self.c.executemany("""UPDATE Jobs SET status='done', worker=?, lease_until=NULL, error=NULL, updated=?
+								WHERE url=?""", [(worker, time.time(), url) for url in urls])
+
+		metrics.inc('jobs_done_total', len(urls))
+
+	def fail(self, worker, url, error):
+		""" put a failed job back to the queue or mark it as failed once all attempts are used up
+		:param worker: worker name
+		:param url: url of failed job
+		:param error: error message
+		:return:
+		"""
+
+		self.c.execute("""UPDATE Jobs SET status=CASE WHEN attempts>=? THEN 'failed' ELSE 'pending' END,
+								worker=?, lease_until=NULL, error=?, updated=?
+							WHERE url=?""", (self.max_attempts, worker, error, time.time(), url))
+
+		metrics.inc('jobs_failed_total')
+
+	def status(self) -> dict:
+		""" returns number of jobs per status
+		"""
+
+		return dict(self.c.execute("SELECT status, COUNT(*) FROM Jobs GROUP BY status").fetchall())
@@ -1,498 +1,370 @@
 import sys, getopt
-import requests
-import string
-import threading
+import os
+import time
+import atexit
+import pickle
 import signal
-import progressbar
-from bs4 import BeautifulSoup
-from datetime import datetime as DT
 
-import database
-from excel import ExcelWriter
+import metrics
+import profiler
 
-# # global variable for progressbar
-# bar = None
+# NOTE: modules of stages(scraper, database, export, ...) are imported in the functions which need them,
+# 		so that e.g. 'python main.py export' doesn't pay for importing requests and bs4 at startup
 
-def list_to_string(list_: list, delimiter: str) -> str:
-	""" returns a string from given list joined with given delimiter
-	:param list_: source list
-	:param delimiter: delimiter which goes between strings to combine them into a string
-	:return: a string which is combined with all strings in the list by delimiter
-	"""
+# commands which run a single stage, see run_command
+COMMANDS = ('discover', 'scrape', 'ingest', 'reparse', 'export', 'sum', 'merge', 'bench', 'serve')
 
-	return delimiter.join(str(element) for element in list_)
+# default files passed between stages
+URLS_FILE = 'fighter_urls.txt'
+SCRAPED_FILE = 'scraped_fighters.pickle'
+ARCHIVE_FILE = 'pages.archive'
 
-def get_page_url(url: str, page_name: str) -> str:
-	""" this function retrieve url of fighter's stat page from profile url.
-	:param url: profile url
-	:param page_name: string to represent page name
-	:return: url of desired page
+def read_db_and_write_to_excel():
+	""" get necessary data from database and output into database
+	:param: None
+	:return: None
 	"""
-	
-	prefix = url.split('/')[:5]
-
-	suffix = url.split('/')[5:]
 
-	# no more work if prefix or suffix is empty
-	if prefix is None or suffix is None:
-		return None
-	# get prefix string from prefix list joined with delimiter
-	prefix_str = list_to_string(prefix, '/')
+	import database
 
-	# get suffix string from suffix list joined with delimiter
-	suffix_str = list_to_string(suffix, '/')
+	# create a DB instance
+	db = database.UFCHistoryDB('ufc_history.db', profile='read')
 
-	return  prefix_str + '/' + page_name + '/' + suffix_str
+	# get rows of information from all matches
+	rows = db.get_rows_for_schema()
 
-def get_fighter_url_list_startwith(start_ch: str) -> list:
-	""" returns a list of urls
-		urls of all fighters whose name start with start_ch
-	:param start_ch: a character which is at the very first of names
-	:return: list of fighters whose names starts with 'start_ch'
-	"""
+	# close database connection
+	db.close_connection()
 
-	source = requests.get(f'http://www.espn.com/mma/fighters?search={start_ch}').text
+	write_to_excel(rows)
 
-	soup = BeautifulSoup(source, 'lxml')
+def discover(shard = None, urls_file = None) -> list:
+	""" get urls of all fighters
+	:param shard: tuple of shard index and shard count to keep only fighters of the shard, None: all fighters
+	:param urls_file: file to write urls into one per line, None: don't write
+	:return: list of fighter urls
+	"""
 
-	# get table content from 'table' tag
-	tbl_content = soup.find('table')
+	import scraper
 
-	# create empty list
-	fighter_list = []
+	all_url_list = scraper.get_all_fighter_urls()
 
-	# find all trs from table content, filtered by classnames 'oddrow' and 'evenrow'
-	for tr in tbl_content.find_all('tr', class_=['oddrow', 'evenrow']):
-		# get url from anchor tag with property 'href'
-		sub_link = tr.a['href']
+	if shard is not None:
+		all_url_list = filter_shard(all_url_list, shard)
 
-		# attach main site url
-		link = f'http://www.espn.com{sub_link}'
+	if urls_file is not None:
+		with open(urls_file, 'w') as outfile:
+			outfile.write('\n'.join(all_url_list) + '\n')
 
-		# append the link to the list
-		fighter_list.append(link)
+		print(f'Urls of {len(all_url_list)} fighters are written to {urls_file}')
 
-	return fighter_list
+	return all_url_list
 
-def get_general_info(soup) -> dict:
-	""" returns a dictionary of fighter's general info
-	:param soup: soup object
-	:return: dictionary of general info
+def filter_shard(url_list, shard) -> list:
+	""" returns urls which belong to a shard
+	:param url_list: list of fighter urls
+	:param shard: tuple of shard index and shard count
+	:return: list of urls of the shard
 	"""
-	
-	# initialize info dictionary
-	info_list = {}
 
-	# get general info ul
-	general_info = soup.find('ul', class_='general-info')
+	import scraper
 
-	if general_info is None:
-		return info_list
+	index, count = shard
 
-	# print(general_info)
+	url_list = [url for url in url_list if scraper.get_shard(url, count) == index]
 
-	# initialize variables
-	name = None
-	age = None
-	weight_class = None
-	height = None
-	weight = None
-	reach = None
-	group_name = None
+	print(f'Shard {index}/{count}: {len(url_list)} fighters')
 
-	try:
-		name = soup.find('div', class_='mod-content').find('h1').text
-	except Exception as e:
-		pass
+	return url_list
 
-	if name is None:
-		try:
-			name = soup.find('div', class_='player-bio').find('h1').text
-		except Exception as e:
-			pass 
+def read_urls(urls_file) -> list:
+	""" read fighter urls written by discover
+	:param urls_file: file name
+	:return: list of urls, None if failed
+	"""
 
 	try:
-		tmp = general_info.find('li', class_="first last").text
-		if tmp.find('\"') != -1 or tmp.find("lbs") != -1:
-			if tmp.find(",") != -1:
-				height = tmp.split(",")[0]
-				weight = tmp.split(",")[1].strip()
-			else:
-				if tmp.find("lbs") != -1:
-					weight = tmp
-				else:
-					height = tmp
-		else:
-			weight_class = tmp
+		with open(urls_file) as infile:
+			return [line.strip() for line in infile if len(line.strip()) > 0]
 	except Exception as e:
-		pass
+		print(f'Cannot read urls from {urls_file}: {str(e)}')
+		return None
 
-	try:
-		item = general_info.find('li', class_='first')
-		if len(item['class']) == 1:
-			weight_class = item.text
-	except Exception as e:
-		pass
+def schedule(url_list, budget = None) -> list:
+	""" add discovered urls to the crawl frontier and pick the fighters to fetch in this run
+	:param url_list: list of fighter urls
+	:param budget: maximum number of http requests of the run, None: fetch all fighters
+	:return: list of fighter urls to fetch, most likely changed first
+	"""
 
-	try:
-		tmp = general_info.find(class_=None).text
-		if tmp.find('\"') != -1:
-			if tmp.find("lbs") != -1 and tmp.find(",") != -1:
-				height = tmp.split(',')[0]
-				weight = tmp.split(',')[1].strip()
-			else:
-				height = tmp
-		elif tmp.find("lbs") != -1:
-			weight = tmp
-	except Exception as e:
-		pass
+	import frontier
 
-	try:
-		item = general_info.find('li', class_='last')
-		if len(item['class']) == 1:
-			group_name = item.text
-	except Exception as e:
-		pass
+	crawl_frontier = frontier.Frontier()
 
-	try:
-		meta_data = soup.find('ul', class_='player-metadata')
-		# print(meta_data)
-		for li in meta_data.find_all('li'):
-			try:
-				span = li.find('span', text='Birth Date')
-				try:
-					age = (int)(li.text.split(":")[1].split(")")[0].strip())
-				except Exception as e:
-					pass
-			except Exception as e:
-				pass
+	print(f'Added {crawl_frontier.add_urls(url_list)} new fighters into the crawl frontier')
 
-			try:
-				span = li.find('span', text='Reach')
-				reach = li.text.split('Reach')[1].strip()
-			except Exception as e:
-				pass
+	if budget is not None:
+		url_list = crawl_frontier.schedule(budget, url_list)
 
-	except Exception as e:
-		pass
+		print(f'Scheduled {len(url_list)} fighters within the budget of {budget} requests')
 
-	info_list['name'] = name.strip()
-	info_list['age'] = age
-	info_list['reach'] = reach
-	info_list['weight_class'] = weight_class
-	info_list['height'] = height
-	info_list['weight'] = weight
-	info_list['group_name'] = group_name
+	crawl_frontier.close()
 
-	return info_list
+	return url_list
 
-def get_history_info(soup) -> list:
-	""" returns a list of sub lists
-		each sub list contains match _date, event, opponent, result, decision, rounds and time
-	:param soup: soup object
-	:return: list of dictionaries, each dictionary contains a single match info
+def scrape(url_list, workers, archive = None) -> list:
+	""" scrap all fighters on url_list and record them in the crawl frontier
+	:param url_list: list of fighter urls
+	:param workers: number of worker threads
+	:param archive: PageArchive to store fetched pages in, None: don't store
+	:return: list of fetched tuples(see scraper.fetch_fighter)
 	"""
 
-	# get fight history information from the table
-	#
-	# !NOTE: ensure there's only one table body on the history page
+	import scraper
+	import frontier
 
-	tbody = soup.find('table', class_='tablehead mod-player-stats')
+	print(f"Scraping information with {workers} workers...")
 
-	if tbody is None:
-		# print("Cannot find table on the page")
-		return []
+	scrape_started = time.perf_counter()
 
-	header_list = []
-	header_columns = tbody.find('tr', class_='colhead').find_all('td')
+	info_list = scraper.fetch_information(url_list, workers, archive)
 
-	history_list = []
+	metrics.observe('stage_seconds', time.perf_counter() - scrape_started, stage='scrape')
 
-	for row in tbody.find_all('tr', class_=['oddrow', 'evenrow']):
-		cells = row.find_all('td')
+	crawl_frontier = frontier.Frontier()
 
-		if len(cells) != len(header_columns):
-			# print("Warning(History): Column counts mismatch between header and rows!")
-			continue
+	print(f'{crawl_frontier.record_fetched(info_list)} fighters have changed since the last fetch')
 
-		if len(cells) == 0 or len(cells) == 1:
-			# print("No item in the row!")
-			continue
-		else:
-			index = 0
-			history = {}
-			for cell in cells:
-				if header_columns[index].text == 'DATE':
-					history[header_columns[index].text] = DT.strptime(cell.text, '%b %d, %Y').strftime('%Y-%m-%d')
-				else:
-					history[header_columns[index].text] = cell.text
-				if cell.find('a') != None:
-					history['opp_url'] = cell.find('a')['href']
-				index += 1
-
-			if len(history) > 0:
-				history_list.append(history)
-
-	return history_list
-
-def get_statistics(soup):
-	""" get standing statistics on stats page and returns a list of records
-	:param soup: soup object
-	:return: three lists - standing statistics, clinch statistics and ground statistics
+	crawl_frontier.close()
+
+	profiler.snapshot('info_list_filled')
+
+	return info_list
+
+def write_scraped(info_list, scraped_file):
+	""" save fetched data so that it can be written into database by a separate 'ingest' run
+	:param info_list: list of fetched tuples(see scraper.fetch_fighter)
+	:param scraped_file: file name
+	:return:
 	"""
-	standing_list = []
-	clinch_list = []
-	ground_list = []
-
-	for table in soup.find_all('table', class_='tablehead'):
-		title = table.find('tr', class_='stathead').find('td').text
-
-		if title == "STANDING STATISTICS":
-			# get header labels to determine column counts and labels
-			# this will allow you to scrap data without revising code 
-			# even if the columns are changed in the future
-			header_columns = []
-			header = table.find('tr', class_='colhead').find_all('td')
-
-			for column in header:
-				header_columns.append(column.text.replace("%", "PERCENT"))
-			
-			# get statistics
-			for row in table.find_all('tr', class_=['oddrow', 'evenrow']):# get rows of the table
-				if len(row) == 0 or len(row) == 1:
-					# print("No results for this statistics!")
-					continue
-
-				if len(row) != len(header_columns):
-					# print("Warning: Columns mismatch!")
-					continue
-
-				# initialize variables repeatedly used
-				index = 0
-				drow = {}
-
-				for cell in row.find_all('td'): # iterate through cells in the row
-					if header_columns[index] == 'DATE':
-						drow[header_columns[index]] = DT.strptime(cell.text, '%b %d, %Y').strftime('%Y-%m-%d')
-					else:
-						drow[header_columns[index]] = cell.text.replace("N/A", "") # add value to the dictionary
-
-					if cell.find('a') != None:
-						drow['opp_url'] = cell.find('a')['href']
-					index += 1
-
-				standing_list.append(drow) # add row to the list
-			# print(standing_list)
-			# print()
-
-		elif title == "CLINCH STATISTICS":
-			# get header labels to determine column counts and labels
-			# this will allow you to scrap data without revising code 
-			# even if the columns are changed in the future
-			header_columns = []
-			header = table.find('tr', class_='colhead').find_all('td')
-
-			for column in header:
-				header_columns.append(column.text.replace("%", "PERCENT"))
-
-			# get statistics
-			for row in table.find_all('tr', class_=['oddrow', 'evenrow']):# get rows of the table
-				if len(row) == 0 or len(row) == 1:
-					# print("No results for this statistics!")
-					continue
-
-				if len(row) != len(header_columns):
-					# print("Warning: Columns mismatch!")
-					continue
-
-				# initialize variables repeatedly used
-				index = 0
-				drow = {}
-
-				for cell in row.find_all('td'): # iterate through cells in the row
-					if header_columns[index] == 'DATE':
-						drow[header_columns[index]] = DT.strptime(cell.text, '%b %d, %Y').strftime('%Y-%m-%d')
-					else:
-						drow[header_columns[index]] = cell.text.replace("N/A", "") # add value to the dictionary
-						
-					if cell.find('a') != None:
-						drow['opp_url'] = cell.find('a')['href']
-					index += 1
-
-				clinch_list.append(drow) # add row to the list
-			# print(clinch_list)
-			# print()
-		elif title == "GROUND STATISTICS":
-			# get header labels to determine column counts and labels
-			# this will allow you to scrap data without revising code 
-			# even if the columns are changed in the future
-			header_columns = []
-			header = table.find('tr', class_='colhead').find_all('td')
-
-			for column in header:
-				header_columns.append(column.text.replace("%", "PERCENT"))
-
-			# get statistics
-			for row in table.find_all('tr', class_=['oddrow', 'evenrow']):# get rows of the table
-				if len(row) == 0 or len(row) == 1:
-					# print("No results for this statistics!")
-					continue
-
-				if len(row) != len(header_columns):
-					# print("Warning: Columns mismatch!")
-					continue
-
-				# initialize variables repeatedly used
-				index = 0
-				drow = {}
-
-				for cell in row.find_all('td'): # iterate through cells in the row
-					if header_columns[index] == 'DATE':
-						drow[header_columns[index]] = DT.strptime(cell.text, '%b %d, %Y').strftime('%Y-%m-%d')
-					else:
-						drow[header_columns[index]] = cell.text.replace("N/A", "") # add value to the dictionary
-						
-					if cell.find('a') != None:
-						drow['opp_url'] = cell.find('a')['href']
-					index += 1
-
-				ground_list.append(drow) # add row to the list
-			# print(ground_list)
-			# print()
-		else:
-			print("Unknown statistics! Skipping over.")
-			continue
 
-	return standing_list, clinch_list, ground_list
+	with open(scraped_file, 'wb') as outfile:
+		pickle.dump(info_list, outfile)
 
+	print(f'{len(info_list)} fighters are written to {scraped_file}')
 
-def read_db_and_write_to_excel():
-	""" get necessary data from database and output into database
-	:param: None
-	:return: None
+def read_scraped(scraped_file) -> list:
+	""" load fetched data written by write_scraped
+	:param scraped_file: file name
+	:return: list of fetched tuples, None if failed
 	"""
 
-	# create a DB instance
-	db = database.UFCHistoryDB('ufc_history.db')
+	try:
+		with open(scraped_file, 'rb') as infile:
+			return pickle.load(infile)
+	except Exception as e:
+		print(f'Cannot read fetched data from {scraped_file}: {str(e)}')
+		return None
 
-	# get rows of information from all matches
-	rows = db.get_rows_for_schema()
+def write_to_database(info_list, db_file = 'ufc_history.db', refresh = False):
+	""" insert fetched data into a new database
+	:param info_list: list of fetched tuples(see scraper.fetch_fighter)
+	:param db_file: database file name
+	:param refresh: True: update fighters of an existing database and keep the others, False: create a new database
+	:return:
+	"""
+
+	import progressbar
+	import database
+
+	print('Writing fetched data into database...')
+
+	db_started = time.perf_counter()
+
+	db = database.UFCHistoryDB(db_file, not refresh or not os.path.isfile(os.path.join(os.path.dirname(os.path.realpath(database.__file__)), db_file)), upgrade = True)
+
+	db_bar = progressbar.ProgressBar(maxval=len(info_list), \
+	widgets=[progressbar.Bar('=', '[', ']'), ' ', progressbar.Percentage(), ' | ', progressbar.Counter(), '/', str(len(info_list))])
+	db_bar.start()
+
+	# begin transaction on sqlite3 database
+	# NOTE: this is important to optimize writing performance
+	db.execute('BEGIN TRANSACTION')
+
+	db.insert_fetched(info_list, db_bar)
+
+	if refresh:
+		# opponents of fighters which are not refreshed may be known now
+		db.resolve_history_opponents()
+
+	# materialized aggregates of the refreshed fighters, all of them in a new database
+	db.refresh_aggregates([item[0] for item in info_list] if refresh else None)
+
+	db_bar.finish()
+
+	# commit all pending insert queries
+	db.execute('COMMIT')
 
-	# close database connection
 	db.close_connection()
 
-	write_to_excel(rows)
+	metrics.observe('stage_seconds', time.perf_counter() - db_started, stage='db_insert')
+
+	profiler.snapshot('db_inserted')
+
+	print('Writing fetched data into database is completed!')
 
-def fetch_information(start_id, url_list, key):
-	""" iterate over url_list, send get request per each url, scrap data and write data into database
-	:param start_id: starting point of unique id of fighter on url_list
-	:param url_list: list of fighter urls 
-	:param key: first character of fighters' names
+def build_outputs(outputs = None, db_file = 'ufc_history.db', delta = False, use_cache = True):
+	""" build outputs from an existing database
+	:param outputs: list of output names(see export.ALL_OUTPUTS), None: export.DEFAULT_OUTPUTS
+	:param db_file: database file name
+	:param delta: True: write only matches added since the last export into part files
+	:param use_cache: True: reuse the export dataset of the last export if the database is unchanged
+	:return:
 	"""
 
-	# total number of fighter information from all threads
-	# used to update progress bar
-	global fetched_fighter_count
+	import database
+	import export
 
-	# this bar represents total count from all threads
-	global bar
+	db = database.UFCHistoryDB(db_file, profile='read')
+	db.export_outputs = outputs if outputs is not None else export.DEFAULT_OUTPUTS
+	db.export_delta = delta
+	db.use_export_cache = use_cache
+	db.get_rows_for_schema()
 
-	id_ = start_id
+	print('Done!')
 
-	tmp_list = []
+def get_db_file(options) -> str:
+	""" returns database file name of a run, --db or shard database or ufc_history.db
+	"""
 
-	for furl in url_list:
-		try:
-			source = requests.get(get_page_url(furl, 'history')).text
-		except Exception as e:
-			print(f'Error(Main.request.get.history): {str(e)}')
-			id_ += 1
-			continue
-		
-		# get soup object
-		soup = BeautifulSoup(source, 'lxml')
-		# print(furl)
+	if options['db'] is not None:
+		return options['db']
 
-		ginfo = {}
-		ginfo = get_general_info(soup)
+	if options['shard'] is not None:
+		import merge
+		return merge.get_shard_file(*options['shard'])
 
-		if len(ginfo) == 0:
-			print(f'Cannot get general information from this url(F1): {furl}')
-			print()
-		
-		ginfo['url'] = furl
+	return 'ufc_history.db'
 
-		hinfo = get_history_info(soup)
+def get_archive(options):
+	""" returns PageArchive of a scraping run, --archive or shard/worker archive or pages.archive
+	:return: PageArchive, None if disabled by --no-archive
+	"""
 
-		try:
-			source = requests.get(get_page_url(furl, 'stats')).text
-		except Exception as e:
-			print(f'Error((F1)Main.request.get.stats): {str(e)}')
-			id_ += 1
-			continue
-		
-		# get soup object
-		soup = BeautifulSoup(source, 'lxml')
+	if options['archive'] == '':
+		return None
 
-		ss, cs, gs = get_statistics(soup)
-		# hinfo, ss, cs, gs = None, None, None, None
+	from archive import PageArchive
 
-		tmp_list.append((id_, ginfo, hinfo, ss, cs, gs))
+	if options['archive'] is not None:
+		return PageArchive(options['archive'])
 
-		fetched_fighter_count += 1
+	if options['jobs'] is not None:
+		return PageArchive(f'pages.{options["worker"]}.archive')
 
-		bar.update(fetched_fighter_count)
+	if options['shard'] is not None:
+		return PageArchive('pages.shard{}of{}.archive'.format(*options['shard']))
 
-		id_ += 1
+	return PageArchive(ARCHIVE_FILE)
 
-	# add fetched data from a thread into a list(global variable)
-	info_list.append(tmp_list)
+def run_mode(options):
+	""" run all stages of a mode given by -m
+	:param options: dictionary of options, see parse_args
+	:return:
+	"""
 
-	# all threads are completed, insert data into database
-	if len(info_list) >= total_thread_count:
+	mode = options['mode']
 
-		bar.finish()
+	if mode == 2:
+		build_outputs(options['outputs'], get_db_file(options), options['delta'], options['cache'])
+		return
 
-		print('Writing fetched data into database...')
+	import scraper
 
-		db = database.UFCHistoryDB('ufc_history.db', True)
+	archive = get_archive(options)
 
-		db_bar = progressbar.ProgressBar(maxval=total_fighter_count, \
-		widgets=[progressbar.Bar('=', '[', ']'), ' ', progressbar.Percentage(), ' | ', progressbar.Counter(), '/', str(total_fighter_count)])
-		db_bar.start()
+	if options['jobs'] is not None:
+		scraper.fetch_jobs(options['jobs'], options['worker'], options['workers'], archive)
 
-		counter = 0
+		if mode == 0:
+			print('Outputs are not built for a job worker, merge all worker databases with merge.py and run mode 2')
+		return
 
-		# begin transaction on sqlite3 database
-		# NOTE: this is important to optimize writing performance
-		db.execute('BEGIN TRANSACTION')
+	info_list = scrape(schedule(discover(options['shard']), options['budget']), options['workers'], archive)
 
-		# bulk insert into database
-		for info in info_list: # loop through information list fetched
-			for item in info:
-				db.insert_into_table_fighters(item[0], item[1])
-				db.insert_into_table_history(item[0], item[2])
-				db.insert_into_table_standing_stats(item[0], item[3])
-				db.insert_into_table_clinch_stats(item[0], item[4])
-				db.insert_into_table_ground_stats(item[0], item[5])
+	write_to_database(info_list, get_db_file(options), options['budget'] is not None)
 
-			# increase counter to update progress bar
-			counter += 1
+	if mode == 0:
+		if options['shard'] is not None:
+			print('Outputs are not built for a shard, merge all shards with merge.py and run mode 2')
+		else:
+			build_outputs(options['outputs'], get_db_file(options), options['delta'], options['cache'])
+
+def run_command(options):
+	""" run a single stage
+	:param options: dictionary of options, see parse_args
+	:return:
+	"""
+
+	command = options['command']
+	args = options['args']
+
+	if command == 'discover':
+		discover(options['shard'], options['urls'] or URLS_FILE)
+
+	elif command == 'scrape':
+		if options['jobs'] is not None:
+			import scraper
+			scraper.fetch_jobs(options['jobs'], options['worker'], options['workers'], get_archive(options))
+			return
+
+		if options['urls'] is not None:
+			url_list = read_urls(options['urls'])
+			if url_list is None:
+				sys.exit()
+			if options['shard'] is not None:
+				url_list = filter_shard(url_list, options['shard'])
+		else:
+			url_list = discover(options['shard'])
+
+		url_list = schedule(url_list, options['budget'])
 
-			# update progress bar
-			db_bar.update(counter)
+		write_scraped(scrape(url_list, options['workers'], get_archive(options)), options['scraped'] or SCRAPED_FILE)
 
-		db_bar.finish()
+	elif command == 'ingest':
+		info_list = read_scraped(options['scraped'] or SCRAPED_FILE)
+		if info_list is None:
+			sys.exit()
 
-		# commit all pending insert queries
-		db.execute('COMMIT')
+		write_to_database(info_list, get_db_file(options), options['budget'] is not None)
 
-		print('Writing fetched data into database is completed!')
+	elif command == 'reparse':
+		import scraper
+		info_list = scraper.reparse_archives(args or [ARCHIVE_FILE])
 
-		if work_mode == 0:
-			db.get_rows_for_schema()
+		write_to_database(info_list, get_db_file(options))
 
-		print('Done!')
+	elif command == 'export':
+		build_outputs(options['outputs'], get_db_file(options), options['delta'], options['cache'])
+
+	elif command == 'sum':
+		import export
+		build_outputs(list(export.SUM_OUTPUTS), get_db_file(options), options['delta'], options['cache'])
+
+	elif command == 'merge':
+		import merge
+		if len(args) == 0:
+			print('python main.py merge <shard_db> [<shard_db> ...]')
+			sys.exit()
+		merge.merge_shards(args, options['db'] or 'ufc_history.db')
+
+	elif command == 'bench':
+		import bench
+		bench.bench_profiles(fighters = int(args[0]) if len(args) > 0 else 2000, fights = int(args[1]) if len(args) > 1 else 15000)
+
+	elif command == 'serve':
+		import server
+		server.serve(options['db'] or 'ufc_history.db', int(args[0]) if len(args) > 0 else 8000)
 
 def signal_handler(sig: int, frame):
 	""" Signal handler
@@ -506,32 +378,173 @@ def signal_handler(sig: int, frame):
 	print('End the process according to request.')
 	sys.exit()
 
+def print_usage():
+	print('python main.py [<command>] [options]')
+	print('Commands, each of them runs a single stage:')
+	print(f'  discover: write urls of fighters into --urls <file>, default: {URLS_FILE}')
+	print(f'  scrape: scrap fighters on --urls <file>(discovered if not given) into --scraped <file>, default: {SCRAPED_FILE}')
+	print('  ingest: write fighters of --scraped <file> into --db <file>, default: ufc_history.db or shard database, updated in place with --budget')
+	print(f'  reparse [<archive> ...]: parse archived pages again without network into --db <file>, default archive: {ARCHIVE_FILE}')
+	print('  export: build -o <outputs> from --db <file>')
+	print('  sum: build outputs which need sums of statistics(ufc_history_sum.xlsx, match_history.db)')
+	print('  merge <shard_db> ...: merge shard or worker databases into --db <file>')
+	print('  bench [fighters] [fights]: benchmark database profiles')
+	print('  serve [port]: serve query API of --db <file>')
+	print('Without a command, all stages of -m <mode> are run:')
+	print('  Mode 0: default mode | scrap >> write_to_database >> output to excel')
+	print('  Mode 1: scrap >> write_to_database')
+	print('  Mode 2: output to excel based on already existing databse')
+	print('Options: -m <number> -o <outputs> --metrics-port <port> --report <file> --profile -w <workers> --shard <index>/<count> --jobs <file> --worker <name> --urls <file> --scraped <file> --db <file> --archive <file> --no-archive --budget <requests> --delta --no-cache')
+
 def parse_args(argv):
 	""" main function to handle argument parsing and do actual work
 	:param argv: list of argument
-	:return: mode as a single digit
+	:return: dictionary of options, 'command' as one of COMMANDS(None: run all stages of 'mode'), 'args' as list of positional arguments,
+			'mode' as a single digit, 'outputs' as list of output names to build(None: default outputs),
+			'metrics_port' to expose prometheus metrics on(None: disabled), 'report' as metrics report file name,
+			'profile' True to profile the run, 'workers' as number of scraping threads,
+			'shard' as tuple of shard index and shard count(None: scrap all fighters),
+			'jobs' as shared job queue file(None: scrap without queue), 'worker' as worker name,
+			'urls', 'scraped' and 'db' as files of stages(None: default files),
+			'archive' as archive of fetched pages(None: default archive, '': don't archive),
+			'budget' as maximum number of http requests to refresh fighters(None: scrap all fighters),
+			'delta' True to export only matches added since the last export,
+			'cache' False to build the export dataset again even if the database is unchanged
 	"""
 
+	# single stage to run, None: run all stages of mode
+	command = None
+
+	if len(argv) > 0 and argv[0] in COMMANDS:
+		command = argv[0]
+		argv = argv[1:]
+
 	# value 0: default mode | scrap >> write_to_database >> output to excel
 	# value 1: scrap >> write_to_database
 	# value 2: output to excel based on already existing databse
 	mode = 0
 
+	# outputs to build in mode 0 and 2, None: export.DEFAULT_OUTPUTS
+	outputs = None
+
+	# port to expose prometheus metrics on, None: disabled
+	metrics_port = None
+
+	# file name of json report written at the end of the run
+	report = 'run_report.json'
+
+	# profile all threads and take memory snapshots at stage boundaries
+	profile = False
+
+	# number of worker threads which scrap fighters from a shared queue
+	workers = 32
+
+	# scrap only fighters of one shard into its own database, e.g. (3, 8)
+	shard = None
+
+	# pull fighters from a job queue shared by several processes instead of scraping all of them
+	jobs_file = None
+
+	# name of this worker in the job queue, None: host name and process id
+	worker = None
+
+	# files passed between stages, None: default files
+	urls_file = None
+	scraped_file = None
+	db_file = None
+
+	# archive of fetched pages, None: pages.archive or shard/worker archive, '': don't archive
+	archive_file = None
+
+	# refresh only fighters which most likely changed within this number of requests, see frontier.py
+	budget = None
+
+	# write only matches added since the last export into part files, see export.py
+	delta = False
+
+	# reuse the export dataset of the last export if the database is unchanged
+	use_cache = True
+
 	try:
-		opts, args = getopt.getopt(argv,"hm:", ["mode="])
+		opts, args = getopt.getopt(argv,"hm:o:w:", ["mode=", "outputs=", "metrics-port=", "report=", "profile", "workers=", "shard=", "jobs=", "worker=",
+													"urls=", "scraped=", "db=", "archive=", "no-archive", "budget=", "delta", "no-cache"])
 	except getopt.GetoptError:
-		print('Argument Error: python main.py -m <number>')
+		print('Argument Error')
+		print_usage()
 		sys.exit()
 
 	for opt, arg in opts:
 		if opt == '-h':
-			print('python main.py -m <number>')
-			print('Mode 0: default mode | scrap >> write_to_database >> output to excel')
-			print('Mode 1: scrap >> write_to_database')
-			print('Mode 2: output to excel based on already existing databse')
+			import export
+			print_usage()
+			print(f'Outputs: comma separated list of {",".join(export.ALL_OUTPUTS)}, default: {",".join(export.DEFAULT_OUTPUTS)}')
+			print('Metrics port: expose prometheus metrics on http://127.0.0.1:<port>, disabled by default')
+			print('Report: json file of per-stage metrics written at the end of the run, default: run_report.json')
+			print('Profile: profile every thread with cProfile and take tracemalloc snapshots per stage, reports go to ./profile')
+			print('Workers: number of threads which scrap fighters, default: 32')
+			print('Shard: scrap only fighters of shard <index> of <count> into ufc_history.shard<index>of<count>.db, merge them with merge.py')
+			print('Jobs: pull fighters from job queue <file> shared by several worker processes, each of them writes into ufc_history.<worker>.db')
+			print('Delta: export only matches added since the last export into part files(e.g. ufc_history.part1.xlsx), outputs with an invalid watermark are rebuilt')
+			print('No cache: build the export dataset again instead of reusing export_cache.pickle of an unchanged database')
+			print('Budget: refresh the fighters most likely changed since their last fetch with at most <requests> http requests, the database is updated in place')
+			print(f'Archive: fetched pages are kept compressed in <file> to reparse them later, default: {ARCHIVE_FILE}, pages.shard<index>of<count>.archive or pages.<worker>.archive')
 			sys.exit(2)
 		elif opt in ("-m", "--mode"):
 			mode = int(arg)
+		elif opt in ("-o", "--outputs"):
+			import export
+			outputs = export.parse_outputs(arg)
+			if outputs is None:
+				sys.exit()
+		elif opt == "--metrics-port":
+			metrics_port = int(arg)
+		elif opt == "--report":
+			report = arg
+		elif opt == "--profile":
+			profile = True
+		elif opt in ("-w", "--workers"):
+			workers = int(arg)
+		elif opt == "--shard":
+			try:
+				shard = tuple(int(value) for value in arg.split('/'))
+			except ValueError:
+				shard = None
+
+			if shard is None or len(shard) != 2 or shard[1] < 1 or shard[0] not in range(1, shard[1] + 1):
+				print('Argument Error: Shard should be <index>/<count>, e.g. 3/8, index in range 1 ~ count')
+				sys.exit()
+		elif opt == "--jobs":
+			jobs_file = arg
+		elif opt == "--worker":
+			worker = arg
+		elif opt == "--urls":
+			urls_file = arg
+		elif opt == "--scraped":
+			scraped_file = arg
+		elif opt == "--db":
+			db_file = arg
+		elif opt == "--archive":
+			archive_file = arg
+		elif opt == "--no-archive":
+			archive_file = ''
+		elif opt == "--budget":
+			budget = int(arg)
+		elif opt == "--delta":
+			delta = True
+		elif opt == "--no-cache":
+			use_cache = False
+
+	if jobs_file is not None and worker is None:
+		import jobs
+		worker = jobs.JobQueue.default_worker()
+
+	if budget is not None and budget < 1:
+		print('Argument Error: Budget should be greater than 0')
+		sys.exit()
+
+	if workers < 1:
+		print('Argument Error: Workers should be greater than 0')
+		sys.exit()
 
 	if mode not in range(0, 3):
 		print('Argument Error: Mode should be in range 0 ~ 2')
@@ -540,143 +553,30 @@ def parse_args(argv):
 		print('Mode 2: output to excel based on already existing databse')
 		sys.exit()
 
-	return mode
+	return {'command': command, 'args': args, 'mode': mode, 'outputs': outputs, 'metrics_port': metrics_port, 'report': report, 'profile': profile,
+			'workers': workers, 'shard': shard, 'jobs': jobs_file, 'worker': worker, 'urls': urls_file, 'scraped': scraped_file, 'db': db_file,
+			'archive': archive_file, 'budget': budget, 'delta': delta, 'cache': use_cache}
 
 if __name__ == "__main__":
 
-	""" represents how the script should work
-	value True: Just scrap and write to database without excel output
-	value False: scrap, write to db and make excel output
-	"""
-	global work_mode
-
-	work_mode = parse_args(sys.argv[1:])
+	options = parse_args(sys.argv[1:])
 	
 	signal.signal(signal.SIGINT, signal_handler)
 
-	if work_mode == 2:
-		db = database.UFCHistoryDB('ufc_history.db')
-		db.get_rows_for_schema()
-	else:
+	if options['metrics_port'] is not None:
+		metrics.start_http_server(options['metrics_port'])
 
-		fighter_urls = {}
+	# write metrics report once all threads are finished
+	# NOTE: atexit handlers run after all non-daemon threads are joined
+	atexit.register(metrics.write_report, options['report'])
 
-		search_keys = list(string.ascii_lowercase)
+	if options['profile']:
+		profiler.enable()
 
-		print("Fetching urls of fighters...")
+		# merge profiles and write reports once all threads are finished
+		atexit.register(profiler.finish)
 
-		count_list = []
-
-		# global variable for total count of fighters
-		global total_fighter_count
-		total_fighter_count = 0
-
-		# this is used to update progress bar for scraping
-		global fetched_fighter_count
-		fetched_fighter_count = 0
-
-		# represents total count of threads to scrap
-		global total_thread_count
-		total_thread_count = 0
-
-		""" defines how to split list into threads
-		value 'alphabet': all urls of fighters whose name starts with a unique alphabet goes into a single thread
-		value 'specify_count_per_thread': every thread contains only specified number of urls
-		"""
-
-		thread_distribution_mode = 'specify_count_per_thread'
-
-		# represents how many urls are charged for each thread
-		count_per_thread = 50
-
-		# list of urls of fighters
-		all_url_list = []
-
-		# this progress bar is used to show the progress of fetching urls of all fighters
-		url_bar = progressbar.ProgressBar(maxval=len(search_keys), \
-			widgets=[progressbar.Bar('=', '[', ']'), ' ', progressbar.Percentage(), ' | ', progressbar.Counter(), '/', str(len(search_keys))])
-		url_bar.start()
-
-		# this mode does create 26 threads for each alphabet
-		if thread_distribution_mode == 'alphabet':
-
-			try:
-				for index, key in enumerate(search_keys):
-					url_list = get_fighter_url_list_startwith(key)
-					fighter_urls[key] = url_list
-					count_list.append(len(url_list))
-					total_fighter_count += len(url_list)
-					total_thread_count = len(fighter_urls)
-					url_bar.update(index + 1)
-
-			except Exception as e:
-
-				print(f'Failed to fetch urls due to error: {str(e)}')
-				exit()
-		# this mode do multithreading to speed up scraping
-		elif thread_distribution_mode == 'specify_count_per_thread':
-			try:
-				for index, key in enumerate(search_keys):
-
-					url_list = get_fighter_url_list_startwith(key)
-					all_url_list += url_list
-					total_fighter_count += len(url_list)
-					url_bar.update(index + 1)
-
-				# divide all_url_list into smaller lists which contain 'count_per_thread' number of fighter urls maximum
-				tmp_list = [all_url_list[x:x + count_per_thread] for x in range(0, len(all_url_list), count_per_thread)]
-
-				all_url_list.clear()
-
-				all_url_list = tmp_list
-
-				# get required thread count
-				total_thread_count = len(all_url_list)
-
-			except Exception as e:
-
-				print(f'Failed to fetch urls due to error: {str(e)}')
-				url_bar.finish()
-				exit()
-		else:
-			print('Unknown thread_distribution_mode.')
-			url_bar.finish()
-			exit()
-
-		url_bar.finish()
-
-		print(f'Fetched {total_fighter_count} urls in total!')
-
-		key_index = 0
-
-		print("Scraping information...")
-
-		# list that contains all information fetched
-		global info_list
-		info_list = []
-
-		# this progress bar shows the progress of scraping informations of fighters, history, statistics ...
-		global bar
-
-		bar = progressbar.ProgressBar(maxval=total_fighter_count, \
-			widgets=[progressbar.Bar('=', '[', ']'), ' ', progressbar.Percentage(), ' | ', progressbar.Counter(), '/', str(total_fighter_count)])
-		bar.start()
-
-		# create threads that do actual scraping
-		if thread_distribution_mode == 'alphabet':
-
-			for key in search_keys:
-
-				thread_ = threading.Thread(target=fetch_information, args=(sum(count_list[:key_index]) + 1, fighter_urls[key], key))
-
-				key_index += 1
-
-				thread_.start()
-		elif thread_distribution_mode == 'specify_count_per_thread':
-
-			for index, list_ in enumerate(all_url_list):
-
-				thread_ = threading.Thread(target=fetch_information, args=(count_per_thread * index + 1, list_, str(index + 1)))
-
-				thread_.start()
-	
\ No newline at end of file
+	if options['command'] is None:
+		run_mode(options)
+	else:
+		run_command(options)
@@ -0,0 +1,174 @@
+
+import time
+from bisect import bisect_left
+from bisect import bisect_right
+
+import metrics
+import database
+
+# in-memory matchup index over the fight history of a database
+# NOTE: every fighter keeps its own matches sorted by date with prefix sums of statistics,
+# 		so cumulative statistics as of any date are a single bisect away
+#
+# 	dates[id]: sorted match dates of fighter 'id'
+# 	sums[id]: prefix sums, sums[id][i] is the total of the first i matches(fights, wins, losses, SUM_COLUMNS...)
+# 	opponents[id]: set of opponent ids, both directions
+#
+# statistics of a match are the fighter's own ones, the same ones get_rows_for_schema exports
+
+# columns of prefix sums, followed by database.SUM_COLUMNS
+RECORD_COLUMNS = ('Fights', 'Wins', 'Losses')
+
+class MatchupIndex:
+	""" per-fighter sorted matches and opponent adjacency built from a UFCHistoryDB
+		index is rebuilt lazily when the data version of the database changes
+	"""
+
+	def __init__(self, db):
+		""" constructor
+		:param db: UFCHistoryDB instance, usually read-only
+		:return:
+		"""
+
+		self.db = db
+
+		# data version of the database the index is built from, None: not built yet
+		self.version = None
+
+		self.dates = {}
+		self.sums = {}
+		self.opponents = {}
+
+	@staticmethod
+	def parse_stats(row) -> tuple:
+		""" returns statistics of a match in order of database.SUM_COLUMNS
+		:param row: tuple of sdbl_a, sdhl_a, sdll_a and the other 29 statistics columns as in get_rows
+		:return: tuple of integers, zeros if statistics of the match are missing
+		"""
+
+		if row[0] is None:
+			return (0,) * len(database.SUM_COLUMNS)
+
+		values = []
+
+		# landed/attempted pairs
+		for value in row[:3]:
+			if value is not None and '/' in value:
+				values.extend(database.UFCHistoryDB.atoi(part) for part in value.split('/')[:2])
+			else:
+				values.extend((0, 0))
+
+		values.extend(database.UFCHistoryDB.atoi(value) for value in row[3:])
+
+		return tuple(values)
+
+	def build(self):
+		""" build the index from the database
+		:param:
+		:return:
+		"""
+
+		started = time.perf_counter()
+
+		# databases created before opponent ids were resolved at ingest don't have History.opp_id
+		columns = [column[1] for column in self.db.conn.execute("PRAGMA table_info(History)").fetchall()]
+		opp_id = 'h.opp_id' if 'opp_id' in columns else 'NULL'
+
+		# NOTE: statistics count only if all three tables have the match, like in get_rows
+		sql = f"""SELECT h.id, h.match_date, h.result, COALESCE({opp_id}, f.id),
+						CASE WHEN c.id IS NULL OR g.id IS NULL THEN NULL ELSE s.sdbl_a END, s.sdhl_a, s.sdll_a,
+						s.tsl, s.tsa, s.ssl, s.ssa, s.sa, s.kd,
+						c.scbl, c.scba, c.schl, c.scha, c.scll, c.scla, c.rv, c.sr, c.tdl, c.tda, c.tds,
+						g.sgbl, g.sgba, g.sghl, g.sgha, g.sgll, g.sgla, g.ad, g.adtb, g.adhg, g.adtm, g.adts, g.sm
+						FROM History h
+						LEFT JOIN Fighters f ON f.url=h.opp_url
+						LEFT JOIN StandingStatistics s ON s.id=h.id AND s.match_date=h.match_date AND s.opp_url=h.opp_url
+						LEFT JOIN ClinchStatistics c ON c.id=h.id AND c.match_date=h.match_date AND c.opp_url=h.opp_url
+						LEFT JOIN GroundStatistics g ON g.id=h.id AND g.match_date=h.match_date AND g.opp_url=h.opp_url
+						ORDER BY h.id, h.match_date, h.rowid"""
+
+		dates = {}
+		sums = {}
+		opponents = {}
+
+		for row in self.db.conn.execute(sql):
+			id_, match_date, result, opponent = row[:4]
+
+			if id_ not in dates:
+				dates[id_] = []
+				sums[id_] = [(0,) * (len(RECORD_COLUMNS) + len(database.SUM_COLUMNS))]
+
+			values = (1, int(result == 'Win'), int(result == 'Loss')) + MatchupIndex.parse_stats(row[4:])
+
+			dates[id_].append(match_date)
+			sums[id_].append(tuple(total + value for total, value in zip(sums[id_][-1], values)))
+
+			if opponent is not None:
+				opponents.setdefault(id_, set()).add(opponent)
+				opponents.setdefault(opponent, set()).add(id_)
+
+		self.dates = dates
+		self.sums = sums
+		self.opponents = opponents
+
+		metrics.observe('matchup_index_build_seconds', time.perf_counter() - started)
+
+	def ensure(self):
+		""" rebuild the index if the database changed since it was built
+		:param:
+		:return:
+		"""
+
+		version = self.db.data_version()
+
+		if version != self.version:
+			self.build()
+			self.version = version
+
+	def get_stats_as_of(self, id_, date, inclusive = False) -> dict:
+		""" returns cumulative statistics of a fighter going into a date
+		:param id_: unique fighter identifier
+		:param date: date, 'YYYY-MM-DD'
+		:param inclusive: True: include matches on 'date', False: only matches before it
+		:return: dictionary of RECORD_COLUMNS and SUM_COLUMNS, None if the fighter is unknown
+		"""
+
+		self.ensure()
+
+		if id_ not in self.dates:
+			return None
+
+		dates = self.dates[id_]
+		count = bisect_right(dates, date) if inclusive else bisect_left(dates, date)
+
+		result = dict(zip(RECORD_COLUMNS + database.SUM_COLUMNS, self.sums[id_][count]))
+		result['LastDate'] = dates[count - 1] if count > 0 else None
+
+		return result
+
+	def get_matchup(self, id1, id2, date) -> dict:
+		""" returns cumulative statistics of both fighters going into their fight on a date
+		:param id1: unique identifier of fighter 1
+		:param id2: unique identifier of fighter 2
+		:param date: date of the fight, 'YYYY-MM-DD'
+		:return: dictionary of date and statistics of both fighters, None if any of them is unknown
+		"""
+
+		f1 = self.get_stats_as_of(id1, date)
+		f2 = self.get_stats_as_of(id2, date)
+
+		if f1 is None or f2 is None:
+			return None
+
+		return {'Date': date, 'F1Id': id1, 'F2Id': id2, 'F1': f1, 'F2': f2}
+
+	def get_common_opponents(self, id1, id2) -> list:
+		""" returns opponents both fighters fought
+		:param id1: unique identifier of fighter 1
+		:param id2: unique identifier of fighter 2
+		:return: sorted list of fighter ids
+		"""
+
+		self.ensure()
+
+		return sorted(self.opponents.get(id1, set()) & self.opponents.get(id2, set()))
@@ -0,0 +1,137 @@
+
+import os
+import sys
+import time
+
+import database
+import metrics
+
+# merges shard databases written by 'python main.py --shard <index>/<count>' into a single database
+#
+# 	python merge.py <shard_db> [<shard_db> ...]
+#
+# NOTE: fighter ids are stable(see UFCHistoryDB.get_fighter_id), so rows are copied as they are and
+# 		a fighter which is already merged is replaced with all of its rows by the later shard
+
+# tables keyed by fighter id which are copied from shards
+MERGED_TABLES = ('History', 'StandingStatistics', 'ClinchStatistics', 'GroundStatistics')
+
+def get_shard_file(index, count):
+	""" returns file name of shard database
+	:param index: shard index starting from 1
+	:param count: total number of shards
+	:return: file name
+	"""
+
+	return f'ufc_history.shard{index}of{count}.db'
+
+def merge_shard(db, shard_file):
+	""" copy all rows of a shard database into db in bulk
+	:param db: UFCHistoryDB instance of the merged database
+	:param shard_file: path to shard database
+	:return: tuple of number of merged fighters and number of replaced(already merged) fighters
+	"""
+
+	# NOTE: ATTACH can't be done within a transaction
+	db.c.execute("ATTACH DATABASE ? AS shard", (shard_file,))
+
+	# NOTE: fighters replaced by OR REPLACE below fire delete triggers of FighterData only with recursive triggers,
+	# 		they keep names of the fighters in opponents of History
+	db.c.execute("PRAGMA recursive_triggers = ON")
+
+	try:
+		db.execute('BEGIN TRANSACTION')
+
+		# fighters of the shard, including the ones without general information
+		db.c.execute("""CREATE TEMP TABLE ShardIds (
+						id integer PRIMARY KEY
+						)""")
+
+		db.c.execute(f"""INSERT INTO ShardIds (id)
+						{' UNION '.join(f'SELECT id FROM shard.{table}' for table in ('Fighters',) + MERGED_TABLES)}""")
+
+		replaced = db.c.execute("SELECT COUNT(*) FROM main.Fighters WHERE id IN (SELECT id FROM ShardIds)").fetchone()[0]
+
+		for table in ('Fighters', 'UnresolvedOpponents') + MERGED_TABLES:
+			db.c.execute(f"DELETE FROM main.{table} WHERE id IN (SELECT id FROM ShardIds)")
+
+		# NOTE: OR REPLACE drops a fighter of an older run with the same url but another id
+		db.c.execute("""INSERT OR REPLACE INTO main.Fighters (id, name, age, url, height, weight, weight_class, reach, group_name)
+						SELECT id, name, age, url, height, weight, weight_class, reach, group_name
+						FROM shard.Fighters""")
+
+		for table in MERGED_TABLES:
+			# NOTE: view 'History' exposes rowid of HistoryData as a column, it's given by the insert
+			columns = [row[1] for row in db.c.execute(f"PRAGMA main.table_info({table})").fetchall() if row[1] != 'rowid']
+
+			# opponents are resolved again once all shards are merged
+			select = ['NULL' if column == 'opp_id' else column for column in columns]
+
+			db.c.execute(f"""INSERT INTO main.{table} ({', '.join(columns)})
+							SELECT {', '.join(select)}
+							FROM shard.{table}""")
+
+		merged = db.c.execute("SELECT COUNT(*) FROM ShardIds").fetchone()[0]
+
+		db.bump_table_versions()
+
+		db.c.execute("DROP TABLE ShardIds")
+
+		db.execute('COMMIT')
+	finally:
+		db.c.execute("PRAGMA recursive_triggers = OFF")
+		db.c.execute("DETACH DATABASE shard")
+
+	return merged, replaced
+
+def merge_shards(shard_files, db_file = 'ufc_history.db'):
+	""" merge shard databases into a new database 'db_file'
+	:param shard_files: list of shard database files, relative to the script directory unless absolute
+	:param db_file: merged database file name
+	:return: True if successful, otherwise False
+	"""
+
+	started = time.perf_counter()
+
+	dir_path = os.path.dirname(os.path.realpath(__file__))
+
+	shard_files = [os.path.join(dir_path, shard_file) for shard_file in shard_files]
+
+	for shard_file in shard_files:
+		if not os.path.isfile(shard_file):
+			print(f'Cannot find shard database {shard_file}')
+			return False
+
+	db = database.UFCHistoryDB(db_file, True)
+
+	try:
+		for shard_file in shard_files:
+			merged, replaced = merge_shard(db, shard_file)
+
+			print(f'Merged {merged} fighters from {shard_file}, replaced {replaced} already merged fighters')
+
+		db.execute('BEGIN TRANSACTION')
+		unresolved = db.resolve_history_opponents()
+		db.refresh_aggregates()
+		db.execute('COMMIT')
+	except Exception as e:
+		print(f'Error(Merge.merge_shards): {str(e)}')
+		db.close_connection()
+		return False
+
+	db.close_connection()
+
+	metrics.observe('stage_seconds', time.perf_counter() - started, stage='merge')
+
+	print(f'Merged {len(shard_files)} shards into {db_file} in {time.perf_counter() - started:.2f}s, {unresolved} opponents are unresolved')
+
+	return True
+
+if __name__ == '__main__':
+
+	# usage: python merge.py <shard_db> [<shard_db> ...]
+	if len(sys.argv) < 2:
+		print('python merge.py <shard_db> [<shard_db> ...]')
+		sys.exit()
+
+	merge_shards(sys.argv[1:])
@@ -0,0 +1,224 @@
+
+import time
+import json
+import threading
+from contextlib import contextmanager
+
+# metrics of the current process, shared by all threads
+# NOTE: worker processes have their own copy, their results have to be recorded by the parent
+
+# upper bounds of histogram buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+
+_lock = threading.Lock()
+
+_counters = {}
+
+_histograms = {}
+
+_started = time.time()
+
+class Histogram:
+	""" keeps count, sum, min, max and bucket counts of observed values
+	"""
+
+	def __init__(self, buckets = DEFAULT_BUCKETS):
+		""" constructor
+		:param buckets: sorted upper bounds of buckets
+		"""
+
+		self.buckets = buckets
+		self.bucket_counts = [0] * len(buckets)
+		self.count = 0
+		self.sum = 0.0
+		self.min = None
+		self.max = None
+
+	def observe(self, value):
+		self.count += 1
+		self.sum += value
+		self.min = value if self.min is None else min(self.min, value)
+		self.max = value if self.max is None else max(self.max, value)
+
+		for index, bound in enumerate(self.buckets):
+			if value <= bound:
+				self.bucket_counts[index] += 1
+				break
+
+	def to_dict(self):
+		return {
+			'count': self.count,
+			'sum': self.sum,
+			'min': self.min,
+			'max': self.max,
+			'mean': self.sum / self.count if self.count > 0 else None,
+			'buckets': dict(zip([str(bound) for bound in self.buckets], self.bucket_counts))
+		}
+
+def _key(name, labels):
+	return (name, tuple(sorted(labels.items())))
+
+def inc(name: str, value = 1, **labels):
+	""" increase counter 'name' by 'value'
+	:param name: metric name
+	:param value: amount to add
+	:param labels: optional labels, e.g. stage='parse'
+	:return:
+	"""
+
+	key = _key(name, labels)
+
+	with _lock:
+		_counters[key] = _counters.get(key, 0) + value
+
+def observe(name: str, value: float, **labels):
+	""" add 'value' to histogram 'name'
+	:param name: metric name
+	:param value: observed value
+	:param labels: optional labels
+	:return:
+	"""
+
+	key = _key(name, labels)
+
+	with _lock:
+		if key not in _histograms:
+			_histograms[key] = Histogram()
+		_histograms[key].observe(value)
+
+@contextmanager
+def timed(name: str, **labels):
+	""" measure time spent in the block and add it to histogram 'name'
+		usage: with metrics.timed('http_request_seconds', page='stats'): ...
+	:param name: metric name
+	:param labels: optional labels
+	"""
+
+	start = time.perf_counter()
+
+	try:
+		yield
+	finally:
+		observe(name, time.perf_counter() - start, **labels)
+
+def reset():
+	""" drop all collected metrics
+	"""
+
+	global _started
+
+	with _lock:
+		_counters.clear()
+		_histograms.clear()
+		_started = time.time()
+
+def _label_text(labels):
+	return ','.join(f'{key}={value}' for key, value in labels)
+
+def snapshot() -> dict:
+	""" returns all collected metrics as a json serializable dictionary
+	:return: dictionary of counters and histograms
+	"""
+
+	with _lock:
+		counters = {}
+		for (name, labels), value in sorted(_counters.items()):
+			counters.setdefault(name, {})[_label_text(labels)] = value
+
+		histograms = {}
+		for (name, labels), histogram in sorted(_histograms.items(), key = lambda item: item[0]):
+			histograms.setdefault(name, {})[_label_text(labels)] = histogram.to_dict()
+
+	return {
+		'started': _started,
+		'elapsed': time.time() - _started,
+		'counters': counters,
+		'histograms': histograms
+	}
+
+def write_report(file_name = 'run_report.json'):
+	""" write collected metrics into a json file
+	:param file_name: report file name
+	:return: True if successful, otherwise False
+	"""
+
+	try:
+		with open(file_name, 'w') as outfile:
+			json.dump(snapshot(), outfile, indent = 2)
+	except Exception as e:
+		print(f'Failed to write metrics report {file_name}. {str(e)}')
+		return False
+
+	print(f'Metrics report is written to {file_name}')
+	return True
+
+def _prometheus_labels(labels, extra = ()):
+	labels = tuple(labels) + tuple(extra)
+
+	if len(labels) == 0:
+		return ''
+
+	return '{' + ','.join(f'{key}="{value}"' for key, value in labels) + '}'
+
+def prometheus_text() -> str:
+	""" returns collected metrics in prometheus text exposition format
+	:return: text
+	"""
+
+	lines = []
+
+	with _lock:
+		for name in sorted(set(key[0] for key in _counters)):
+			lines.append(f'# TYPE {name} counter')
+			for (name_, labels), value in sorted(_counters.items()):
+				if name_ == name:
+					lines.append(f'{name}{_prometheus_labels(labels)} {value}')
+
+		for name in sorted(set(key[0] for key in _histograms)):
+			lines.append(f'# TYPE {name} histogram')
+			for (name_, labels), histogram in sorted(_histograms.items(), key = lambda item: item[0]):
+				if name_ != name:
+					continue
+				cumulative = 0
+				for bound, count in zip(histogram.buckets, histogram.bucket_counts):
+					cumulative += count
+					lines.append(f'{name}_bucket{_prometheus_labels(labels, [("le", bound)])} {cumulative}')
+				lines.append(f'{name}_bucket{_prometheus_labels(labels, [("le", "+Inf")])} {histogram.count}')
+				lines.append(f'{name}_sum{_prometheus_labels(labels)} {histogram.sum}')
+				lines.append(f'{name}_count{_prometheus_labels(labels)} {histogram.count}')
+
+	return '\n'.join(lines) + '\n'
+
+def start_http_server(port: int):
+	""" expose metrics in prometheus text format on localhost in a background thread
+	:param port: port to listen on
+	:return: HTTPServer instance
+	"""
+
+	# NOTE: http.server is imported only when metrics are served, it's slow to import
+	from http.server import HTTPServer
+	from http.server import BaseHTTPRequestHandler
+
+	class _PrometheusHandler(BaseHTTPRequestHandler):
+
+		def do_GET(self):
+			data = prometheus_text().encode('utf-8')
+
+			self.send_response(200)
+			self.send_header('Content-Type', 'text/plain; version=0.0.4')
+			self.send_header('Content-Length', str(len(data)))
+			self.end_headers()
+			self.wfile.write(data)
+
+		def log_message(self, format, *args):
+			# keep progress bars clean
+			pass
+
+	httpd = HTTPServer(('127.0.0.1', port), _PrometheusHandler)
+
+	thread_ = threading.Thread(target = httpd.serve_forever, daemon = True)
+	thread_.start()
+
+	print(f'Serving metrics on http://127.0.0.1:{port}/metrics')
+
+	return httpd
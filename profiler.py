@@ -0,0 +1,162 @@
+
+import os
+import io
+import cProfile
+import threading
+import tracemalloc
+
+# per-thread cpu profiling and per-stage memory snapshots of a run
+# NOTE: plain cProfile only sees the thread which enabled it, so every thread started
+# 		while profiling is enabled gets its own profiler and they are merged at the end
+
+_enabled = False
+
+_lock = threading.Lock()
+
+# finished profilers of all threads
+_profiles = []
+
+# list of tuples (label, tracemalloc snapshot) taken at stage boundaries
+_snapshots = []
+
+_main_profile = None
+
+_original_run = threading.Thread.run
+
+# output directory and number of entries in top-N reports
+_output_dir = 'profile'
+_top = 25
+
+def is_enabled() -> bool:
+	return _enabled
+
+def _profiled_run(self):
+	""" replacement of threading.Thread.run which profiles the thread
+	"""
+
+	profile = cProfile.Profile()
+
+	try:
+		profile.enable()
+	except ValueError:
+		# another profiler is already active in this thread(or globally on newer pythons)
+		_original_run(self)
+		return
+
+	try:
+		_original_run(self)
+	finally:
+		profile.disable()
+
+		with _lock:
+			_profiles.append(profile)
+
+def enable(output_dir = 'profile', top = 25, frames = 10):
+	""" start profiling current thread and all threads started from now on, start tracing memory allocations
+	:param output_dir: directory to write reports into
+	:param top: number of entries in top-N reports
+	:param frames: number of frames tracemalloc keeps per allocation
+	:return:
+	"""
+
+	global _enabled, _main_profile, _output_dir, _top
+
+	if _enabled:
+		return
+
+	_enabled = True
+	_output_dir = output_dir
+	_top = top
+
+	threading.Thread.run = _profiled_run
+
+	tracemalloc.start(frames)
+
+	_main_profile = cProfile.Profile()
+	_main_profile.enable()
+
+def snapshot(label: str):
+	""" take a memory snapshot at a stage boundary, does nothing unless profiling is enabled
+	:param label: name of the stage boundary, e.g. 'info_list_filled'
+	:return:
+	"""
+
+	if not _enabled:
+		return
+
+	snap = tracemalloc.take_snapshot()
+
+	with _lock:
+		_snapshots.append((label, snap))
+
+def finish():
+	""" stop profiling, merge profiles of all threads into one pstats file and write top-N reports
+	:return: path to merged pstats file or None if profiling is not enabled
+	"""
+
+	global _enabled
+
+	if not _enabled:
+		return None
+
+	# NOTE: pstats is imported only when reports are written, it's slow to import
+	import pstats
+
+	_main_profile.disable()
+
+	threading.Thread.run = _original_run
+
+	snapshot('finish')
+
+	tracemalloc.stop()
+
+	_enabled = False
+
+	if not os.path.exists(_output_dir):
+		os.makedirs(_output_dir)
+
+	# merge profiles of all threads
+	with _lock:
+		profiles = [_main_profile] + _profiles
+
+	stats = pstats.Stats(profiles[0])
+	for profile in profiles[1:]:
+		stats.add(profile)
+
+	stats_path = os.path.join(_output_dir, 'profile.pstats')
+	stats.dump_stats(stats_path)
+
+	# top-N hot functions by own time and by cumulative time
+	stream = io.StringIO()
+	stats = pstats.Stats(stats_path, stream = stream)
+	stream.write(f'Merged profile of {len(profiles)} threads\n')
+	stats.sort_stats('tottime').print_stats(_top)
+	stats.sort_stats('cumulative').print_stats(_top)
+
+	with open(os.path.join(_output_dir, 'hot_functions.txt'), 'w') as outfile:
+		outfile.write(stream.getvalue())
+
+	# top-N allocation sites per stage and growth since previous stage
+	lines = []
+	previous = None
+	for label, snap in _snapshots:
+		total = sum(stat.size for stat in snap.statistics('filename'))
+		lines.append(f'=== {label}: {total / 1024 / 1024:.1f} MiB traced ===')
+		for stat in snap.statistics('lineno')[:_top]:
+			lines.append(str(stat))
+
+		if previous is not None:
+			lines.append(f'--- growth since {previous[0]} ---')
+			for stat in snap.compare_to(previous[1], 'lineno')[:_top]:
+				lines.append(str(stat))
+
+		lines.append('')
+		previous = (label, snap)
+
+	with open(os.path.join(_output_dir, 'allocations.txt'), 'w') as outfile:
+		outfile.write('\n'.join(lines))
+
+	print(f'Profile of {len(profiles)} threads is written to {stats_path}')
+	print(f'Top {_top} reports are written to {os.path.join(_output_dir, "hot_functions.txt")} and {os.path.join(_output_dir, "allocations.txt")}')
+
+	return stats_path
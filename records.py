@@ -0,0 +1,179 @@
+
+import sys
+
+# compact record types for scraped data
+# NOTE: records keep dictionary style access(record['DATE'], 'opp_url' in record) so that
+# 		database insert methods work with both records and plain dictionaries
+
+def intern(value):
+	""" returns interned string so that repeated values(weight class, decision, event, ...) share one object
+	:param value: any value
+	:return: interned string or value itself if it's not a string
+	"""
+
+	return sys.intern(value) if isinstance(value, str) else value
+
+class Record:
+	""" base class of slotted records
+	"""
+
+	__slots__ = ()
+
+	# maps dictionary style keys to attribute names
+	key_map = {}
+
+	def __getitem__(self, key):
+		if key not in self.key_map:
+			raise KeyError(key)
+		return getattr(self, self.key_map[key])
+
+	def __setitem__(self, key, value):
+		if key not in self.key_map:
+			raise KeyError(key)
+		setattr(self, self.key_map[key], intern(value))
+
+	def __contains__(self, key):
+		# missing values behave like missing keys of a dictionary
+		return key in self.key_map and getattr(self, self.key_map[key]) is not None
+
+	def __len__(self):
+		return sum(1 for key in self.key_map if key in self)
+
+	def get(self, key, default = None):
+		return self[key] if key in self else default
+
+	def to_dict(self) -> dict:
+		return {key: self[key] for key in self.key_map if key in self}
+
+	@classmethod
+	def from_dict(cls, data: dict):
+		""" returns a record from a dictionary keyed like key_map, unknown keys are ignored
+		:param data: source dictionary
+		:return: record
+		"""
+
+		return cls(**{cls.key_map[key]: value for key, value in data.items() if key in cls.key_map})
+
+	def __repr__(self):
+		return f'{type(self).__name__}({self.to_dict()})'
+
+class FighterInfo(Record):
+	""" general information of a fighter
+	"""
+
+	__slots__ = ('name', 'age', 'reach', 'weight_class', 'height', 'weight', 'group_name', 'url')
+
+	key_map = {name: name for name in __slots__}
+
+	def __init__(self, name = None, age = None, reach = None, weight_class = None, height = None, weight = None, group_name = None, url = None):
+		self.name = intern(name)
+		self.age = age
+		self.reach = intern(reach)
+		self.weight_class = intern(weight_class)
+		self.height = intern(height)
+		self.weight = intern(weight)
+		self.group_name = intern(group_name)
+		self.url = url
+
+class HistoryRow(Record):
+	""" a single match on fight history page
+	"""
+
+	__slots__ = ('date', 'event', 'opponent', 'opp_url', 'result', 'decision', 'rnd', 'time')
+
+	key_map = {
+		'DATE': 'date',
+		'EVENT': 'event',
+		'OPPONENT': 'opponent',
+		'opp_url': 'opp_url',
+		'RESULT': 'result',
+		'DECISION': 'decision',
+		'RND': 'rnd',
+		'TIME': 'time'
+	}
+
+	def __init__(self, date = None, event = None, opponent = None, opp_url = None, result = None, decision = None, rnd = None, time = None):
+		self.date = intern(date)
+		self.event = intern(event)
+		self.opponent = intern(opponent)
+		self.opp_url = intern(opp_url)
+		self.result = intern(result)
+		self.decision = intern(decision)
+		self.rnd = intern(rnd)
+		self.time = intern(time)
+
+# shared column maps of statistics tables, keyed by tuple of header labels
+_column_maps = {}
+
+def column_map(header_columns) -> dict:
+	""" returns a shared dictionary of header label -> index for given header
+		all rows of tables with the same header share one dictionary
+	:param header_columns: list of header labels
+	:return: dictionary of label and column index
+	"""
+
+	key = tuple(header_columns)
+
+	if key not in _column_maps:
+		_column_maps[key] = {intern(label): index for index, label in enumerate(key)}
+
+	return _column_maps[key]
+
+class StatRow(Record):
+	""" a single row of standing, clinch or ground statistics
+		columns follow the header of the table, so it works even if the columns are changed in the future
+	"""
+
+	__slots__ = ('columns', 'values', 'opp_url')
+
+	def __init__(self, columns: dict, values, opp_url = None):
+		""" constructor
+		:param columns: shared dictionary of header label -> index, see column_map
+		:param values: values in header order
+		:param opp_url: profile url of the opponent
+		"""
+
+		self.columns = columns
+		self.values = tuple(intern(value) for value in values)
+		self.opp_url = intern(opp_url)
+
+	@property
+	def key_map(self):
+		return self.columns
+
+	@classmethod
+	def from_row(cls, header_columns, data: dict):
+		""" returns a record from a dictionary of a parsed table row
+		:param header_columns: list of header labels of the table
+		:param data: dictionary keyed by header labels, optionally with 'opp_url'
+		:return: record
+		"""
+
+		return cls(column_map(header_columns), [data.get(label) for label in header_columns], data.get('opp_url'))
+
+	def __getitem__(self, key):
+		if key == 'opp_url':
+			return self.opp_url
+		return self.values[self.columns[key]]
+
+	def __setitem__(self, key, value):
+		if key == 'opp_url':
+			self.opp_url = value
+			return
+		values = list(self.values)
+		values[self.columns[key]] = intern(value)
+		self.values = tuple(values)
+
+	def __contains__(self, key):
+		if key == 'opp_url':
+			return self.opp_url is not None
+		return key in self.columns
+
+	def __len__(self):
+		return len(self.values) + (1 if self.opp_url is not None else 0)
+
+	def to_dict(self) -> dict:
+		result = {label: self.values[index] for label, index in self.columns.items()}
+		if self.opp_url is not None:
+			result['opp_url'] = self.opp_url
+		return result
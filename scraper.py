@@ -0,0 +1,723 @@
+import os
+import time
+import hashlib
+import requests
+import string
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
+from concurrent.futures import wait
+from concurrent.futures import FIRST_COMPLETED
+import progressbar
+from bs4 import BeautifulSoup
+from datetime import datetime as DT
+
+import database
+import jobs
+from archive import PageArchive
+import metrics
+import records
+
+# scraping of fighter pages on espn.com
+# NOTE: this is the only module which needs requests and bs4, main.py imports it only for scraping commands
+
+def list_to_string(list_: list, delimiter: str) -> str:
+	""" returns a string from given list joined with given delimiter
+	:param list_: source list
+	:param delimiter: delimiter which goes between strings to combine them into a string
+	:return: a string which is combined with all strings in the list by delimiter
+	"""
+
+	return delimiter.join(str(element) for element in list_)
+
+def get_page_url(url: str, page_name: str) -> str:
+	""" this function retrieve url of fighter's stat page from profile url.
+	:param url: profile url
+	:param page_name: string to represent page name
+	:return: url of desired page
+	"""
+	
+	prefix = url.split('/')[:5]
+
+	suffix = url.split('/')[5:]
+
+	# no more work if prefix or suffix is empty
+	if prefix is None or suffix is None:
+		return None
+	# get prefix string from prefix list joined with delimiter
+	prefix_str = list_to_string(prefix, '/')
+
+	# get suffix string from suffix list joined with delimiter
+	suffix_str = list_to_string(suffix, '/')
+
+	return  prefix_str + '/' + page_name + '/' + suffix_str
+
+def get_fighter_url_list_startwith(start_ch: str) -> list:
+	""" returns a list of urls
+		urls of all fighters whose name start with start_ch
+	:param start_ch: a character which is at the very first of names
+	:return: list of fighters whose names starts with 'start_ch'
+	"""
+
+	with metrics.timed('http_request_seconds', page='search'):
+		source = requests.get(f'http://www.espn.com/mma/fighters?search={start_ch}').text
+
+	with metrics.timed('parse_seconds', page='search'):
+		soup = BeautifulSoup(source, 'lxml')
+
+	# get table content from 'table' tag
+	tbl_content = soup.find('table')
+
+	# create empty list
+	fighter_list = []
+
+	# find all trs from table content, filtered by classnames 'oddrow' and 'evenrow'
+	for tr in tbl_content.find_all('tr', class_=['oddrow', 'evenrow']):
+		# get url from anchor tag with property 'href'
+		sub_link = tr.a['href']
+
+		# attach main site url
+		link = f'http://www.espn.com{sub_link}'
+
+		# append the link to the list
+		fighter_list.append(link)
+
+	return fighter_list
+
+def get_shard(url: str, count: int) -> int:
+	""" returns shard index of a fighter url, stable across processes and machines
+	:param url: profile url
+	:param count: total number of shards
+	:return: shard index starting from 1
+	"""
+
+	key = database.UFCHistoryDB.normalize_url(url) or ''
+
+	return int(hashlib.md5(key.encode('utf-8')).hexdigest(), 16) % count + 1
+
+def get_all_fighter_urls() -> list:
+	""" returns a list of urls of all fighters, searched by every alphabet
+	:return: list of fighter urls
+	"""
+
+	search_keys = list(string.ascii_lowercase)
+
+	print("Fetching urls of fighters...")
+
+	# list of urls of fighters
+	all_url_list = []
+
+	url_started = time.perf_counter()
+
+	# this progress bar is used to show the progress of fetching urls of all fighters
+	url_bar = progressbar.ProgressBar(maxval=len(search_keys), \
+		widgets=[progressbar.Bar('=', '[', ']'), ' ', progressbar.Percentage(), ' | ', progressbar.Counter(), '/', str(len(search_keys))])
+	url_bar.start()
+
+	try:
+		for index, key in enumerate(search_keys):
+
+			all_url_list += get_fighter_url_list_startwith(key)
+			url_bar.update(index + 1)
+
+	except Exception as e:
+
+		print(f'Failed to fetch urls due to error: {str(e)}')
+		url_bar.finish()
+		exit()
+
+	url_bar.finish()
+
+	# a fighter can be listed under several letters, keep the first one
+	fighter_ids = set()
+	unique_url_list = []
+
+	for url in all_url_list:
+		id_ = database.UFCHistoryDB.get_fighter_id(url)
+
+		if id_ not in fighter_ids:
+			fighter_ids.add(id_)
+			unique_url_list.append(url)
+
+	all_url_list = unique_url_list
+
+	metrics.observe('stage_seconds', time.perf_counter() - url_started, stage='url_discovery')
+	metrics.inc('fighter_urls_total', len(all_url_list))
+
+	print(f'Fetched {len(all_url_list)} urls in total!')
+
+	return all_url_list
+
+def get_general_info(soup) -> records.FighterInfo:
+	""" returns fighter's general info
+	:param soup: soup object
+	:return: FighterInfo record, empty if there's no general info on the page
+	"""
+	
+	# initialize info dictionary
+	info_list = {}
+
+	# get general info ul
+	general_info = soup.find('ul', class_='general-info')
+
+	if general_info is None:
+		return records.FighterInfo()
+
+	# print(general_info)
+
+	# initialize variables
+	name = None
+	age = None
+	weight_class = None
+	height = None
+	weight = None
+	reach = None
+	group_name = None
+
+	try:
+		name = soup.find('div', class_='mod-content').find('h1').text
+	except Exception as e:
+		pass
+
+	if name is None:
+		try:
+			name = soup.find('div', class_='player-bio').find('h1').text
+		except Exception as e:
+			pass 
+
+	try:
+		tmp = general_info.find('li', class_="first last").text
+		if tmp.find('\"') != -1 or tmp.find("lbs") != -1:
+			if tmp.find(",") != -1:
+				height = tmp.split(",")[0]
+				weight = tmp.split(",")[1].strip()
+			else:
+				if tmp.find("lbs") != -1:
+					weight = tmp
+				else:
+					height = tmp
+		else:
+			weight_class = tmp
+	except Exception as e:
+		pass
+
+	try:
+		item = general_info.find('li', class_='first')
+		if len(item['class']) == 1:
+			weight_class = item.text
+	except Exception as e:
+		pass
+
+	try:
+		tmp = general_info.find(class_=None).text
+		if tmp.find('\"') != -1:
+			if tmp.find("lbs") != -1 and tmp.find(",") != -1:
+				height = tmp.split(',')[0]
+				weight = tmp.split(',')[1].strip()
+			else:
+				height = tmp
+		elif tmp.find("lbs") != -1:
+			weight = tmp
+	except Exception as e:
+		pass
+
+	try:
+		item = general_info.find('li', class_='last')
+		if len(item['class']) == 1:
+			group_name = item.text
+	except Exception as e:
+		pass
+
+	try:
+		meta_data = soup.find('ul', class_='player-metadata')
+		# print(meta_data)
+		for li in meta_data.find_all('li'):
+			try:
+				span = li.find('span', text='Birth Date')
+				try:
+					age = (int)(li.text.split(":")[1].split(")")[0].strip())
+				except Exception as e:
+					pass
+			except Exception as e:
+				pass
+
+			try:
+				span = li.find('span', text='Reach')
+				reach = li.text.split('Reach')[1].strip()
+			except Exception as e:
+				pass
+
+	except Exception as e:
+		pass
+
+	info_list['name'] = name.strip()
+	info_list['age'] = age
+	info_list['reach'] = reach
+	info_list['weight_class'] = weight_class
+	info_list['height'] = height
+	info_list['weight'] = weight
+	info_list['group_name'] = group_name
+
+	return records.FighterInfo.from_dict(info_list)
+
+def get_history_info(soup) -> list:
+	""" returns a list of records
+		each record contains match _date, event, opponent, result, decision, rounds and time
+	:param soup: soup object
+	:return: list of HistoryRow records, each record contains a single match info
+	"""
+
+	# get fight history information from the table
+	#
+	# !NOTE: ensure there's only one table body on the history page
+
+	tbody = soup.find('table', class_='tablehead mod-player-stats')
+
+	if tbody is None:
+		# print("Cannot find table on the page")
+		return []
+
+	header_list = []
+	header_columns = tbody.find('tr', class_='colhead').find_all('td')
+
+	history_list = []
+
+	for row in tbody.find_all('tr', class_=['oddrow', 'evenrow']):
+		cells = row.find_all('td')
+
+		if len(cells) != len(header_columns):
+			# print("Warning(History): Column counts mismatch between header and rows!")
+			continue
+
+		if len(cells) == 0 or len(cells) == 1:
+			# print("No item in the row!")
+			continue
+		else:
+			index = 0
+			history = {}
+			for cell in cells:
+				if header_columns[index].text == 'DATE':
+					history[header_columns[index].text] = DT.strptime(cell.text, '%b %d, %Y').strftime('%Y-%m-%d')
+				else:
+					history[header_columns[index].text] = cell.text
+				if cell.find('a') != None:
+					history['opp_url'] = cell.find('a')['href']
+				index += 1
+
+			if len(history) > 0:
+				history_list.append(records.HistoryRow.from_dict(history))
+
+	return history_list
+
+def get_statistics(soup):
+	""" get standing statistics on stats page and returns a list of records
+	:param soup: soup object
+	:return: three lists of StatRow records - standing statistics, clinch statistics and ground statistics
+	"""
+	standing_list = []
+	clinch_list = []
+	ground_list = []
+
+	for table in soup.find_all('table', class_='tablehead'):
+		title = table.find('tr', class_='stathead').find('td').text
+
+		if title == "STANDING STATISTICS":
+			# get header labels to determine column counts and labels
+			# this will allow you to scrap data without revising code 
+			# even if the columns are changed in the future
+			header_columns = []
+			header = table.find('tr', class_='colhead').find_all('td')
+
+			for column in header:
+				header_columns.append(column.text.replace("%", "PERCENT"))
+			
+			# get statistics
+			for row in table.find_all('tr', class_=['oddrow', 'evenrow']):# get rows of the table
+				if len(row) == 0 or len(row) == 1:
+					# print("No results for this statistics!")
+					continue
+
+				if len(row) != len(header_columns):
+					# print("Warning: Columns mismatch!")
+					continue
+
+				# initialize variables repeatedly used
+				index = 0
+				drow = {}
+
+				for cell in row.find_all('td'): # iterate through cells in the row
+					if header_columns[index] == 'DATE':
+						drow[header_columns[index]] = DT.strptime(cell.text, '%b %d, %Y').strftime('%Y-%m-%d')
+					else:
+						drow[header_columns[index]] = cell.text.replace("N/A", "") # add value to the dictionary
+
+					if cell.find('a') != None:
+						drow['opp_url'] = cell.find('a')['href']
+					index += 1
+
+				standing_list.append(records.StatRow.from_row(header_columns, drow)) # add row to the list
+			# print(standing_list)
+			# print()
+
+		elif title == "CLINCH STATISTICS":
+			# get header labels to determine column counts and labels
+			# this will allow you to scrap data without revising code 
+			# even if the columns are changed in the future
+			header_columns = []
+			header = table.find('tr', class_='colhead').find_all('td')
+
+			for column in header:
+				header_columns.append(column.text.replace("%", "PERCENT"))
+
+			# get statistics
+			for row in table.find_all('tr', class_=['oddrow', 'evenrow']):# get rows of the table
+				if len(row) == 0 or len(row) == 1:
+					# print("No results for this statistics!")
+					continue
+
+				if len(row) != len(header_columns):
+					# print("Warning: Columns mismatch!")
+					continue
+
+				# initialize variables repeatedly used
+				index = 0
+				drow = {}
+
+				for cell in row.find_all('td'): # iterate through cells in the row
+					if header_columns[index] == 'DATE':
+						drow[header_columns[index]] = DT.strptime(cell.text, '%b %d, %Y').strftime('%Y-%m-%d')
+					else:
+						drow[header_columns[index]] = cell.text.replace("N/A", "") # add value to the dictionary
+						
+					if cell.find('a') != None:
+						drow['opp_url'] = cell.find('a')['href']
+					index += 1
+
+				clinch_list.append(records.StatRow.from_row(header_columns, drow)) # add row to the list
+			# print(clinch_list)
+			# print()
+		elif title == "GROUND STATISTICS":
+			# get header labels to determine column counts and labels
+			# this will allow you to scrap data without revising code 
+			# even if the columns are changed in the future
+			header_columns = []
+			header = table.find('tr', class_='colhead').find_all('td')
+
+			for column in header:
+				header_columns.append(column.text.replace("%", "PERCENT"))
+
+			# get statistics
+			for row in table.find_all('tr', class_=['oddrow', 'evenrow']):# get rows of the table
+				if len(row) == 0 or len(row) == 1:
+					# print("No results for this statistics!")
+					continue
+
+				if len(row) != len(header_columns):
+					# print("Warning: Columns mismatch!")
+					continue
+
+				# initialize variables repeatedly used
+				index = 0
+				drow = {}
+
+				for cell in row.find_all('td'): # iterate through cells in the row
+					if header_columns[index] == 'DATE':
+						drow[header_columns[index]] = DT.strptime(cell.text, '%b %d, %Y').strftime('%Y-%m-%d')
+					else:
+						drow[header_columns[index]] = cell.text.replace("N/A", "") # add value to the dictionary
+						
+					if cell.find('a') != None:
+						drow['opp_url'] = cell.find('a')['href']
+					index += 1
+
+				ground_list.append(records.StatRow.from_row(header_columns, drow)) # add row to the list
+			# print(ground_list)
+			# print()
+		else:
+			print("Unknown statistics! Skipping over.")
+			continue
+
+	return standing_list, clinch_list, ground_list
+
+
+def parse_history_page(source, furl):
+	""" parse history page of a fighter
+	:param source: content of the page
+	:param furl: profile url of the fighter
+	:return: tuple of general info and history
+	"""
+
+	with metrics.timed('parse_seconds', page='history'):
+		# get soup object
+		soup = BeautifulSoup(source, 'lxml')
+		# print(furl)
+
+		ginfo = get_general_info(soup)
+
+		if len(ginfo) == 0:
+			print(f'Cannot get general information from this url(F1): {furl}')
+			print()
+		
+		ginfo['url'] = furl
+
+		hinfo = get_history_info(soup)
+
+	return ginfo, hinfo
+
+def parse_stats_page(source):
+	""" parse stats page of a fighter
+	:param source: content of the page
+	:return: tuple of standing, clinch and ground statistics
+	"""
+
+	with metrics.timed('parse_seconds', page='stats'):
+		# get soup object
+		soup = BeautifulSoup(source, 'lxml')
+
+		ss, cs, gs = get_statistics(soup)
+		# hinfo, ss, cs, gs = None, None, None, None
+
+	return ss, cs, gs
+
+def fetch_fighter(id_, furl, archive = None):
+	""" send get requests for history and stats pages of a fighter and scrap data
+		this runs in a worker thread of the scraping pool, one call per fighter
+	:param id_: unique id of the fighter
+	:param furl: profile url of the fighter
+	:param archive: PageArchive to store fetched pages in, None: don't store
+	:return: tuple of id, general info, history, standing, clinch and ground statistics, None if failed
+	"""
+
+	try:
+		with metrics.timed('http_request_seconds', page='history'):
+			url = get_page_url(furl, 'history')
+			source = requests.get(url).text
+	except Exception as e:
+		print(f'Error(Scraper.request.get.history): {str(e)}')
+		metrics.inc('http_errors_total', page='history')
+		return None
+
+	if archive is not None:
+		archive.append(url, source, furl, id_, 'history')
+	
+	ginfo, hinfo = parse_history_page(source, furl)
+
+	try:
+		with metrics.timed('http_request_seconds', page='stats'):
+			url = get_page_url(furl, 'stats')
+			source = requests.get(url).text
+	except Exception as e:
+		print(f'Error((F1)Scraper.request.get.stats): {str(e)}')
+		metrics.inc('http_errors_total', page='stats')
+		return None
+
+	if archive is not None:
+		archive.append(url, source, furl, id_, 'stats')
+	
+	ss, cs, gs = parse_stats_page(source)
+
+	metrics.inc('fighters_fetched_total')
+	metrics.inc('matches_fetched_total', len(hinfo))
+
+	return (id_, ginfo, hinfo, ss, cs, gs)
+
+def reparse_fighter(item):
+	""" parse archived pages of a fighter
+		this runs in a worker process, so it must stay on module level
+	:param item: tuple of id, profile url, index entries of history and stats pages
+	:return: tuple of id, general info, history, standing, clinch and ground statistics
+	"""
+
+	id_, furl, history, stats = item
+
+	ginfo, hinfo = parse_history_page(PageArchive.read(history['file'], history['offset'], history['length']), furl)
+
+	ss, cs, gs = parse_stats_page(PageArchive.read(stats['file'], stats['offset'], stats['length']))
+
+	return (id_, ginfo, hinfo, ss, cs, gs)
+
+def reparse_archives(archive_files, processes = None) -> list:
+	""" parse the latest archived pages of all fighters again without network, on all cores
+	:param archive_files: list of archive file names, see PageArchive
+	:param processes: number of worker processes, None: cpu count
+	:return: list of fetched tuples(see fetch_fighter) sorted by id
+	"""
+
+	# latest pages over all archives
+	latest = {}
+
+	for archive_file in archive_files:
+		for key, entry in PageArchive(archive_file).latest().items():
+			if key not in latest or latest[key]['fetched'] <= entry['fetched']:
+				latest[key] = entry
+
+	# fighters whose both pages were fetched, others failed while scraping
+	# NOTE: ids are taken from urls again, archives of older runs have positional ids
+	items = [(database.UFCHistoryDB.get_fighter_id(furl), furl, entry, latest[(furl, 'stats')])
+				for (furl, page), entry in latest.items() if page == 'history' and (furl, 'stats') in latest]
+
+	items.sort(key=lambda item: item[0])
+
+	print(f'Parsing archived pages of {len(items)} fighters...')
+
+	started = time.perf_counter()
+
+	info_list = []
+
+	bar = progressbar.ProgressBar(maxval=len(items), \
+		widgets=[progressbar.Bar('=', '[', ']'), ' ', progressbar.Percentage(), ' | ', progressbar.Counter(), '/', str(len(items))])
+	bar.start()
+
+	with ProcessPoolExecutor(max_workers=processes) as pool:
+		for parsed_count, info in enumerate(pool.map(reparse_fighter, items, chunksize=16), 1):
+			info_list.append(info)
+			bar.update(parsed_count)
+
+	bar.finish()
+
+	# worker processes have their own metrics, so record the stage here
+	metrics.observe('stage_seconds', time.perf_counter() - started, stage='reparse')
+	metrics.inc('fighters_fetched_total', len(info_list))
+
+	return info_list
+
+def fetch_information(url_list, workers, archive = None):
+	""" scrap all fighters on url_list with a pool of worker threads
+		workers pull one fighter at a time from a shared queue, so a few slow pages
+		don't keep a whole chunk of fighters waiting behind them
+	:param url_list: list of fighter urls, id of a fighter is parsed from its url(see UFCHistoryDB.get_fighter_id)
+	:param workers: number of worker threads
+	:param archive: PageArchive to store fetched pages in, None: don't store
+	:return: list of fetched tuples(see fetch_fighter) sorted by id
+	"""
+
+	info_list = []
+
+	bar = progressbar.ProgressBar(maxval=len(url_list), \
+		widgets=[progressbar.Bar('=', '[', ']'), ' ', progressbar.Percentage(), ' | ', progressbar.Counter(), '/', str(len(url_list))])
+	bar.start()
+
+	pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scraper')
+
+	try:
+		futures = [pool.submit(fetch_fighter, database.UFCHistoryDB.get_fighter_id(furl), furl, archive) for furl in url_list]
+
+		# completion is tracked here in the main thread, so the counter needs no lock
+		for fetched_count, future in enumerate(as_completed(futures), 1):
+			try:
+				info = future.result()
+			except Exception as e:
+				print(f'Error(Scraper.fetch_fighter): {str(e)}')
+				info = None
+
+			if info is not None:
+				info_list.append(info)
+
+			bar.update(fetched_count)
+	finally:
+		# drop fighters which are not started yet on interrupt
+		pool.shutdown(wait=True, cancel_futures=True)
+
+	bar.finish()
+
+	info_list.sort(key=lambda info: info[0])
+
+	return info_list
+
+def fetch_jobs(jobs_file, worker, workers, archive = None):
+	""" pull fighters from a shared job queue until it's empty and write them into the worker's own database
+		any number of processes on any number of hosts can run this against the same jobs_file,
+		the first one fills the queue with urls of all fighters
+	:param jobs_file: shared job queue database file, see jobs.JobQueue
+	:param worker: worker name, None: host name and process id
+	:param workers: number of worker threads
+	:param archive: PageArchive to store fetched pages in, None: don't store
+	:return: worker database file name
+	"""
+
+	queue = jobs.JobQueue(jobs_file)
+
+	worker = worker or jobs.JobQueue.default_worker()
+
+	if queue.count() == 0:
+		print(f'Added {queue.add_urls(get_all_fighter_urls())} fighters into job queue {jobs_file}')
+
+	db_file = f'ufc_history.{worker}.db'
+
+	# keep fighters which are already written by a previous run of the same worker
+	# NOTE: batches are committed one by one, so the database has to survive a crash of the worker
+	db = database.UFCHistoryDB(db_file, not os.path.isfile(os.path.join(os.path.dirname(os.path.realpath(__file__)), db_file)), profile='safe', upgrade = True)
+
+	print(f"Worker {worker} is scraping with {workers} threads into {db_file}...")
+
+	scrape_started = time.perf_counter()
+
+	total_count = queue.count()
+
+	bar = progressbar.ProgressBar(maxval=total_count, \
+		widgets=[progressbar.Bar('=', '[', ']'), ' ', progressbar.Percentage(), ' | ', progressbar.Counter(), '/', str(total_count)])
+	bar.start()
+
+	pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scraper')
+
+	# futures of claimed jobs and their urls
+	pending = {}
+
+	# fetched fighters which are not written yet
+	info_list = []
+
+	fetched_count = 0
+
+	try:
+		while True:
+			# keep enough jobs in flight so that no thread waits on the queue
+			if len(pending) < workers:
+				for id_, furl in queue.claim(worker, workers * 2 - len(pending)):
+					pending[pool.submit(fetch_fighter, id_, furl, archive)] = furl
+
+			if len(pending) == 0:
+				break
+
+			done, not_done = wait(pending, return_when=FIRST_COMPLETED)
+
+			for future in done:
+				furl = pending.pop(future)
+
+				try:
+					info = future.result()
+				except Exception as e:
+					print(f'Error(Scraper.fetch_fighter): {str(e)}')
+					info = None
+
+				if info is None:
+					queue.fail(worker, furl, 'fetch failed')
+				else:
+					info_list.append(info)
+
+				fetched_count += 1
+				bar.update(min(fetched_count, total_count))
+
+			# write fetched fighters before their jobs are marked as done
+			if len(info_list) >= workers or len(pending) == 0:
+				db.execute('BEGIN TRANSACTION')
+				db.insert_fetched(info_list)
+				db.execute('COMMIT')
+
+				queue.complete(worker, [info[1]['url'] for info in info_list])
+
+				info_list = []
+	finally:
+		# drop jobs which are not started yet on interrupt, their leases expire and others take them over
+		pool.shutdown(wait=True, cancel_futures=True)
+
+	bar.finish()
+
+	metrics.observe('stage_seconds', time.perf_counter() - scrape_started, stage='scrape')
+
+	db.close_connection()
+
+	print(f'Job queue status: {queue.status()}')
+
+	queue.close()
+
+	return db_file
@@ -0,0 +1,121 @@
+
+import sys
+import json
+from http.server import HTTPServer
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import urlparse
+from urllib.parse import parse_qs
+from urllib.parse import unquote
+
+import database
+
+# thin local HTTP/JSON front end over the read-only query API of UFCHistoryDB
+#
+# 	GET /fighter/<id>
+# 	GET /fighter/<id>/history?page=0&page_size=50
+# 	GET /fight?id=<id>&date=<YYYY-MM-DD>&opp_url=<url>
+# 	GET /h2h/<id1>/<id2>?page=0&page_size=50
+# 	GET /search?name=<name>&page=0&page_size=50
+# 	GET /search?q=<full or partial name>&page=0&page_size=50
+# 	GET /fighter/<id>/career
+# 	GET /weight_class/<weight_class>
+# 	GET /weight_class/<weight_class>/<year>/decisions
+# 	GET /matchup/<id1>/<id2>?date=<YYYY-MM-DD>
+# 	GET /common/<id1>/<id2>
+
+class QueryHandler(BaseHTTPRequestHandler):
+	""" handles GET requests and answers them in json
+	"""
+
+	# shared read-only database instance, set before serving
+	db = None
+
+	def send_json(self, status, body):
+		""" send 'body' as json with given http status
+		:param status: http status code
+		:param body: json serializable object
+		:return:
+		"""
+
+		data = json.dumps(body).encode('utf-8')
+
+		self.send_response(status)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(data)))
+		self.end_headers()
+		self.wfile.write(data)
+
+	def do_GET(self):
+		url = urlparse(self.path)
+		parts = [part for part in url.path.split('/') if len(part) > 0]
+		params = {key: value[0] for key, value in parse_qs(url.query).items()}
+
+		page = params.get('page', 0)
+		page_size = params.get('page_size', 50)
+
+		try:
+			if len(parts) == 2 and parts[0] == 'fighter':
+				result = self.db.get_fighter(int(parts[1]))
+			elif len(parts) == 3 and parts[0] == 'fighter' and parts[2] == 'history':
+				result = self.db.get_fighter_history(int(parts[1]), page, page_size)
+			elif len(parts) == 3 and parts[0] == 'fighter' and parts[2] == 'career':
+				result = self.db.get_career_stats(int(parts[1]))
+			elif len(parts) == 2 and parts[0] == 'weight_class':
+				result = self.db.get_weight_class_stats(unquote(parts[1]))
+			elif len(parts) == 4 and parts[0] == 'weight_class' and parts[3] == 'decisions':
+				result = self.db.get_decision_stats(unquote(parts[1]), parts[2])
+			elif len(parts) == 1 and parts[0] == 'fight':
+				result = self.db.get_fight_stats(int(params['id']), params['date'], params['opp_url'])
+			elif len(parts) == 3 and parts[0] == 'h2h':
+				result = self.db.get_head_to_head(int(parts[1]), int(parts[2]), page, page_size)
+			elif len(parts) == 1 and parts[0] == 'search' and 'q' in params:
+				result = self.db.search_fighters(params['q'], page, page_size)
+			elif len(parts) == 1 and parts[0] == 'search':
+				result = self.db.find_fighters(params['name'], page, page_size)
+			elif len(parts) == 3 and parts[0] == 'matchup':
+				result = self.db.get_matchup(int(parts[1]), int(parts[2]), params['date'])
+			elif len(parts) == 3 and parts[0] == 'common':
+				result = self.db.get_common_opponents(int(parts[1]), int(parts[2]))
+			else:
+				self.send_json(404, {'error': 'unknown endpoint'})
+				return
+		except (KeyError, ValueError) as e:
+			self.send_json(400, {'error': f'bad request: {str(e)}'})
+			return
+		except Exception as e:
+			self.send_json(500, {'error': str(e)})
+			return
+
+		if result is None:
+			self.send_json(404, {'error': 'not found'})
+		else:
+			self.send_json(200, result)
+
+def serve(db_file = 'ufc_history.db', port = 8000):
+	""" serve query API on localhost until interrupted
+	:param db_file: database file name
+	:param port: port to listen on
+	:return:
+	"""
+
+	QueryHandler.db = database.UFCHistoryDB(db_file, read_only = True)
+
+	httpd = HTTPServer(('127.0.0.1', port), QueryHandler)
+
+	print(f'Serving {db_file} on http://127.0.0.1:{port}')
+
+	try:
+		httpd.serve_forever()
+	except KeyboardInterrupt:
+		pass
+
+	httpd.server_close()
+	QueryHandler.db.close_connection()
+
+if __name__ == '__main__':
+
+	# usage: python server.py [port] [db_file]
+	port = int(sys.argv[1]) if len(sys.argv) > 1 else 8000
+	db_file = sys.argv[2] if len(sys.argv) > 2 else 'ufc_history.db'
+
+	serve(db_file, port)
@@ -0,0 +1,336 @@
+
+import json
+import mmap
+import struct
+from array import array
+
+# file signature and layout version
+MAGIC = b'UFCSNAP1'
+
+# sentinel value for missing(None) cells of str columns
+# NOTE: int columns use the minimum value of their width, float columns use nan
+NULL_STR = 0xFFFFFFFF
+
+# array typecodes of each column type, all of them are fixed-width
+TYPECODES = {
+	'int8': 'b',
+	'int16': 'h',
+	'int32': 'i',
+	'int64': 'q',
+	'float': 'd',
+	'str': 'I'
+}
+
+# integer column types from the narrowest one
+INT_TYPES = ('int8', 'int16', 'int32', 'int64')
+
+# layout of a snapshot file
+#
+# 	MAGIC(8 bytes) | header length(uint32) | header(json) | padding | data section
+#
+# header describes the schema, every offset in the header is relative to the start of the data section
+# which is aligned to 8 bytes, so that each column can be memory-mapped and cast without copying
+#
+# 	int column: narrowest of int8/16/32/64 which fits the values, minimum value of the width for None
+# 	float column: float64 per row, nan for None
+# 	str column: uint32 index into the string table per row, NULL_STR for None
+# 	string table: uint64 offsets(count + 1) into utf-8 blob, each distinct string is stored only once
+
+def _align(size: int, alignment: int = 8) -> int:
+	return (size + alignment - 1) // alignment * alignment
+
+def null_int(type_: str) -> int:
+	""" returns the sentinel of missing values for an integer column type
+	:param type_: one of INT_TYPES
+	:return: minimum value of the width
+	"""
+
+	return -2 ** (struct.calcsize(TYPECODES[type_]) * 8 - 1)
+
+def _column_type(values) -> str:
+	""" returns the narrowest type which can hold all values of a column
+	:param values: list of values
+	:return: one of INT_TYPES, 'float' or 'str'
+	"""
+
+	is_float = False
+	low, high = 0, 0
+
+	for value in values:
+		if value is None:
+			continue
+		if isinstance(value, bool) or isinstance(value, str):
+			return 'str'
+		if isinstance(value, float):
+			is_float = True
+		elif isinstance(value, int):
+			low, high = min(low, value), max(high, value)
+		else:
+			return 'str'
+
+	if is_float:
+		return 'float'
+
+	for type_ in INT_TYPES:
+		# minimum value is reserved for None
+		if null_int(type_) < low and high <= -null_int(type_) - 1:
+			return type_
+
+	return 'str'
+
+def write_snapshot(rows, file_name = 'match_history_sum.snap'):
+	""" write given data(rows) to a binary snapshot file
+	:param rows: list of dictionaries
+	:param file_name: name of snapshot file
+	:return: True if successful, otherwise False
+	"""
+
+	rows = [row for row in rows if row is not None and len(row) > 0]
+
+	# collect column names in the order of first appearance
+	names = {}
+	for row in rows:
+		for key in row:
+			if key not in names:
+				names[key] = None
+	names = list(names)
+
+	strings = {} # intern map, string -> index in string table
+	columns = []
+	data = []
+	offset = 0
+
+	for name in names:
+		values = [row.get(name) for row in rows]
+		type_ = _column_type(values)
+
+		if type_ in INT_TYPES:
+			null = null_int(type_)
+			buf = array(TYPECODES[type_], (null if value is None else value for value in values))
+		elif type_ == 'float':
+			buf = array('d', (float('nan') if value is None else value for value in values))
+		else:
+			buf = array('I')
+			for value in values:
+				if value is None:
+					buf.append(NULL_STR)
+					continue
+				value = str(value)
+				if value not in strings:
+					strings[value] = len(strings)
+				buf.append(strings[value])
+
+		columns.append({'name': name, 'type': type_, 'offset': offset})
+		data.append(buf.tobytes())
+		offset = _align(offset + len(data[-1]))
+
+	# string table
+	blob = bytearray()
+	string_offsets = array('Q', [0])
+	for value in strings: # dictionary keeps insertion order, so it matches indices
+		blob += value.encode('utf-8')
+		string_offsets.append(len(blob))
+
+	header = {
+		'version': 1,
+		'row_count': len(rows),
+		'columns': columns,
+		'strings': {
+			'count': len(strings),
+			'offsets': offset,
+			'data': _align(offset + len(string_offsets) * 8)
+		}
+	}
+	data.append(string_offsets.tobytes())
+	data.append(bytes(blob))
+
+	header_bytes = json.dumps(header).encode('utf-8')
+	prefix = MAGIC + struct.pack('<I', len(header_bytes)) + header_bytes
+
+	try:
+		print('Writing data to snapshot file...')
+		with open(file_name, 'wb') as outfile:
+			outfile.write(prefix)
+			outfile.write(b'\0' * (_align(len(prefix)) - len(prefix)))
+			written = 0
+			for chunk in data:
+				outfile.write(chunk)
+				written += len(chunk)
+				outfile.write(b'\0' * (_align(written) - written))
+				written = _align(written)
+	except Exception as e:
+		print(f'Failed to write snapshot file {file_name}. {str(e)}')
+		return False
+
+	print(f'Writing data to snapshot file is done. File: {file_name}')
+	return True
+
+class SnapshotColumn:
+	""" lazy, read-only view of a single column in a snapshot
+		values are converted only when they are accessed
+	"""
+
+	def __init__(self, snapshot, name: str, type_: str, view):
+		""" constructor
+		:param snapshot: owner Snapshot instance
+		:param name: column name
+		:param type_: column type
+		:param view: memoryview over the raw column data
+		"""
+
+		self.snapshot = snapshot
+		self.name = name
+		self.type = type_
+		self.view = view
+
+		# sentinel of missing values
+		self.null = null_int(type_) if type_ in INT_TYPES else None
+
+	def __len__(self):
+		return len(self.view)
+
+	def _convert(self, value):
+		if self.null is not None:
+			return None if value == self.null else value
+		if self.type == 'float':
+			return None if value != value else value
+		return self.snapshot.string(value)
+
+	def __getitem__(self, index):
+		if isinstance(index, slice):
+			return [self._convert(value) for value in self.view[index]]
+		return self._convert(self.view[index])
+
+	def __iter__(self):
+		for value in self.view:
+			yield self._convert(value)
+
+	def raw(self):
+		""" returns the underlying memoryview without copying
+			str columns give indices into the string table
+		:return: memoryview
+		"""
+
+		return self.view
+
+class Snapshot:
+	""" memory-maps a snapshot file and gives lazy access to its columns and rows
+	"""
+
+	def __init__(self, file_name = 'match_history_sum.snap'):
+		""" constructor
+		:param file_name: name of snapshot file
+		"""
+
+		self.file_name = file_name
+
+		self.file = open(file_name, 'rb')
+		self.mm = mmap.mmap(self.file.fileno(), 0, access = mmap.ACCESS_READ)
+		self.buffer = memoryview(self.mm)
+
+		if bytes(self.buffer[:len(MAGIC)]) != MAGIC:
+			self.close()
+			raise ValueError(f'{file_name} is not a snapshot file')
+
+		header_size = struct.unpack_from('<I', self.buffer, len(MAGIC))[0]
+		header_start = len(MAGIC) + 4
+		self.header = json.loads(bytes(self.buffer[header_start:header_start + header_size]).decode('utf-8'))
+
+		self.row_count = self.header['row_count']
+
+		base = _align(header_start + header_size)
+
+		self.columns = {}
+		for column in self.header['columns']:
+			start = base + column['offset']
+			size = struct.calcsize(TYPECODES[column['type']]) * self.row_count
+			view = self.buffer[start:start + size].cast(TYPECODES[column['type']])
+			self.columns[column['name']] = SnapshotColumn(self, column['name'], column['type'], view)
+
+		strings = self.header['strings']
+		start = base + strings['offsets']
+		self.string_offsets = self.buffer[start:start + (strings['count'] + 1) * 8].cast('Q')
+		self.string_data = self.buffer[base + strings['data']:]
+
+	def __len__(self):
+		return self.row_count
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+	def names(self) -> list:
+		""" returns column names in stored order
+		:return: list of column names
+		"""
+
+		return [column['name'] for column in self.header['columns']]
+
+	def string(self, index: int):
+		""" returns string at 'index' of the string table
+		:param index: index in the string table
+		:return: decoded string, None for NULL_STR
+		"""
+
+		if index == NULL_STR:
+			return None
+
+		return str(self.string_data[self.string_offsets[index]:self.string_offsets[index + 1]], 'utf-8')
+
+	def column(self, name: str) -> SnapshotColumn:
+		return self.columns[name]
+
+	def row(self, index: int) -> dict:
+		""" returns a single row as a dictionary
+		:param index: row index
+		:return: dictionary of a row
+		"""
+
+		if index < 0:
+			index += self.row_count
+
+		if index < 0 or index >= self.row_count:
+			raise IndexError('snapshot row index out of range')
+
+		return {name: column[index] for name, column in self.columns.items()}
+
+	def rows(self, start = 0, stop = None):
+		""" yields rows within [start, stop) as dictionaries
+		:param start: first row index
+		:param stop: row index to stop at, None: to the end
+		:return: generator of dictionaries
+		"""
+
+		start, stop, step = slice(start, stop).indices(self.row_count)
+
+		for index in range(start, stop, step):
+			yield self.row(index)
+
+	def close(self):
+		""" release all views and close the file
+		"""
+
+		for column in getattr(self, 'columns', {}).values():
+			column.view.release()
+
+		for name in ('string_offsets', 'string_data', 'buffer'):
+			view = getattr(self, name, None)
+			if view is not None:
+				view.release()
+
+		self.mm.close()
+		self.file.close()
+
+def read_snapshot_file(file_name = 'match_history_sum.snap'):
+	""" open a snapshot file
+	:param file_name: name of snapshot file
+	:return: Snapshot instance or None in case of failure
+	"""
+
+	try:
+		return Snapshot(file_name)
+	except Exception as e: # NOTE: Check whether the retrieved data is None in caller of this method
+		print(f'Failed to read snapshot file {file_name}. {str(e)}')
+		return None